@@ -0,0 +1,277 @@
+# actuators.py
+# Timed, non-blocking control of watering valves and grow lights per zone.
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from database import (
+    add_actuator_run,
+    add_log,
+    finish_actuator_run,
+    get_running_owners,
+    interrupt_actuator_runs,
+)
+from timer_scheduler import TimerScheduler
+
+# Constants
+DEVICES = ("watering", "lighting")
+MAX_RUN_SECONDS = 4 * 3600  # Safety cap on a single timed run
+
+_shared = None  # The process-wide executor; see shared_executor()
+_shared_lock = threading.Lock()
+
+
+class ZoneBusyError(RuntimeError):
+    """
+    Raised when a zone's actuator is already running, in this or another
+    process.
+    """
+
+
+def process_owner():
+    """
+    Names this process as the owner of its actuator runs ("host-pid", the
+    same form as scheduler node names).
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def owner_is_alive(owner):
+    """
+    Returns True if owner names a running process on this host, False if
+    that process has exited, and None for owners on other hosts.
+    """
+    host, _, pid = owner.rpartition("-")
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, but belongs to another user
+    return True
+
+
+def simulated_driver(device, zone, state):
+    """
+    Stands in for the GPIO/relay driver: switches a device in a zone on or
+    off. Must return quickly; timing is handled by the executor.
+    """
+    print(f"{device.capitalize()} in {zone} switched {state}.")
+
+
+class ActuatorRun:
+    def __init__(self, run_id, device, zone, duration, started):
+        self.id = run_id
+        self.device = device
+        self.zone = zone
+        self.duration = duration
+        self.started = started
+        self.ends = started + duration if duration else None
+        self.status = "running"
+        self.job = None  # Timer job that ends the run
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "device": self.device,
+            "zone": self.zone,
+            "started": self.started,
+            "ends": self.ends,
+            "status": self.status,
+        }
+
+
+class ActuatorExecutor:
+    """
+    Runs actuator actions as timed start/stop operations. Starting switches
+    the device on and schedules the stop on a timer, so the caller never
+    waits for the run to finish. Zones run concurrently, but each (device,
+    zone) has at most one run at a time across all processes: a run is
+    claimed by its in-flight row in the actuator_runs table, which the
+    database allows once per zone. The rows name their owning process, so
+    a restarted process can finish or resume them.
+    """
+
+    def __init__(self, timer=None, driver=simulated_driver, clock=time.time, owner=None):
+        if timer is None:
+            timer = TimerScheduler()
+            timer.start()
+        self.timer = timer
+        self.driver = driver
+        self.clock = clock
+        self.owner = owner or process_owner()
+        self._lock = threading.Lock()
+        self._active = {}  # (device, zone) -> ActuatorRun
+
+    def start(self, device, zone, duration=None, replace=False):
+        """
+        Switches a device on in a zone, for duration seconds or until
+        stopped. If the zone is busy, raises ZoneBusyError unless replace
+        is set and the run is this executor's, in which case it is ended
+        first. A zone held by a process that has exited is taken over.
+        """
+        if device not in DEVICES:
+            raise ValueError(f"Invalid device: {device}")
+        if duration is not None and not 0 < duration <= MAX_RUN_SECONDS:
+            raise ValueError(f"duration must be between 0 and {MAX_RUN_SECONDS} seconds.")
+        key = (device, zone)
+        with self._lock:
+            current = self._active.get(key)
+            if current is not None:
+                if not replace:
+                    raise ZoneBusyError(f"{device.capitalize()} is already running in {zone}.")
+                self._finish(current, "replaced", switch_off=False)
+
+            started = self.clock()
+            run = ActuatorRun(None, device, zone, duration, started)
+            run.id = self._claim(run)
+            try:
+                self.driver(device, zone, "on")
+            except Exception:
+                finish_actuator_run(run.id, "failed", self.clock())
+                if current is not None:
+                    self.driver(device, zone, "off")
+                raise
+            self._active[key] = run
+            if duration:
+                run.job = self.timer.call_later(duration, self._complete, run, tag=f"actuator-{device}-{zone}")
+        length = f" for {duration / 60:g} minutes" if duration else ""
+        add_log(f"Started {device} in {zone}{length}.")
+        return run
+
+    def _claim(self, run):
+        """
+        Records a run as in flight and returns its ID. If another process
+        holds the zone, runs of exited processes are recovered once before
+        giving up with ZoneBusyError. Called with the lock held.
+        """
+        for attempt in range(2):
+            try:
+                return add_actuator_run(run.device, run.zone, "on", run.started, run.ends, self.owner)
+            except sqlite3.IntegrityError:
+                if attempt == 0:
+                    self.recover(resume=False)
+        raise ZoneBusyError(f"{run.device.capitalize()} is already running in {run.zone} in another process.")
+
+    def _complete(self, run):
+        with self._lock:
+            if self._active.get((run.device, run.zone)) is run:
+                self._finish(run, "completed")
+
+    def _finish(self, run, status, switch_off=True):
+        """
+        Ends a run. Called with the lock held.
+        """
+        del self._active[(run.device, run.zone)]
+        if run.job is not None:
+            self.timer.cancel(run.job)
+        if switch_off:
+            try:
+                self.driver(run.device, run.zone, "off")
+            except Exception as e:
+                print(f"Error switching off {run.device} in {run.zone}: {e}")
+        run.status = status
+        if run.id is not None:
+            finish_actuator_run(run.id, status, self.clock())
+        add_log(f"{status.capitalize()} {run.device} in {run.zone}.")
+
+    def stop(self, device, zone):
+        """
+        Switches a device off in a zone, cancelling its run. Returns True
+        if a run was in progress.
+        """
+        with self._lock:
+            run = self._active.get((device, zone))
+            if run is None:
+                self.driver(device, zone, "off")
+                return False
+            self._finish(run, "cancelled")
+            return True
+
+    def cancel(self, run_id):
+        """
+        Cancels an in-progress run by ID. Returns False if it is not running.
+        """
+        with self._lock:
+            for run in self._active.values():
+                if run.id == run_id:
+                    self._finish(run, "cancelled")
+                    return True
+        return False
+
+    def stop_all(self):
+        with self._lock:
+            for run in list(self._active.values()):
+                self._finish(run, "cancelled")
+
+    def active_runs(self):
+        with self._lock:
+            return [run.as_dict() for run in self._active.values()]
+
+    def recover(self, resume=True, owners=()):
+        """
+        Handles runs left in flight by processes that stopped: those of
+        exited processes on this host, unowned runs from older versions and
+        those of the given owners (e.g. scheduler nodes that died). Runs of
+        live processes, including this one, are left alone. The runs found
+        are marked interrupted and switched off, and with resume, timed runs
+        that had not yet ended are restarted here for their remaining time.
+        Returns the number of runs resumed.
+        """
+        stale = [
+            owner for owner in get_running_owners()
+            if owner != self.owner and (owner is None or owner in owners or owner_is_alive(owner) is False)
+        ]
+        if not stale:
+            return 0
+        now = self.clock()
+        resumed = 0
+        for _, device, zone, _, _, ends in interrupt_actuator_runs(now, stale):
+            if resume and ends is not None and ends > now:
+                try:
+                    self.start(device, zone, min(ends - now, MAX_RUN_SECONDS), replace=True)
+                    resumed += 1
+                    continue
+                except Exception as e:
+                    print(f"Error resuming {device} in {zone}: {e}")
+            try:
+                self.driver(device, zone, "off")
+            except Exception as e:
+                print(f"Error switching off {device} in {zone}: {e}")
+        return resumed
+
+
+def shared_executor(timer=None):
+    """
+    Returns this process's executor, creating it (on timer, if given) on
+    first use. Every part of a process (schedules, rules, bot commands)
+    goes through this one, so runs it replaces or stops are its own.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ActuatorExecutor(timer)
+        return _shared
+
+
+# Example usage
+if __name__ == "__main__":
+    from database import initialize_database
+
+    initialize_database()
+    executor = ActuatorExecutor()
+    executor.start("watering", "Plant1", 2)
+    executor.start("watering", "Plant2", 1)
+    executor.start("lighting", "Plant1")
+    try:
+        executor.start("watering", "Plant1", 5)
+    except ZoneBusyError as e:
+        print(e)
+    print(executor.active_runs())
+    time.sleep(2.5)
+    executor.stop("lighting", "Plant1")
+    print(executor.active_runs())
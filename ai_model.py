@@ -1,18 +1,44 @@
 # ai_model.py
 # Extended version: Includes simulation, visualization, and logging.
 
+import ast
 import os
 import random
+import re
 import time
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
+from numpy_inference import (
+    NumpyCNN,
+    NUMPY_MODEL_PATH,
+    COMPACT_NUMPY_MODEL_PATH,
+    export_from_checkpoint,
+    load_image,
+)
+from quantization import QuantizedCNN, QUANTIZED_MODEL_PATH
+import system_logging
 
 # Constants
 MODEL_PATH = "plant_ai_model.h5"
+COMPACT_MODEL_PATH = "plant_ai_model_compact.h5"
+# Inference backend: "float" (NumPy float32), "int8" (quantized NumPy)
+# or "compact" (lightweight architecture, NumPy float32)
+MODEL_BACKEND = "float"
+MODEL_BACKENDS = {
+    "float": (NumpyCNN, NUMPY_MODEL_PATH),
+    "int8": (QuantizedCNN, QUANTIZED_MODEL_PATH),
+    "compact": (NumpyCNN, COMPACT_NUMPY_MODEL_PATH),
+}
+# Keras checkpoints that exported NumPy models can be created from
+KERAS_CHECKPOINTS = {
+    NUMPY_MODEL_PATH: MODEL_PATH,
+    COMPACT_NUMPY_MODEL_PATH: COMPACT_MODEL_PATH,
+}
 LOG_FILE = "analysis_log.txt"
 CLASS_NAMES = ["Healthy", "Diseased", "Needs Water", "Low Light"]
 IMAGE_SIZE = (224, 224)
+LOG_LINE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - (.+?): (\{.*\})\s*$")
 
 # Simulated AI Model
 class SimulatedAIModel:
@@ -32,14 +58,46 @@ ai_model = None
 
 def log_results(image_path, analysis):
     """
-    Logs analysis results to a file.
+    Logs analysis results to a file. The write happens on the shared
+    logging thread; the file rotates by size.
     """
-    with open(LOG_FILE, "a") as log_file:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_file.write(f"{timestamp} - {image_path}: {analysis}\n")
+    logger = system_logging.get_logger("analysis", LOG_FILE, rotation="size")
+    logger.info(f"{image_path}: {analysis}", extra={"fields": {"image_path": image_path, "analysis": analysis}})
     print(f"Results logged to {LOG_FILE}")
 
 
+def read_analysis_log(log_file=LOG_FILE):
+    """
+    Parses the analysis log written by log_results(), including rotated
+    backups (log_file.1, log_file.2, ...), oldest first.
+    Returns a list of (timestamp, image_path, analysis) tuples. Results
+    this process has logged but not yet written are flushed first.
+    """
+    system_logging.flush()
+    backups = [f"{log_file}.{i}" for i in range(system_logging.LOG_BACKUP_COUNT, 0, -1)]
+    entries = []
+    for path in backups + [log_file]:
+        if os.path.exists(path):
+            entries.extend(_parse_analysis_log(path))
+    return entries
+
+
+def _parse_analysis_log(path):
+    entries = []
+    with open(path, "r") as f:
+        for line in f:
+            match = LOG_LINE_PATTERN.match(line)
+            if not match:
+                continue
+            try:
+                analysis = ast.literal_eval(match.group(3))
+            except (ValueError, SyntaxError):
+                continue
+            timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S")
+            entries.append((timestamp, match.group(2), analysis))
+    return entries
+
+
 def visualize_results(analysis):
     """
     Generates a bar chart for the AI analysis results.
@@ -56,36 +114,62 @@ def visualize_results(analysis):
     plt.show()
 
 
-def load_ai_model():
+def load_ai_model(backend=None):
+    """
+    Loads the NumPy inference model for the selected backend, exporting it
+    from its Keras checkpoint on first use. Falls back to the simulated
+    model if no exported model exists.
+    """
     global ai_model
-    print(f"Loading AI model from {MODEL_PATH}...")
-    time.sleep(2)
-    if os.path.exists(MODEL_PATH):
+    backend = backend or MODEL_BACKEND
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend: {backend}")
+    model_class, model_path = MODEL_BACKENDS[backend]
+
+    checkpoint = KERAS_CHECKPOINTS.get(model_path)
+    if checkpoint and not os.path.exists(model_path) and os.path.exists(checkpoint):
+        print(f"Exporting {checkpoint} to {model_path}...")
+        try:
+            export_from_checkpoint(checkpoint, model_path)
+        except ImportError:
+            print("TensorFlow is not installed; cannot export the Keras checkpoint.")
+
+    if os.path.exists(model_path):
+        print(f"Loading {backend} AI model from {model_path}...")
+        ai_model = model_class.load(model_path)
         print("AI model loaded successfully.")
     else:
         print("Model not found. Using simulated model.")
+        time.sleep(2)
         ai_model = SimulatedAIModel()
 
 
 def preprocess_image(image_path):
+    """
+    Loads an image as a float32 (H, W, 3) array scaled to [0, 1], at the
+    loaded model's input size (IMAGE_SIZE if it does not declare one).
+    """
     print(f"Preprocessing image at {image_path}...")
-    time.sleep(1)
-    image_array = np.random.rand(*IMAGE_SIZE, 3)
+    input_shape = getattr(ai_model, "input_shape", None)
+    image_size = tuple(input_shape[:2]) if input_shape else IMAGE_SIZE
+    image_array = load_image(image_path, image_size)
     print(f"Image preprocessed: {image_array.shape}")
     return image_array
 
 
-def analyze_plant_image(image_path):
+def analyze_plant_image(image_path, visualize=True):
     if ai_model is None:
         raise RuntimeError("AI model has not been loaded.")
 
     image_array = preprocess_image(image_path)
     predictions = ai_model.predict(image_array)
-    analysis = {CLASS_NAMES[i]: float(predictions[i]) for i in range(len(CLASS_NAMES))}
+    class_names = getattr(ai_model, "class_names", CLASS_NAMES)
+    analysis = {class_names[i]: float(predictions[i]) for i in range(len(class_names))}
 
     print(f"AI Analysis Result: {analysis}")
     log_results(image_path, analysis)
-    visualize_results(analysis)
+    if visualize:
+        visualize_results(analysis)
     return analysis
 
 
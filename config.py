@@ -9,6 +9,8 @@ LOG_FILE = "system.log"
 DATABASE_FILE = "plant_monitoring.db"
 FLASK_HOST = "0.0.0.0"
 FLASK_PORT = 5000
+STATUS_MAX_AGE = 60  # Seconds a cached /status snapshot may be served for
+SENSOR_SAMPLE_INTERVAL = 60  # Seconds between the readings the sampler publishes
 
 # Sensor thresholds
 SENSOR_THRESHOLDS = {
@@ -21,12 +23,14 @@ SENSOR_THRESHOLDS = {
 # Telegram bot settings
 TELEGRAM_BOT_TOKEN = "your-telegram-bot-token"
 TELEGRAM_LOG_FILE = "telegram_bot.log"
+TELEGRAM_ALERT_CHAT_ID = "your-alert-chat-id"  # Receives rule engine alerts
 
 # Scheduling
 DEFAULT_SCHEDULE_INTERVAL = {
     "watering": 60,  # Minutes
     "light": 30,     # Minutes
 }
+SCHEDULER_DISTRIBUTED = False  # True when several hosts run the scheduler on a shared database
 
 # API endpoints (if external integrations are needed)
 API_SETTINGS = {
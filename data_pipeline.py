@@ -0,0 +1,175 @@
+# data_pipeline.py
+# Cached, parallel tf.data input pipeline for training the plant health model.
+
+import hashlib
+import os
+import time
+import tensorflow as tf
+from numpy_inference import list_image_files
+
+# Constants
+CACHE_DIR = "data/cache/tfdata"
+SHUFFLE_BUFFER = 2048
+AUTOTUNE = tf.data.AUTOTUNE
+STALL_BENCHMARK_STEPS = 20
+
+
+def _cache_path(name, samples, image_size):
+    """
+    Builds a cache file name that changes whenever the file list, file
+    contents (size/mtime) or target image size change, so a stale on-disk
+    cache is never reused.
+    """
+    digest = hashlib.sha1(repr(image_size).encode())
+    for path, label in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}|{label}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return os.path.join(CACHE_DIR, f"{name}-{digest.hexdigest()[:12]}")
+
+
+def _decode_and_resize(image_size):
+    def decode(path, label):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        # Nearest-neighbour resize matches flow_from_directory; keep uint8 so
+        # the cache stores 1 byte per pixel.
+        image = tf.image.resize(image, image_size, method="nearest")
+        return tf.cast(image, tf.uint8), label
+
+    return decode
+
+
+def augmentation_layers():
+    """
+    Random transforms roughly matching the ImageDataGenerator settings in
+    ml_training.create_data_generators (rotation, shift, zoom, flip).
+    """
+    return tf.keras.Sequential(
+        [
+            tf.keras.layers.RandomFlip("horizontal"),
+            tf.keras.layers.RandomRotation(40 / 360, fill_mode="nearest"),
+            tf.keras.layers.RandomTranslation(0.2, 0.2, fill_mode="nearest"),
+            tf.keras.layers.RandomZoom(0.2, fill_mode="nearest"),
+        ]
+    )
+
+
+def build_dataset(directory, image_size, batch_size, training=False, name=None):
+    """
+    Builds a tf.data pipeline over a class-per-subdirectory image tree.
+    Returns (dataset, class_names, num_samples).
+    """
+    samples, class_names = list_image_files(directory)
+    if not samples:
+        raise ValueError(f"No images found in {directory}.")
+    cache_name = name or os.path.basename(os.path.normpath(directory))
+    dataset = build_dataset_from_samples(
+        samples, len(class_names), image_size, batch_size, training, cache_name
+    )
+    return dataset, class_names, len(samples)
+
+
+def build_dataset_from_samples(samples, num_classes, image_size, batch_size, training=False, cache_name=None):
+    """
+    Builds a tf.data pipeline over (path, label) samples: parallel
+    decode/resize, on-disk cache of decoded images (when cache_name is
+    given), shuffle buffer, batched parallel augmentation and prefetch.
+    """
+    paths = [path for path, _ in samples]
+    labels = [label for _, label in samples]
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    dataset = dataset.map(_decode_and_resize(image_size), num_parallel_calls=AUTOTUNE)
+    if cache_name:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        dataset = dataset.cache(_cache_path(cache_name, samples, image_size))
+    if training:
+        dataset = dataset.shuffle(min(SHUFFLE_BUFFER, len(samples)), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size, num_parallel_calls=AUTOTUNE)
+
+    augment = augmentation_layers() if training else None
+
+    def to_model_inputs(images, batch_labels):
+        images = tf.cast(images, tf.float32) / 255.0
+        if augment is not None:
+            images = augment(images, training=True)
+        return images, tf.one_hot(batch_labels, num_classes)
+
+    dataset = dataset.map(to_model_inputs, num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
+
+
+def create_tf_datasets(train_dir, validation_dir, image_size, batch_size):
+    """
+    Creates the training and validation tf.data pipelines.
+    Returns (train_dataset, validation_dataset, class_names).
+    """
+    train_ds, class_names, train_count = build_dataset(
+        train_dir, image_size, batch_size, training=True, name="train"
+    )
+    val_ds, _, val_count = build_dataset(
+        validation_dir, image_size, batch_size, training=False, name="validation"
+    )
+    print(f"tf.data pipeline: {train_count} training and {val_count} validation images.")
+    return train_ds, val_ds, class_names
+
+
+def measure_input_stall(model, dataset, steps=STALL_BENCHMARK_STEPS):
+    """
+    Estimates how long training waits on the input pipeline.
+
+    Runs `steps` training steps on a copy of the model twice: once fed by
+    the real pipeline and once from a single batch held in memory (pure
+    compute). The difference is the input stall. The pipeline is also
+    iterated on its own to report its raw throughput. One full epoch is
+    read first, so an on-disk cache is complete (tf.data discards a cache
+    left partly written) and the timings reflect the warm pipeline that
+    later epochs see, not first-epoch decoding.
+    """
+    probe = tf.keras.models.clone_model(model)
+    probe.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
+
+    # Warm up: read one full epoch to finish the cache, then trace the step.
+    fixed_batch = None
+    for batch in dataset:
+        if fixed_batch is None:
+            fixed_batch = batch
+    if fixed_batch is None:
+        raise ValueError("The dataset is empty.")
+    probe.train_on_batch(*fixed_batch)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        probe.train_on_batch(*fixed_batch)
+    compute_time = time.perf_counter() - start
+
+    batches = iter(dataset.repeat())
+    probe.train_on_batch(*next(batches))  # Fill the prefetch buffer
+    start = time.perf_counter()
+    for _ in range(steps):
+        probe.train_on_batch(*next(batches))
+    pipeline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        next(batches)
+    input_only_time = time.perf_counter() - start
+
+    stall = max(pipeline_time - compute_time, 0.0)
+    report = {
+        "steps": steps,
+        "compute_sec_per_step": compute_time / steps,
+        "pipeline_sec_per_step": pipeline_time / steps,
+        "input_only_sec_per_batch": input_only_time / steps,
+        "stall_sec_per_step": stall / steps,
+        "stall_fraction": stall / pipeline_time if pipeline_time else 0.0,
+    }
+    report["bound"] = "input" if report["stall_fraction"] > 0.1 else "compute"
+
+    print(
+        f"Input stall: {report['stall_sec_per_step'] * 1000:.1f} ms/step "
+        f"({report['stall_fraction']:.1%} of step time); "
+        f"compute {report['compute_sec_per_step'] * 1000:.1f} ms/step, "
+        f"input alone {report['input_only_sec_per_batch'] * 1000:.1f} ms/batch. "
+        f"Training is {report['bound']}-bound."
+    )
+    return report
@@ -1,11 +1,28 @@
 # database.py
 # Handles database operations for the Plant Monitoring System.
 
+import json
 import sqlite3
-from datetime import datetime
+import time
+import numpy as np
+from datetime import datetime, timezone
+import system_logging
 
 # Constants
 DATABASE_FILE = "plant_monitoring.db"
+DEFAULT_PLANT = "Plant1"
+SENSOR_COLUMNS = ("soil_moisture", "light_level", "temperature", "humidity")
+MISFIRE_POLICIES = ("skip", "run_once")  # What to do with runs missed while stopped
+SCHEDULE_FIELDS = ("schedule_time", "duration", "action", "plant", "misfire_policy")
+
+
+def _ensure_column(cursor, table, column, definition):
+    """
+    Adds a column to an existing table if an older schema lacks it.
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 
 def initialize_database():
@@ -24,7 +41,24 @@ def initialize_database():
             soil_moisture INTEGER,
             light_level INTEGER,
             temperature REAL,
-            humidity REAL
+            humidity REAL,
+            plant TEXT DEFAULT 'Plant1'
+        )
+        """)
+        _ensure_column(cursor, "sensor_data", "plant", "TEXT DEFAULT 'Plant1'")
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sensor_data_plant_time
+        ON sensor_data (plant, timestamp)
+        """)
+
+        # Idempotency keys of batches received through /ingest
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_batches (
+            node TEXT,
+            batch_id TEXT,
+            rows INTEGER,
+            received DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (node, batch_id)
         )
         """)
 
@@ -43,9 +77,109 @@ def initialize_database():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             device TEXT,
             schedule_time DATETIME,
-            duration INTEGER
+            duration INTEGER,
+            action TEXT,
+            plant TEXT DEFAULT 'Plant1',
+            misfire_policy TEXT DEFAULT 'skip',
+            last_run REAL
+        )
+        """)
+        _ensure_column(cursor, "schedules", "action", "TEXT")
+        _ensure_column(cursor, "schedules", "plant", "TEXT DEFAULT 'Plant1'")
+        _ensure_column(cursor, "schedules", "misfire_policy", "TEXT DEFAULT 'skip'")
+        # Epoch seconds of the last run (or of creation, before the first run)
+        _ensure_column(cursor, "schedules", "last_run", "REAL")
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_schedules_device_time
+        ON schedules (device, schedule_time)
+        """)
+
+        # Change feed of schedules, filled by triggers so every writer is
+        # seen; scheduler processes poll it with an id cursor
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schedule_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            schedule_id INTEGER,
+            changed REAL
+        )
+        """)
+        for event, row in (("INSERT", "NEW"), ("DELETE", "OLD"),
+                           ("UPDATE OF device, schedule_time, duration, action, plant", "NEW")):
+            name = event.split()[0].lower()
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS schedules_{name}_change AFTER {event} ON schedules
+            BEGIN
+                INSERT INTO schedule_changes (schedule_id, changed)
+                VALUES ({row}.id, (julianday('now') - 2440587.5) * 86400.0);
+            END
+            """)
+
+        # Timed actuator runs; "running" rows are in flight
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS actuator_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device TEXT,
+            zone TEXT,
+            action TEXT,
+            started REAL,
+            ends REAL,
+            finished REAL,
+            status TEXT,
+            owner TEXT
+        )
+        """)
+        _ensure_column(cursor, "actuator_runs", "owner", "TEXT")
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_actuator_runs_status
+        ON actuator_runs (status)
+        """)
+        # At most one run in flight per zone, across processes; older
+        # duplicates from before the index existed are interrupted first
+        cursor.execute("""
+        UPDATE actuator_runs SET status = 'interrupted'
+        WHERE status = 'running' AND id NOT IN (
+            SELECT MAX(id) FROM actuator_runs WHERE status = 'running' GROUP BY device, zone
+        )
+        """)
+        cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_actuator_runs_zone_running
+        ON actuator_runs (device, zone) WHERE status = 'running'
+        """)
+
+        # Scheduler nodes, per-job leases with fencing tokens, and the job
+        # runs they claimed; the (job, run_key) key keeps one row per due
+        # run, and a run counts as done once it is completed
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_nodes (
+            node TEXT PRIMARY KEY,
+            heartbeat REAL
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS job_leases (
+            job TEXT PRIMARY KEY,
+            owner TEXT,
+            token INTEGER,
+            expires REAL
         )
         """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job TEXT,
+            run_key TEXT,
+            node TEXT,
+            token INTEGER,
+            claimed REAL,
+            completed REAL,
+            PRIMARY KEY (job, run_key)
+        )
+        """)
+        _ensure_column(cursor, "job_runs", "token", "INTEGER")
+        _ensure_column(cursor, "job_runs", "completed", "REAL")
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_job_runs_claimed
+        ON job_runs (claimed)
+        """)
 
         connection.commit()
         connection.close()
@@ -54,7 +188,7 @@ def initialize_database():
         print(f"Error initializing database: {e}")
 
 
-def add_sensor_data(soil_moisture, light_level, temperature, humidity):
+def add_sensor_data(soil_moisture, light_level, temperature, humidity, plant=DEFAULT_PLANT):
     """
     Adds new sensor data to the database.
     """
@@ -63,9 +197,9 @@ def add_sensor_data(soil_moisture, light_level, temperature, humidity):
         cursor = connection.cursor()
 
         cursor.execute("""
-        INSERT INTO sensor_data (soil_moisture, light_level, temperature, humidity)
-        VALUES (?, ?, ?, ?)
-        """, (soil_moisture, light_level, temperature, humidity))
+        INSERT INTO sensor_data (soil_moisture, light_level, temperature, humidity, plant)
+        VALUES (?, ?, ?, ?, ?)
+        """, (soil_moisture, light_level, temperature, humidity, plant))
 
         connection.commit()
         connection.close()
@@ -74,6 +208,43 @@ def add_sensor_data(soil_moisture, light_level, temperature, humidity):
         print(f"Error adding sensor data: {e}")
 
 
+def add_sensor_batches(batches):
+    """
+    Stores batches of remote readings in one transaction. Each batch is a
+    dict with node, batch_id, plant and readings (a dict of equal-length
+    arrays: timestamp in epoch seconds plus SENSOR_COLUMNS). A batch whose
+    (node, batch_id) was stored before is skipped. Returns a list with
+    "accepted" or "duplicate" per batch, or None if nothing was stored.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        results = []
+        with connection:
+            for batch in batches:
+                readings = batch["readings"]
+                cursor = connection.execute("""
+                INSERT OR IGNORE INTO ingest_batches (node, batch_id, rows)
+                VALUES (?, ?, ?)
+                """, (batch["node"], batch["batch_id"], len(readings["timestamp"])))
+                if cursor.rowcount == 0:
+                    results.append("duplicate")
+                    continue
+                # Epoch seconds to the UTC text CURRENT_TIMESTAMP produces
+                moments = (np.asarray(readings["timestamp"], dtype=np.float64) * 1e6).astype("datetime64[us]")
+                timestamps = np.char.replace(np.datetime_as_string(moments, unit="s"), "T", " ")
+                columns = [np.asarray(readings[name], dtype=np.float64).tolist() for name in SENSOR_COLUMNS]
+                connection.executemany("""
+                INSERT INTO sensor_data (timestamp, soil_moisture, light_level, temperature, humidity, plant)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """, zip(timestamps.tolist(), *columns, [batch["plant"]] * len(timestamps)))
+                results.append("accepted")
+        connection.close()
+        return results
+    except sqlite3.Error as e:
+        print(f"Error adding sensor batches: {e}")
+        return None
+
+
 def get_sensor_data_history(limit=10):
     """
     Retrieves the most recent sensor data from the database.
@@ -96,37 +267,132 @@ def get_sensor_data_history(limit=10):
         return []
 
 
-def add_log(action):
+def get_latest_readings(after_id=0, since=None):
     """
-    Adds a new log entry to the database.
+    Retrieves the newest reading of every plant that has readings with an
+    id above after_id, so callers can poll for new data incrementally. With
+    since (epoch seconds), readings taken earlier are ignored.
+    Returns (last_id, plants, columns): plant names and a dict of NumPy
+    arrays, one per SENSOR_COLUMNS entry, aligned with plants.
     """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        where, params = "id > ?", [after_id]
+        if since is not None:
+            where += " AND timestamp >= ?"
+            params.append(_to_db_timestamp(since))
+        rows = connection.execute(f"""
+        SELECT id, plant, {", ".join(SENSOR_COLUMNS)} FROM sensor_data
+        WHERE id IN (SELECT MAX(id) FROM sensor_data WHERE {where} GROUP BY plant)
+        """, params).fetchall()
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error retrieving latest readings: {e}")
+        rows = []
+    if not rows:
+        return after_id, [], {name: np.empty(0) for name in SENSOR_COLUMNS}
+    values = np.array([row[2:] for row in rows], dtype=np.float64)  # None becomes nan
+    columns = {name: values[:, i] for i, name in enumerate(SENSOR_COLUMNS)}
+    return max(row[0] for row in rows), [row[1] for row in rows], columns
+
+
+def _to_db_timestamp(epoch_seconds):
+    """
+    Converts epoch seconds to the UTC text format CURRENT_TIMESTAMP uses, so
+    range filters can use the (plant, timestamp) index.
+    """
+    moment = datetime.fromtimestamp(epoch_seconds, tz=timezone.utc)
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_sensor_series(plant, sensor, start=None, end=None):
+    """
+    Retrieves (epoch_seconds, value) rows for one plant and sensor within an
+    optional [start, end] range of epoch seconds, oldest first.
+    """
+    if sensor not in SENSOR_COLUMNS:
+        raise ValueError(f"Unknown sensor: {sensor}")
+    query = f"""
+    SELECT CAST(strftime('%s', timestamp) AS INTEGER), {sensor}
+    FROM sensor_data
+    WHERE plant = ? AND {sensor} IS NOT NULL
+    """
+    params = [plant]
+    if start is not None:
+        query += " AND timestamp >= ?"
+        params.append(_to_db_timestamp(start))
+    if end is not None:
+        query += " AND timestamp <= ?"
+        params.append(_to_db_timestamp(end))
+    query += " ORDER BY timestamp ASC"
+
     try:
         connection = sqlite3.connect(DATABASE_FILE)
         cursor = connection.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        connection.close()
+        return rows
+    except sqlite3.Error as e:
+        print(f"Error retrieving sensor series: {e}")
+        return []
 
-        cursor.execute("""
-        INSERT INTO logs (action)
-        VALUES (?)
-        """, (action,))
 
-        connection.commit()
+def get_sensor_data_version():
+    """
+    Returns the id of the newest sensor reading; it changes whenever new
+    data is stored, so it can key caches of derived results.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        cursor = connection.cursor()
+        cursor.execute("SELECT MAX(id) FROM sensor_data")
+        version = cursor.fetchone()[0] or 0
         connection.close()
-        print("Log added successfully.")
+        return version
     except sqlite3.Error as e:
-        print(f"Error adding log: {e}")
+        print(f"Error retrieving sensor data version: {e}")
+        return 0
+
+
+def add_log(action):
+    """
+    Adds a new log entry to the database. Entries are queued and inserted
+    in batches by the shared logging thread.
+    """
+    system_logging.add_batch_sink("database", _write_logs).info(action)
+
+
+def _write_logs(records):
+    """
+    Inserts a batch of queued log records in one transaction.
+    """
+    rows = [(_to_db_timestamp(record.created), record.getMessage()) for record in records]
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            connection.executemany("""
+            INSERT INTO logs (timestamp, action)
+            VALUES (?, ?)
+            """, rows)
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error adding logs: {e}")
 
 
 def get_logs(limit=10):
     """
-    Retrieves the most recent logs from the database.
+    Retrieves the most recent logs from the database, including entries
+    still queued for writing.
     """
+    system_logging.flush()
     try:
         connection = sqlite3.connect(DATABASE_FILE)
         cursor = connection.cursor()
 
         cursor.execute("""
         SELECT * FROM logs
-        ORDER BY timestamp DESC
+        ORDER BY timestamp DESC, id DESC
         LIMIT ?
         """, (limit,))
 
@@ -138,38 +404,56 @@ def get_logs(limit=10):
         return []
 
 
-def add_schedule(device, schedule_time, duration):
+def add_schedule(device, schedule_time, duration, action=None, plant=DEFAULT_PLANT, misfire_policy="skip"):
     """
-    Adds a new schedule to the database.
+    Adds a new schedule to the database and returns its ID.
     """
     try:
         connection = sqlite3.connect(DATABASE_FILE)
         cursor = connection.cursor()
 
         cursor.execute("""
-        INSERT INTO schedules (device, schedule_time, duration)
-        VALUES (?, ?, ?)
-        """, (device, schedule_time, duration))
+        INSERT INTO schedules (device, schedule_time, duration, action, plant, misfire_policy, last_run)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (device, schedule_time, duration, action, plant, misfire_policy, time.time()))
+        schedule_id = cursor.lastrowid
 
         connection.commit()
         connection.close()
         print("Schedule added successfully.")
+        return schedule_id
     except sqlite3.Error as e:
         print(f"Error adding schedule: {e}")
 
 
-def get_schedules():
+def get_schedules(device=None, schedule_time=None, schedule_ids=None):
     """
-    Retrieves all schedules from the database.
+    Retrieves schedules from the database in one query, optionally only
+    those of one device and/or at one time (served by the device/time
+    index) or with the given IDs. Rows are (id, device, schedule_time,
+    duration, action, plant, misfire_policy, last_run).
     """
     try:
         connection = sqlite3.connect(DATABASE_FILE)
         cursor = connection.cursor()
 
-        cursor.execute("""
-        SELECT * FROM schedules
+        conditions, params = [], []
+        if device is not None:
+            conditions.append("device = ?")
+            params.append(device)
+        if schedule_time is not None:
+            conditions.append("schedule_time = ?")
+            params.append(schedule_time)
+        if schedule_ids is not None:
+            # One JSON parameter instead of one placeholder per ID
+            conditions.append("id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(schedule_ids)))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor.execute(f"""
+        SELECT id, device, schedule_time, duration, action, plant, misfire_policy, last_run FROM schedules
+        {where}
         ORDER BY schedule_time ASC
-        """)
+        """, params)
 
         rows = cursor.fetchall()
         connection.close()
@@ -181,7 +465,7 @@ def get_schedules():
 
 def delete_schedule(schedule_id):
     """
-    Deletes a schedule from the database by ID.
+    Deletes a schedule from the database by ID. Returns True if it existed.
     """
     try:
         connection = sqlite3.connect(DATABASE_FILE)
@@ -191,14 +475,475 @@ def delete_schedule(schedule_id):
         DELETE FROM schedules
         WHERE id = ?
         """, (schedule_id,))
+        deleted = cursor.rowcount > 0
 
         connection.commit()
         connection.close()
         print("Schedule deleted successfully.")
+        return deleted
     except sqlite3.Error as e:
         print(f"Error deleting schedule: {e}")
 
 
+def delete_schedules(schedule_ids=None):
+    """
+    Deletes the schedules with the given IDs (all schedules if None) in one
+    transaction. Returns the number deleted.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            if schedule_ids is None:
+                cursor = connection.execute("DELETE FROM schedules")
+            else:
+                cursor = connection.execute("""
+                DELETE FROM schedules
+                WHERE id IN (SELECT value FROM json_each(?))
+                """, (json.dumps(list(schedule_ids)),))
+        connection.close()
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Error deleting schedules: {e}")
+        return 0
+
+
+def update_schedules(schedule_ids, **changes):
+    """
+    Applies the same changes (any of SCHEDULE_FIELDS) to many schedules in
+    one transaction. Returns the number updated.
+    """
+    unknown = set(changes) - set(SCHEDULE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown schedule fields: {', '.join(sorted(unknown))}")
+    if not changes:
+        return 0
+    assignments = ", ".join(f"{field} = ?" for field in changes)
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            cursor = connection.execute(f"""
+            UPDATE schedules SET {assignments}
+            WHERE id IN (SELECT value FROM json_each(?))
+            """, (*changes.values(), json.dumps(list(schedule_ids))))
+        connection.close()
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Error updating schedules: {e}")
+        return 0
+
+
+def get_schedule_version():
+    """
+    Returns the id of the newest schedule change (0 if none), the cursor
+    to poll get_schedule_changes from.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        row = connection.execute("SELECT MAX(id) FROM schedule_changes").fetchone()
+        connection.close()
+        return row[0] or 0
+    except sqlite3.Error as e:
+        print(f"Error retrieving schedule version: {e}")
+        return 0
+
+
+def get_schedule_changes(after_id, limit=1000):
+    """
+    Returns (last_id, schedule_ids): the IDs of schedules added, changed or
+    deleted after change after_id, oldest first, and the cursor for the
+    next call.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        rows = connection.execute(
+            "SELECT id, schedule_id FROM schedule_changes WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+        ).fetchall()
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error retrieving schedule changes: {e}")
+        rows = []
+    if not rows:
+        return after_id, []
+    return rows[-1][0], list(dict.fromkeys(row[1] for row in rows))
+
+
+def prune_schedule_changes(before):
+    """
+    Deletes schedule changes recorded before before (epoch seconds).
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            connection.execute("DELETE FROM schedule_changes WHERE changed < ?", (before,))
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error pruning schedule changes: {e}")
+
+
+def set_schedule_last_run(schedule_id, last_run):
+    """
+    Records when a schedule last ran, for catching up after a restart.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            connection.execute("UPDATE schedules SET last_run = ? WHERE id = ?", (last_run, schedule_id))
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error recording schedule run: {e}")
+
+
+def add_actuator_run(device, zone, action, started, ends, owner=None):
+    """
+    Records an actuator run as in flight and returns its ID. started and
+    ends are epoch seconds; ends is None for runs without a duration.
+    owner names the process driving the run ("host-pid"). Raises
+    sqlite3.IntegrityError if the zone already has a run in flight.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            cursor = connection.execute("""
+            INSERT INTO actuator_runs (device, zone, action, started, ends, status, owner)
+            VALUES (?, ?, ?, ?, ?, 'running', ?)
+            """, (device, zone, action, started, ends, owner))
+        connection.close()
+        return cursor.lastrowid
+    except sqlite3.IntegrityError:
+        connection.close()
+        raise
+    except sqlite3.Error as e:
+        print(f"Error adding actuator run: {e}")
+
+
+def finish_actuator_run(run_id, status, finished):
+    """
+    Marks an in-flight actuator run as completed, cancelled or replaced.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            connection.execute("""
+            UPDATE actuator_runs SET status = ?, finished = ?
+            WHERE id = ? AND status = 'running'
+            """, (status, finished, run_id))
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error finishing actuator run: {e}")
+
+
+def get_actuator_runs(status=None, limit=100):
+    """
+    Retrieves the most recent actuator runs, optionally with one status.
+    Rows are (id, device, zone, action, started, ends, finished, status).
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        cursor = connection.cursor()
+        where = "WHERE status = ?" if status is not None else ""
+        params = ([status] if status is not None else []) + [limit]
+        cursor.execute(f"""
+        SELECT id, device, zone, action, started, ends, finished, status FROM actuator_runs
+        {where}
+        ORDER BY id DESC
+        LIMIT ?
+        """, params)
+        rows = cursor.fetchall()
+        connection.close()
+        return rows
+    except sqlite3.Error as e:
+        print(f"Error retrieving actuator runs: {e}")
+        return []
+
+
+def get_running_owners():
+    """
+    Returns the distinct owners of runs recorded as in flight; None stands
+    for runs recorded before runs had owners.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        rows = connection.execute(
+            "SELECT DISTINCT owner FROM actuator_runs WHERE status = 'running'"
+        ).fetchall()
+        connection.close()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        print(f"Error retrieving actuator run owners: {e}")
+        return []
+
+
+def interrupt_actuator_runs(finished, owners=None):
+    """
+    Marks runs still recorded as in flight (left over from a process that
+    stopped) as interrupted, in one transaction, and returns them. With
+    owners, only the runs of those owners (None for unowned runs) are
+    touched; otherwise all are.
+    """
+    where, params = "status = 'running'", []
+    if owners is not None:
+        named = [owner for owner in owners if owner is not None]
+        where += f" AND (owner IN ({', '.join('?' * len(named))}) OR (owner IS NULL AND ?))"
+        params = named + [None in owners]
+    try:
+        connection = sqlite3.connect(DATABASE_FILE, isolation_level=None)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(f"""
+            SELECT id, device, zone, action, started, ends FROM actuator_runs
+            WHERE {where}
+            """, params).fetchall()
+            connection.execute(f"""
+            UPDATE actuator_runs SET status = 'interrupted', finished = ?
+            WHERE {where}
+            """, [finished] + params)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.close()
+        return rows
+    except sqlite3.Error as e:
+        print(f"Error recovering actuator runs: {e}")
+        return []
+
+
+def heartbeat_node(node, now):
+    """
+    Records that a scheduler node is alive.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            connection.execute("""
+            INSERT INTO scheduler_nodes (node, heartbeat) VALUES (?, ?)
+            ON CONFLICT(node) DO UPDATE SET heartbeat = excluded.heartbeat
+            """, (node, now))
+        connection.close()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error recording node heartbeat: {e}")
+        return False
+
+
+def get_live_nodes(since):
+    """
+    Returns the names of scheduler nodes with a heartbeat at or after since.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        rows = connection.execute(
+            "SELECT node FROM scheduler_nodes WHERE heartbeat >= ? ORDER BY node", (since,)
+        ).fetchall()
+        connection.close()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        print(f"Error retrieving scheduler nodes: {e}")
+        return []
+
+
+def get_dead_nodes(since):
+    """
+    Returns the names of scheduler nodes whose last heartbeat is before
+    since, i.e. nodes that stopped without leaving the pool.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        rows = connection.execute(
+            "SELECT node FROM scheduler_nodes WHERE heartbeat < ? ORDER BY node", (since,)
+        ).fetchall()
+        connection.close()
+        return [row[0] for row in rows]
+    except sqlite3.Error as e:
+        print(f"Error retrieving scheduler nodes: {e}")
+        return []
+
+
+def acquire_lease(job, node, now, expires):
+    """
+    Takes or renews the lease on a job. A node renewing its own live lease
+    keeps its fencing token; taking a free or expired lease increments it.
+    Returns the token, or None if another node holds a live lease.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE, isolation_level=None)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT owner, token, expires FROM job_leases WHERE job = ?", (job,)
+            ).fetchone()
+            if row is None:
+                token = 1
+                connection.execute(
+                    "INSERT INTO job_leases (job, owner, token, expires) VALUES (?, ?, ?, ?)",
+                    (job, node, token, expires),
+                )
+            elif row[0] == node and row[2] >= now:
+                token = row[1]
+                connection.execute("UPDATE job_leases SET expires = ? WHERE job = ?", (expires, job))
+            elif row[2] < now:
+                token = row[1] + 1
+                connection.execute(
+                    "UPDATE job_leases SET owner = ?, token = ?, expires = ? WHERE job = ?",
+                    (node, token, expires, job),
+                )
+            else:
+                token = None
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.close()
+        return token
+    except sqlite3.Error as e:
+        print(f"Error acquiring lease: {e}")
+        return None
+
+
+def renew_leases(node, leases, now, expires):
+    """
+    Extends the live leases node still holds, given as (job, token) pairs.
+    A lease another node has since taken has a newer token and is left
+    alone. Returns the jobs whose leases were renewed.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        renewed = []
+        with connection:
+            for job, token in leases:
+                cursor = connection.execute("""
+                UPDATE job_leases SET expires = ?
+                WHERE job = ? AND owner = ? AND token = ? AND expires >= ?
+                """, (expires, job, node, token, now))
+                if cursor.rowcount == 1:
+                    renewed.append(job)
+        connection.close()
+        return renewed
+    except sqlite3.Error as e:
+        print(f"Error renewing leases: {e}")
+        return []
+
+
+def record_job_run(job, run_key, node, token, claimed):
+    """
+    Claims one run of a job for a node. The claim only happens while node
+    holds the job's lease with this fencing token, and once per run_key;
+    a run that was claimed but never completed can be claimed again only
+    under a newer token, i.e. after the claimer's lease expired. Returns
+    True if the claim succeeded.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            cursor = connection.execute("""
+            INSERT INTO job_runs (job, run_key, node, token, claimed)
+            SELECT ?, ?, ?, ?, ?
+            WHERE EXISTS (
+                SELECT 1 FROM job_leases WHERE job = ? AND owner = ? AND token = ?
+            )
+            ON CONFLICT(job, run_key) DO UPDATE SET
+                node = excluded.node, token = excluded.token, claimed = excluded.claimed
+            WHERE job_runs.completed IS NULL AND job_runs.token < excluded.token
+            """, (job, run_key, node, token, claimed, job, node, token))
+        connection.close()
+        return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        print(f"Error claiming job run: {e}")
+        return False
+
+
+def complete_job_run(job, run_key, node, token, completed):
+    """
+    Marks a claimed run as done and releases the job's lease, in one
+    transaction. Both are fenced by the token, so a node whose claim was
+    taken over cannot complete the run or release the new owner's lease.
+    Returns True if the run was completed.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            cursor = connection.execute("""
+            UPDATE job_runs SET completed = ?
+            WHERE job = ? AND run_key = ? AND node = ? AND token = ? AND completed IS NULL
+            """, (completed, job, run_key, node, token))
+            connection.execute("""
+            UPDATE job_leases SET expires = 0
+            WHERE job = ? AND owner = ? AND token = ?
+            """, (job, node, token))
+        connection.close()
+        return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        print(f"Error completing job run: {e}")
+        return False
+
+
+def release_lease(job, node, token):
+    """
+    Gives up a lease early, e.g. when its run was already claimed.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            connection.execute("""
+            UPDATE job_leases SET expires = 0
+            WHERE job = ? AND owner = ? AND token = ?
+            """, (job, node, token))
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error releasing lease: {e}")
+
+
+def has_job_run(job, run_key):
+    """
+    Returns True if some node completed this run of the job.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        row = connection.execute(
+            "SELECT 1 FROM job_runs WHERE job = ? AND run_key = ? AND completed IS NOT NULL", (job, run_key)
+        ).fetchone()
+        connection.close()
+        return row is not None
+    except sqlite3.Error as e:
+        print(f"Error checking job run: {e}")
+        return False
+
+
+def prune_job_runs(before):
+    """
+    Deletes job runs claimed before the given time, and the expired leases
+    of jobs left with no runs (e.g. deleted schedules). Returns the number
+    of runs deleted.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            cursor = connection.execute("DELETE FROM job_runs WHERE claimed < ?", (before,))
+            connection.execute("""
+            DELETE FROM job_leases
+            WHERE expires < ? AND NOT EXISTS (SELECT 1 FROM job_runs WHERE job_runs.job = job_leases.job)
+            """, (before,))
+        connection.close()
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Error pruning job runs: {e}")
+        return 0
+
+
+def release_node(node):
+    """
+    Removes a scheduler node, e.g. on clean shutdown, so other nodes take
+    over its jobs without waiting for its heartbeat to expire.
+    """
+    try:
+        connection = sqlite3.connect(DATABASE_FILE)
+        with connection:
+            connection.execute("DELETE FROM scheduler_nodes WHERE node = ?", (node,))
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"Error releasing scheduler node: {e}")
+
+
 # Example usage
 if __name__ == "__main__":
     initialize_database()
@@ -0,0 +1,220 @@
+# dataset_cache.py
+# Preprocessed, memory-mapped .npy shard cache for repeat training runs.
+
+import json
+import os
+import time
+import numpy as np
+from numpy_inference import list_image_files, load_image
+
+# Constants
+SHARD_CACHE_DIR = "data/cache/shards"
+SHARD_SIZE = 1024
+MANIFEST_FILE = "manifest.json"
+
+
+def _load_manifest(split_dir):
+    path = os.path.join(split_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_manifest(split_dir, manifest):
+    """
+    Writes the manifest atomically so readers never see a half-written one.
+    """
+    path = os.path.join(split_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_shards(source_dir, split_dir, image_size=(224, 224), shard_size=SHARD_SIZE):
+    """
+    Builds (or refreshes) uint8 image shards and labels for one dataset
+    split. Files whose size and mtime match the previous manifest are copied
+    from the old shards instead of being decoded again. Returns the manifest.
+    """
+    start = time.perf_counter()
+    samples, class_names = list_image_files(source_dir)
+    os.makedirs(split_dir, exist_ok=True)
+
+    old = _load_manifest(split_dir)
+    reusable = (
+        old is not None
+        and old["image_size"] == list(image_size)
+        and old["class_names"] == class_names
+    )
+    old_files = old["files"] if reusable else {}
+    signatures = {path: _file_signature(path) for path, _ in samples}
+
+    # Nothing added, removed or modified: the existing shards are current.
+    if reusable and set(old_files) == set(signatures) and all(
+        old_files[path]["size"] == sig["size"] and old_files[path]["mtime_ns"] == sig["mtime_ns"]
+        for path, sig in signatures.items()
+    ):
+        print(f"Shard cache {split_dir} is up to date ({len(samples)} images).")
+        return old
+
+    old_shards = []
+    if reusable:
+        old_shards = [
+            np.load(os.path.join(split_dir, shard["file"]), mmap_mode="r") for shard in old["shards"]
+        ]
+
+    generation = old["generation"] + 1 if old else 0
+    manifest = {
+        "source_dir": source_dir,
+        "image_size": list(image_size),
+        "class_names": class_names,
+        "generation": generation,
+        "count": len(samples),
+        "labels": f"labels-g{generation}.npy",
+        "shards": [],
+        "files": {},
+    }
+    labels = np.array([label for _, label in samples], dtype=np.int64)
+    np.save(os.path.join(split_dir, manifest["labels"]), labels)
+
+    decoded = 0
+    for shard_index, offset in enumerate(range(0, len(samples), shard_size)):
+        chunk = samples[offset:offset + shard_size]
+        filename = f"images-g{generation}-{shard_index:05d}.npy"
+        shard = np.lib.format.open_memmap(
+            os.path.join(split_dir, filename), mode="w+", dtype=np.uint8,
+            shape=(len(chunk), *image_size, 3),
+        )
+        for row, (path, _) in enumerate(chunk):
+            signature = signatures[path]
+            previous = old_files.get(path)
+            if previous and previous["size"] == signature["size"] and previous["mtime_ns"] == signature["mtime_ns"]:
+                shard[row] = old_shards[previous["shard"]][previous["index"]]
+            else:
+                shard[row] = load_image(path, image_size, rescale=False)
+                decoded += 1
+            manifest["files"][path] = dict(signature, shard=shard_index, index=row)
+        shard.flush()
+        del shard
+        manifest["shards"].append({"file": filename, "count": len(chunk)})
+
+    manifest["last_build"] = {"decoded": decoded, "reused": len(samples) - decoded}
+    _write_manifest(split_dir, manifest)
+
+    # Drop the previous generation only after the new manifest is in place.
+    del old_shards
+    if old:
+        for stale in [old["labels"]] + [shard["file"] for shard in old["shards"]]:
+            stale_path = os.path.join(split_dir, stale)
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Built shard cache {split_dir}: {len(samples)} images, {decoded} decoded, "
+        f"{len(samples) - decoded} reused in {elapsed:.1f}s."
+    )
+    return manifest
+
+
+class ShardedDataset:
+    """
+    Read-only view over a split's shards. Images stay in memory-mapped
+    uint8 files; only the rows requested for a batch are copied.
+    """
+
+    def __init__(self, split_dir):
+        manifest = _load_manifest(split_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"No shard manifest in {split_dir}. Run build_shards() first.")
+        self.manifest = manifest
+        self.class_names = manifest["class_names"]
+        self.labels = np.load(os.path.join(split_dir, manifest["labels"]), mmap_mode="r")
+        self.shards = [
+            np.load(os.path.join(split_dir, shard["file"]), mmap_mode="r")
+            for shard in manifest["shards"]
+        ]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def get(self, indices):
+        """
+        Returns (uint8 images, labels) for the given global indices. An
+        empty split returns empty arrays for no indices and raises
+        IndexError for any others.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) and (indices.min() < 0 or indices.max() >= len(self)):
+            raise IndexError(f"Index out of range for a split of {len(self)} images.")
+        image_size = self.manifest["image_size"]
+        images = np.empty((len(indices), *image_size, 3), dtype=np.uint8)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        for shard_id in np.unique(shard_ids):
+            rows = shard_ids == shard_id
+            images[rows] = self.shards[shard_id][indices[rows] - self.offsets[shard_id]]
+        return images, np.asarray(self.labels[indices])
+
+    def batches(self, batch_size, shuffle=False, seed=None):
+        """
+        Yields (uint8 images, labels) batches over the whole split.
+        """
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            if not shuffle:
+                batch = slice(batch[0], batch[-1] + 1)
+                yield self._get_range(batch)
+            else:
+                yield self.get(np.sort(batch))
+
+    def _get_range(self, batch):
+        """
+        Contiguous reads; returns memmap views when the range sits in one shard.
+        """
+        shard_id = int(np.searchsorted(self.offsets, batch.start, side="right") - 1)
+        local = slice(batch.start - self.offsets[shard_id], batch.stop - self.offsets[shard_id])
+        if batch.stop <= self.offsets[shard_id + 1]:
+            return self.shards[shard_id][local], np.asarray(self.labels[batch])
+        return self.get(np.arange(batch.start, batch.stop))
+
+
+def build_dataset_cache(train_dir, validation_dir, image_size=(224, 224), cache_dir=SHARD_CACHE_DIR):
+    """
+    Builds or refreshes the shard caches for the training and validation
+    splits. Returns (train_dataset, validation_dataset).
+    """
+    splits = {}
+    for split, source_dir in (("train", train_dir), ("validation", validation_dir)):
+        split_dir = os.path.join(cache_dir, split)
+        build_shards(source_dir, split_dir, image_size)
+        splits[split] = ShardedDataset(split_dir)
+    return splits["train"], splits["validation"]
+
+
+def evaluate_on_shards(model, dataset, batch_size=32):
+    """
+    Computes top-1 accuracy of a NumPy model on a sharded split.
+    """
+    correct = 0
+    for images, labels in dataset.batches(batch_size):
+        predictions = model.predict(images.astype(np.float32) / 255.0, batch_size=batch_size)
+        correct += int((predictions.argmax(axis=1) == labels).sum())
+    accuracy = correct / len(dataset) if len(dataset) else 0.0
+    print(f"Accuracy on {len(dataset)} cached images: {accuracy:.4f}")
+    return accuracy
+
+
+# Example usage
+if __name__ == "__main__":
+    train, validation = build_dataset_cache("data/train", "data/validation")
+    print(f"Training images: {len(train)}, validation images: {len(validation)}")
@@ -0,0 +1,44 @@
+# downsampling.py
+# Largest-Triangle-Three-Buckets downsampling for sensor history charts.
+
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Downsamples a time series to `threshold` points with the
+    Largest-Triangle-Three-Buckets algorithm, keeping the first and last
+    points and the visually most significant point of every bucket.
+    x must be sorted ascending. Returns (x, y) NumPy arrays.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # Interior points split into threshold - 2 buckets.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average of each bucket, used as the third triangle vertex for the
+    # bucket before it; the last bucket looks ahead to the final point.
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = starts[i], ends[i]
+        bx, by = x[start:end], y[start:end]
+        ax, ay = x[a], y[a]
+        # Twice the triangle area; the constant factor does not change argmax.
+        area = np.abs((ax - next_x[i]) * (by - ay) - (ax - bx) * (next_y[i] - ay))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return x[selected], y[selected]
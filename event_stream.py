@@ -0,0 +1,121 @@
+# event_stream.py
+# Server-Sent Events fan-out for live dashboard updates.
+
+import json
+import queue
+import threading
+from collections import deque
+
+# Constants
+CLIENT_BUFFER_SIZE = 64  # Events buffered per client before it is evicted
+MAX_CLIENTS = 1000
+HEARTBEAT_INTERVAL = 15  # Seconds between keep-alive comments
+REPLAY_BUFFER_SIZE = 256  # Recent events kept for reconnecting clients
+
+
+class Subscriber:
+    """
+    One connected client: a bounded queue of pre-serialized events.
+    """
+
+    def __init__(self, buffer_size):
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.evicted = False
+
+
+class EventBroadcaster:
+    """
+    Publishes events to every subscriber. Each event is serialized once;
+    clients whose buffer is full are evicted instead of slowing the
+    publisher down or growing memory without bound.
+    """
+
+    def __init__(self, buffer_size=CLIENT_BUFFER_SIZE, max_clients=MAX_CLIENTS,
+                 replay_size=REPLAY_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._next_id = 1
+        self._recent = deque(maxlen=replay_size)
+        self.evictions = 0
+
+    def subscribe(self, last_event_id=None):
+        """
+        Registers a client. With last_event_id, missed events still in the
+        replay buffer are queued first.
+        """
+        subscriber = Subscriber(self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                raise RuntimeError("Too many stream clients.")
+            if last_event_id is not None:
+                for event_id, message in self._recent:
+                    if event_id > last_event_id and not subscriber.queue.full():
+                        subscriber.queue.put_nowait(message)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type, data, event_id=None):
+        """
+        Sends an event to all clients and returns its id. event_id lets a
+        shared change feed supply ids that match across processes.
+        """
+        with self._lock:
+            if event_id is None:
+                event_id = self._next_id
+            self._next_id = max(self._next_id, event_id + 1)
+            message = f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+            self._recent.append((event_id, message))
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                self._evict(subscriber)
+        return event_id
+
+    def _evict(self, subscriber):
+        """
+        Drops a slow client and wakes its stream so the connection closes.
+        """
+        self.unsubscribe(subscriber)
+        subscriber.evicted = True
+        self.evictions += 1
+        while True:
+            try:
+                subscriber.queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            subscriber.queue.put_nowait(None)
+        except queue.Full:
+            pass  # A racing publish refilled the queue; stream() checks the flag.
+
+    def stream(self, subscriber, heartbeat=HEARTBEAT_INTERVAL):
+        """
+        Yields SSE-formatted messages for one client until it disconnects
+        or is evicted.
+        """
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    message = ": keep-alive\n\n"
+                if message is None or subscriber.evicted:
+                    yield "event: evicted\ndata: {}\n\n"
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,249 @@
+# fine_tuning.py
+# Incremental fine-tuning of the plant health model on production captures.
+
+import json
+import os
+import sys
+import time
+import numpy as np
+import tensorflow as tf
+from datetime import datetime
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+from tensorflow.keras.models import load_model
+from ai_model import LOG_FILE as ANALYSIS_LOG_FILE, read_analysis_log
+from camera import IMAGE_DIRECTORY
+from data_pipeline import build_dataset, build_dataset_from_samples
+from ml_training import (
+    TRAINING_DIR,
+    VALIDATION_DIR,
+    IMG_HEIGHT,
+    IMG_WIDTH,
+    BATCH_SIZE,
+    EPOCHS,
+    MODEL_ARCHITECTURES,
+)
+from numpy_inference import export_from_checkpoint, list_image_files
+
+# Constants
+LABELS_FILE = os.path.join(IMAGE_DIRECTORY, "labels.json")  # {"file.jpg": "Healthy", ...}
+STATE_FILE = "fine_tuning_state.json"
+CANDIDATE_SAVE_PATH = "plant_ai_model_candidate.h5"
+FINE_TUNE_EPOCHS = 3
+FINE_TUNE_LEARNING_RATE = 1e-4
+REPLAY_RATIO = 2  # Old training samples replayed per new sample
+MIN_CONFIDENCE = 0.8  # Minimum logged probability to use a prediction as a label
+
+
+def load_state():
+    """
+    Loads the timestamp of the newest production sample already used.
+    """
+    if not os.path.exists(STATE_FILE):
+        return None
+    with open(STATE_FILE, "r") as f:
+        last = json.load(f).get("last_sample_time")
+    return datetime.strptime(last, "%Y-%m-%d %H:%M:%S") if last else None
+
+
+def save_state(last_sample_time):
+    with open(STATE_FILE, "w") as f:
+        json.dump({"last_sample_time": last_sample_time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+
+
+def collect_production_samples(class_names, since=None, min_confidence=MIN_CONFIDENCE):
+    """
+    Gathers labelled images from the camera's image store. Labels come from
+    images/labels.json when present, otherwise from the most recent analysis
+    logged for the image if its top probability reaches min_confidence.
+    Only entries newer than `since` are used.
+    Returns (samples, newest_timestamp).
+    """
+    manual_labels = {}
+    if os.path.exists(LABELS_FILE):
+        with open(LABELS_FILE, "r") as f:
+            manual_labels = json.load(f)
+
+    image_dir = os.path.abspath(IMAGE_DIRECTORY)
+    latest = {}
+    for timestamp, image_path, analysis in read_analysis_log(ANALYSIS_LOG_FILE):
+        if since is not None and timestamp <= since:
+            continue
+        if os.path.dirname(os.path.abspath(image_path)) != image_dir:
+            continue
+        latest[image_path] = (timestamp, analysis)
+
+    # Manually labelled images count even if they were never analysed.
+    for filename in manual_labels:
+        image_path = os.path.join(IMAGE_DIRECTORY, filename)
+        if image_path in latest or not os.path.exists(image_path):
+            continue
+        modified = datetime.fromtimestamp(os.path.getmtime(image_path)).replace(microsecond=0)
+        if since is None or modified > since:
+            latest[image_path] = (modified, None)
+
+    samples, newest = [], since
+    for image_path, (timestamp, analysis) in sorted(latest.items()):
+        if not os.path.exists(image_path):
+            continue
+        name = manual_labels.get(os.path.basename(image_path))
+        if name is None and analysis:
+            name, confidence = max(analysis.items(), key=lambda item: item[1])
+            if confidence < min_confidence:
+                continue
+        if name not in class_names:
+            continue
+        samples.append((image_path, class_names.index(name)))
+        newest = max(newest, timestamp) if newest else timestamp
+
+    print(f"Collected {len(samples)} new labelled samples from {IMAGE_DIRECTORY}.")
+    return samples, newest
+
+
+def sample_replay_buffer(count, seed=0):
+    """
+    Draws a random sample of the original training images so fine-tuning
+    does not forget the existing classes.
+    """
+    samples, _ = list_image_files(TRAINING_DIR)
+    if count >= len(samples):
+        return samples
+    picks = np.random.default_rng(seed).choice(len(samples), size=count, replace=False)
+    return [samples[i] for i in sorted(picks)]
+
+
+def _validation_dataset():
+    dataset, _, _ = build_dataset(
+        VALIDATION_DIR, (IMG_HEIGHT, IMG_WIDTH), BATCH_SIZE, training=False, name="validation"
+    )
+    return dataset
+
+
+def fine_tune_model(new_samples=None, architecture="baseline", epochs=FINE_TUNE_EPOCHS,
+                    save_path=None, update_state=True):
+    """
+    Fine-tunes the existing checkpoint on new samples plus a replay buffer
+    of old ones. The checkpoint is only overwritten if validation accuracy
+    improves, and the NumPy model is re-exported when it is.
+    Returns a report with wall-clock time and validation accuracy.
+    """
+    _, checkpoint_path, numpy_path = MODEL_ARCHITECTURES[architecture]
+    save_path = save_path or checkpoint_path
+    _, class_names = list_image_files(TRAINING_DIR)
+
+    newest = None
+    if new_samples is None:
+        new_samples, newest = collect_production_samples(class_names, since=load_state())
+    if not new_samples:
+        print("No new samples to fine-tune on.")
+        return None
+
+    replay = sample_replay_buffer(REPLAY_RATIO * len(new_samples))
+    train_ds = build_dataset_from_samples(
+        new_samples + replay, len(class_names), (IMG_HEIGHT, IMG_WIDTH), BATCH_SIZE, training=True
+    )
+    val_ds = _validation_dataset()
+
+    model = load_model(checkpoint_path)
+    _, accuracy_before = model.evaluate(val_ds, verbose=0)
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(FINE_TUNE_LEARNING_RATE),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    checkpoint = ModelCheckpoint(
+        save_path, monitor="val_accuracy", save_best_only=True,
+        initial_value_threshold=accuracy_before, verbose=1,
+    )
+
+    start = time.perf_counter()
+    history = model.fit(train_ds, epochs=epochs, validation_data=val_ds, callbacks=[checkpoint])
+    wall_time = time.perf_counter() - start
+
+    accuracy_after = max(history.history["val_accuracy"])
+    improved = accuracy_after > accuracy_before
+    if improved and save_path == checkpoint_path:
+        export_from_checkpoint(checkpoint_path, numpy_path, class_names)
+    if update_state and newest is not None:
+        save_state(newest)
+
+    report = {
+        "mode": "fine-tune",
+        "new_samples": len(new_samples),
+        "replay_samples": len(replay),
+        "wall_time_sec": wall_time,
+        "val_accuracy_before": float(accuracy_before),
+        "val_accuracy": float(accuracy_after),
+        "saved": improved,
+    }
+    print(
+        f"Fine-tuned on {len(new_samples)} new + {len(replay)} replayed samples in {wall_time:.1f}s; "
+        f"validation accuracy {accuracy_before:.4f} -> {accuracy_after:.4f}"
+        f"{'' if improved else ' (checkpoint kept)'}."
+    )
+    return report
+
+
+def full_retrain(new_samples, architecture="baseline", save_path=CANDIDATE_SAVE_PATH):
+    """
+    Trains the architecture from scratch on the full training set plus the
+    new samples, for comparison with fine-tuning.
+    """
+    builder, _, _ = MODEL_ARCHITECTURES[architecture]
+    samples, class_names = list_image_files(TRAINING_DIR)
+    train_ds = build_dataset_from_samples(
+        samples + new_samples, len(class_names), (IMG_HEIGHT, IMG_WIDTH), BATCH_SIZE, training=True
+    )
+    val_ds = _validation_dataset()
+
+    model = builder()
+    start = time.perf_counter()
+    history = model.fit(
+        train_ds,
+        epochs=EPOCHS,
+        validation_data=val_ds,
+        callbacks=[
+            ModelCheckpoint(save_path, monitor="val_accuracy", save_best_only=True),
+            EarlyStopping(monitor="val_loss", patience=5),
+        ],
+    )
+    wall_time = time.perf_counter() - start
+    return {
+        "mode": "full retrain",
+        "new_samples": len(new_samples),
+        "replay_samples": len(samples),
+        "wall_time_sec": wall_time,
+        "val_accuracy": float(max(history.history["val_accuracy"])),
+    }
+
+
+def compare_with_full_retrain(architecture="baseline"):
+    """
+    Fine-tunes and fully retrains on the same new samples, writing both to
+    a candidate checkpoint, and reports wall-clock time and accuracy.
+    """
+    _, class_names = list_image_files(TRAINING_DIR)
+    new_samples, _ = collect_production_samples(class_names, since=load_state())
+    if not new_samples:
+        print("No new samples to compare on.")
+        return None
+
+    fine_tune = fine_tune_model(
+        new_samples, architecture, save_path=CANDIDATE_SAVE_PATH, update_state=False
+    )
+    retrain = full_retrain(new_samples, architecture)
+
+    print(f"\n{'mode':<14}{'samples':>10}{'wall time s':>13}{'val acc':>9}")
+    for report in (fine_tune, retrain):
+        samples = report["new_samples"] + report["replay_samples"]
+        print(f"{report['mode']:<14}{samples:>10}{report['wall_time_sec']:>13.1f}{report['val_accuracy']:>9.4f}")
+    print(f"Fine-tuning was {retrain['wall_time_sec'] / fine_tune['wall_time_sec']:.1f}x faster.")
+    return {"fine_tune": fine_tune, "full_retrain": retrain}
+
+
+# Example usage
+if __name__ == "__main__":
+    # Usage: python fine_tuning.py [compare]
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        compare_with_full_retrain()
+    else:
+        fine_tune_model()
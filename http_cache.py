@@ -0,0 +1,141 @@
+# http_cache.py
+# Conditional GET, compression and per-version caching of JSON responses.
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from flask import Response, request
+from werkzeug.http import http_date, quote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # Responses fall back to gzip
+
+# Constants
+RESPONSE_CACHE_SIZE = 256  # Serialized responses kept, least recently used evicted
+COMPRESS_MIN_BYTES = 1024  # Smaller bodies are sent uncompressed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def make_etag(key, version):
+    """
+    Derives an ETag from a resource key and its state version, so it can be
+    checked before the response is built.
+    """
+    return hashlib.sha1(repr((key, version)).encode("utf-8")).hexdigest()[:20]
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Returns True if the request's If-None-Match (or, without it,
+    If-Modified-Since) shows the client already has this version.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def validator_headers(etag, last_modified=None, cache_control="no-cache"):
+    # Weak ETag: the compressed and identity bodies share it.
+    headers = {"ETag": quote_etag(etag, weak=True), "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def preferred_encoding(size):
+    """
+    Picks brotli or gzip from Accept-Encoding for bodies worth compressing.
+    """
+    if size < COMPRESS_MIN_BYTES:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+class ResponseCache:
+    """
+    Caches serialized JSON bodies (and their compressed variants) per
+    resource key and state version. Requests for an unchanged version are
+    answered with 304 or with the cached bytes, without rebuilding or
+    re-serializing the payload.
+    """
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.not_modified = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["version"] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def respond(self, key, version, build, last_modified=None, headers=None):
+        """
+        Returns the response for a resource. build() produces the payload
+        and is only called when this key has no cached body for version.
+        """
+        etag = make_etag(key, version)
+        response_headers = validator_headers(etag, last_modified)
+        response_headers["Vary"] = "Accept-Encoding"
+        response_headers.update(headers or {})
+        if not_modified(etag, last_modified):
+            self.not_modified += 1
+            return Response(status=304, headers=response_headers)
+
+        entry = self._lookup(key, version)
+        if entry is None:
+            self.misses += 1
+            body = json.dumps(build(), separators=(",", ":"), default=str).encode("utf-8")
+            entry = {"version": version, "body": body, "encoded": {}}
+            self._store(key, entry)
+        else:
+            self.hits += 1
+
+        body = entry["body"]
+        encoding = preferred_encoding(len(body))
+        if encoding is not None:
+            encoded = entry["encoded"].get(encoding)
+            if encoded is None:
+                encoded = entry["encoded"][encoding] = _compress(body, encoding)
+            body = encoded
+            response_headers["Content-Encoding"] = encoding
+        return Response(body, mimetype="application/json", headers=response_headers)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
@@ -0,0 +1,237 @@
+# ingest.py
+# Decoding, validation and storage of sensor batches sent by remote nodes.
+
+import gzip
+import json
+import struct
+import time
+import zlib
+import numpy as np
+from database import DEFAULT_PLANT, SENSOR_COLUMNS, add_sensor_batches
+from utilities import validate_sensor_batch
+
+# Constants
+JSON_CONTENT_TYPE = "application/json"
+BINARY_CONTENT_TYPE = "application/x-plant-readings"
+MAX_INGEST_BYTES = 16 * 1024 * 1024  # Limit after decompression
+MAX_CLOCK_SKEW = 24 * 3600  # Seconds a reading may lie in the future
+BINARY_MAGIC = b"PMS1"
+# One binary reading: epoch seconds followed by the four sensor values
+READING_DTYPE = np.dtype([("timestamp", "<f8")] + [(name, "<f4") for name in SENSOR_COLUMNS])
+
+# Binary format (little-endian):
+#   magic "PMS1", uint16 batch count, then per batch:
+#   uint8 length + node, uint8 length + batch_id, uint8 length + plant,
+#   uint32 reading count, readings packed as READING_DTYPE (24 bytes each).
+
+
+def _decompress(body, content_encoding):
+    """
+    Inflates gzip/deflate bodies, refusing ones that expand past
+    MAX_INGEST_BYTES.
+    """
+    if content_encoding in (None, "", "identity"):
+        if len(body) > MAX_INGEST_BYTES:
+            raise ValueError("Payload too large.")
+        return body
+    if content_encoding not in ("gzip", "deflate"):
+        raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+    window = 16 + zlib.MAX_WBITS if content_encoding == "gzip" else zlib.MAX_WBITS
+    inflater = zlib.decompressobj(window)
+    try:
+        data = inflater.decompress(body, MAX_INGEST_BYTES + 1)
+    except zlib.error as e:
+        raise ValueError(f"Invalid compressed payload: {e}")
+    if len(data) > MAX_INGEST_BYTES or inflater.unconsumed_tail:
+        raise ValueError("Payload too large.")
+    return data
+
+
+def _json_columns(readings):
+    """
+    Converts readings given as a list of row objects or as an object of
+    columns into a dict of NumPy arrays.
+    """
+    if isinstance(readings, dict):
+        rows = None
+        columns = readings
+    elif isinstance(readings, list):
+        if not all(isinstance(row, dict) for row in readings):
+            raise ValueError("Every reading must be an object.")
+        rows = readings
+        keys = set().union(*(row.keys() for row in rows)) if rows else set(SENSOR_COLUMNS)
+        columns = {key: [row.get(key) for row in rows] for key in keys}
+    else:
+        raise ValueError("readings must be a list or an object.")
+    arrays = {}
+    for key, values in columns.items():
+        if key == "timestamp" or key in SENSOR_COLUMNS:
+            try:
+                arrays[key] = np.array(values, dtype=np.float64).reshape(-1)
+            except (TypeError, ValueError):
+                raise ValueError(f"Non-numeric values in field: {key}")
+    if "timestamp" not in arrays:
+        count = len(rows) if rows is not None else len(next(iter(arrays.values()), []))
+        arrays["timestamp"] = np.full(count, time.time())
+    return arrays
+
+
+def decode_json(data):
+    """
+    Parses a JSON payload:
+    {"node": ..., "batches": [{"batch_id": ..., "plant": ..., "readings": [...]}]}
+    """
+    try:
+        payload = json.loads(data)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON payload: {e}")
+    if not isinstance(payload, dict) or not isinstance(payload.get("batches"), list):
+        raise ValueError("Payload must be an object with a batches list.")
+    node = str(payload.get("node", "unknown"))
+    batches = []
+    for batch in payload["batches"]:
+        if not isinstance(batch, dict) or "batch_id" not in batch:
+            raise ValueError("Every batch needs a batch_id.")
+        batches.append({
+            "node": str(batch.get("node", node)),
+            "batch_id": str(batch["batch_id"]),
+            "plant": str(batch.get("plant", DEFAULT_PLANT)),
+            "readings": batch.get("readings", []),
+        })
+    return batches
+
+
+def _read_string(data, offset):
+    length = data[offset]
+    value = data[offset + 1:offset + 1 + length].decode("utf-8")
+    return value, offset + 1 + length
+
+
+def decode_binary(data):
+    """
+    Parses the compact binary format; readings are read with one
+    np.frombuffer call per batch.
+    """
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError("Invalid binary payload.")
+    try:
+        (count,) = struct.unpack_from("<H", data, 4)
+        offset = 6
+        batches = []
+        for _ in range(count):
+            node, offset = _read_string(data, offset)
+            batch_id, offset = _read_string(data, offset)
+            plant, offset = _read_string(data, offset)
+            (rows,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            readings = np.frombuffer(data, dtype=READING_DTYPE, count=rows, offset=offset)
+            offset += rows * READING_DTYPE.itemsize
+            batches.append({
+                "node": node,
+                "batch_id": batch_id,
+                "plant": plant or DEFAULT_PLANT,
+                "readings": {name: readings[name] for name in READING_DTYPE.names},
+            })
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Truncated binary payload: {e}")
+    return batches
+
+
+def encode_binary(batches):
+    """
+    Encodes batches (node, batch_id, plant, readings) in the binary format;
+    used by edge nodes and tests.
+    """
+    parts = [BINARY_MAGIC, struct.pack("<H", len(batches))]
+    for batch in batches:
+        for key in ("node", "batch_id", "plant"):
+            encoded = str(batch[key]).encode("utf-8")
+            parts.append(struct.pack("<B", len(encoded)) + encoded)
+        readings = batch["readings"]
+        packed = np.zeros(len(readings["timestamp"]), dtype=READING_DTYPE)
+        for name in READING_DTYPE.names:
+            packed[name] = readings[name]
+        parts.append(struct.pack("<I", len(packed)))
+        parts.append(packed.tobytes())
+    return b"".join(parts)
+
+
+def decode_payload(body, content_type, content_encoding=None):
+    """
+    Decodes an /ingest request body into a list of batches.
+    """
+    data = _decompress(body, content_encoding)
+    if content_type == BINARY_CONTENT_TYPE:
+        return decode_binary(data)
+    if content_type in (JSON_CONTENT_TYPE, None, ""):
+        batches = decode_json(data)
+        for batch in batches:
+            batch["error"] = None
+            try:
+                batch["readings"] = _json_columns(batch["readings"])
+            except ValueError as e:
+                batch["error"] = str(e)
+        return batches
+    raise ValueError(f"Unsupported Content-Type: {content_type}")
+
+
+def ingest_batches(batches, now=None):
+    """
+    Validates every batch and stores the valid readings in one database
+    transaction. Returns one acknowledgement per batch, or None when the
+    database write failed (the client should retry with the same ids).
+    """
+    now = time.time() if now is None else now
+    acks, accepted = [], []
+    for batch in batches:
+        ack = {"batch_id": batch["batch_id"], "node": batch["node"]}
+        acks.append(ack)
+        try:
+            if batch.get("error"):
+                raise ValueError(batch["error"])
+            readings = batch["readings"]
+            valid = validate_sensor_batch(readings)
+            timestamps = np.asarray(readings["timestamp"], dtype=np.float64)
+            if len(timestamps) != len(valid):
+                raise ValueError("timestamp has a different length than the sensor data.")
+            valid &= np.isfinite(timestamps) & (timestamps > 0) & (timestamps <= now + MAX_CLOCK_SKEW)
+        except ValueError as e:
+            ack.update(status="rejected", accepted=0, rejected=None, message=str(e))
+            continue
+        ack.update(accepted=int(valid.sum()), rejected=int(len(valid) - valid.sum()))
+        kept = {key: np.asarray(values)[valid] for key, values in readings.items()}
+        accepted.append((ack, dict(batch, readings=kept)))
+
+    if accepted:
+        results = add_sensor_batches([batch for _, batch in accepted])
+        if results is None:
+            return None
+        for (ack, _), result in zip(accepted, results):
+            ack["status"] = result
+            if result == "duplicate":
+                ack.update(accepted=0, rejected=0)
+    return acks
+
+
+# Example usage
+if __name__ == "__main__":
+    from database import initialize_database
+
+    initialize_database()
+    now = time.time()
+    batch = {
+        "node": "edge-1",
+        "batch_id": "example-1",
+        "plant": "Plant2",
+        "readings": {
+            "timestamp": now - np.arange(5)[::-1] * 60.0,
+            "soil_moisture": np.array([45, 46, 47, 150, 48]),
+            "light_level": np.full(5, 300.0),
+            "temperature": np.full(5, 22.5),
+            "humidity": np.full(5, 55.0),
+        },
+    }
+    body = gzip.compress(encode_binary([batch]))
+    batches = decode_payload(body, BINARY_CONTENT_TYPE, "gzip")
+    print(ingest_batches(batches))
+    print(ingest_batches(batches))  # Retried batch is acknowledged as a duplicate
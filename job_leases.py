@@ -0,0 +1,170 @@
+# job_leases.py
+# Runs each due scheduled job exactly once across a pool of scheduler nodes.
+
+import hashlib
+import os
+import socket
+import time
+from database import (
+    acquire_lease,
+    complete_job_run,
+    get_dead_nodes,
+    get_live_nodes,
+    has_job_run,
+    heartbeat_node,
+    prune_job_runs,
+    record_job_run,
+    release_lease,
+    release_node,
+    renew_leases,
+)
+
+# Constants
+LEASE_TTL = 30  # Seconds a node (or a job lease) stays live without a heartbeat
+HEARTBEAT_INTERVAL = 10  # Seconds between heartbeats; well below LEASE_TTL
+JOB_RUN_RETENTION = 7 * 24 * 3600  # Seconds claimed job runs are kept
+
+
+def rendezvous_rank(job, nodes):
+    """
+    Orders nodes by their highest-random-weight hash for a job. Every node
+    computes the same order, jobs spread evenly over the nodes, and when a
+    node leaves only its jobs move.
+    """
+    def weight(node):
+        digest = hashlib.blake2b(f"{node}|{job}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    return sorted(nodes, key=weight, reverse=True)
+
+
+class LeaseCoordinator:
+    """
+    One scheduler node's view of the pool. Every node keeps all jobs on its
+    timer; when a job falls due, only the live node that ranks first for it
+    tries to run it. The node takes the job's lease, which comes with a
+    fencing token, claims the run (run_key, e.g. the scheduled time) under
+    that token, runs it and then completes the run, releasing the lease.
+    Heartbeats renew only the leases the node still holds with the same
+    token, so a lease outlives its holder by at most LEASE_TTL.
+
+    A run is claimed once while its claimer is alive. If the claimer dies
+    before completing it, its lease expires and a standby that finds the
+    run still not done takes a newer token and claims it again; the old
+    token can then neither complete the run nor release the lease. A node
+    that stops heartbeating drops out of the live set after LEASE_TTL, and
+    the next-ranked node takes over its jobs; a node that joins takes over
+    its share from the next due run on.
+    """
+
+    def __init__(self, node=None, lease_ttl=LEASE_TTL, clock=time.time):
+        self.node = node or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.clock = clock
+        self.leases = {}  # job -> fencing token of each lease this node holds
+        self.claimed = 0
+        self.skipped = 0
+
+    def heartbeat(self):
+        """
+        Marks this node alive and renews the leases it still holds.
+        """
+        now = self.clock()
+        alive = heartbeat_node(self.node, now)
+        if self.leases:
+            renewed = renew_leases(self.node, self.leases.items(), now, now + self.lease_ttl)
+            self.leases = {job: self.leases[job] for job in renewed}
+        return alive
+
+    def live_nodes(self):
+        return get_live_nodes(self.clock() - self.lease_ttl)
+
+    def dead_nodes(self):
+        """
+        Returns the nodes that stopped heartbeating without leaving the pool.
+        """
+        return get_dead_nodes(self.clock() - self.lease_ttl)
+
+    def owner(self, job):
+        """
+        Returns the live node that should run a job, or None if no node is
+        alive.
+        """
+        ranked = rendezvous_rank(job, self.live_nodes())
+        return ranked[0] if ranked else None
+
+    def claim(self, job, run_key):
+        """
+        Tries to claim one run of a job. Returns the fencing token to pass
+        to complete() if this node should run it, otherwise None.
+        """
+        if self.owner(job) != self.node:
+            self.skipped += 1
+            return None
+        now = self.clock()
+        token = acquire_lease(job, self.node, now, now + self.lease_ttl)
+        if token is None:
+            self.skipped += 1
+            return None
+        if not record_job_run(job, run_key, self.node, token, now):
+            release_lease(job, self.node, token)
+            self.skipped += 1
+            return None
+        self.leases[job] = token
+        self.claimed += 1
+        return token
+
+    def complete(self, job, run_key, token):
+        """
+        Marks a claimed run as done and releases its lease. Returns False
+        if another node took the run over in the meantime.
+        """
+        self.leases.pop(job, None)
+        return complete_job_run(job, run_key, self.node, token, self.clock())
+
+    def has_run(self, job, run_key):
+        return has_job_run(job, run_key)
+
+    def prune(self):
+        """
+        Deletes job runs older than JOB_RUN_RETENTION.
+        """
+        return prune_job_runs(self.clock() - JOB_RUN_RETENTION)
+
+    def stop(self):
+        """
+        Leaves the pool, handing this node's jobs over at once.
+        """
+        release_node(self.node)
+
+    def forget(self, node):
+        """
+        Removes a dead node from the pool once its actuator runs are
+        recovered.
+        """
+        release_node(node)
+
+
+# Example usage
+if __name__ == "__main__":
+    from database import initialize_database
+
+    initialize_database()
+    nodes = [LeaseCoordinator(f"node-{i}") for i in range(3)]
+    for node in nodes:
+        node.heartbeat()
+    jobs = [f"schedule-{i}" for i in range(300)]
+    for node in nodes:
+        for job in jobs:
+            token = node.claim(job, "2024-11-19T08:00")
+            if token is not None:
+                node.complete(job, "2024-11-19T08:00", token)
+    print({node.node: node.claimed for node in nodes})
+
+    nodes[0].stop()
+    for node in nodes[1:]:
+        for job in jobs:
+            token = node.claim(job, "2024-11-20T08:00")
+            if token is not None:
+                node.complete(job, "2024-11-20T08:00", token)
+    print({node.node: node.claimed for node in nodes})
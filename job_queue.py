@@ -0,0 +1,145 @@
+# job_queue.py
+# Background job queue with job IDs and de-duplication of in-flight work.
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Constants
+JOB_WORKERS = 2
+MAX_PENDING_JOBS = 100  # Queued + running jobs accepted before rejecting
+JOB_RETENTION = 500  # Finished jobs kept for /jobs/<id> lookups
+
+
+class QueueFullError(RuntimeError):
+    """
+    Raised when a job is submitted while the queue is at capacity.
+    """
+
+
+class Job:
+    def __init__(self, key=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """
+    Runs submitted functions on a fixed worker pool. Jobs submitted with a
+    key that is already queued or running return the existing job instead
+    of doing the work twice.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=MAX_PENDING_JOBS, retention=JOB_RETENTION):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._pending = 0
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, func, *args, key=None, on_done=None, **kwargs):
+        """
+        Queues func(*args, **kwargs). Returns (job, created) where created is
+        False when an identical in-flight job was reused. on_done(job) is
+        called from the worker thread once the job finishes.
+        """
+        with self._lock:
+            if key is not None and key in self._inflight:
+                return self._inflight[key], False
+            if self._pending + self._running >= self.max_pending:
+                raise QueueFullError("Job queue is full. Try again later.")
+            job = Job(key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._inflight[key] = job
+            self._pending += 1
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs, on_done)
+        return job, True
+
+    def _run(self, job, func, args, kwargs, on_done):
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = func(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "error"
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._running -= 1
+                if job.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                if job.key is not None and self._inflight.get(job.key) is job:
+                    del self._inflight[job.key]
+            job.done.set()
+        if on_done is not None:
+            try:
+                on_done(job)
+            except Exception as e:
+                print(f"Error in job callback: {e}")
+
+    def _prune(self):
+        """
+        Forgets the oldest finished jobs beyond the retention limit.
+        """
+        excess = len(self._jobs) - self.retention
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished is not None:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """
+        Returns queue depth and throughput counters.
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._pending,
+                "running": self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,192 @@
+# log_reader.py
+# Constant-time tail, paging and follow for large append-only log files.
+
+import os
+import threading
+import time
+import numpy as np
+
+# Constants
+BLOCK_SIZE = 64 * 1024
+INDEX_INTERVAL = 1000  # Lines between entries of the sparse offset index
+FOLLOW_POLL_INTERVAL = 0.5  # Seconds
+
+
+def _decode(lines):
+    return [line.decode("utf-8", errors="replace") for line in lines]
+
+
+def tail_lines(path, limit=10, block_size=BLOCK_SIZE):
+    """
+    Returns the last `limit` lines of a file (with line endings, like
+    readlines()) by reading fixed-size blocks backwards from EOF.
+    """
+    if limit <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        # limit + 1 newlines guarantee `limit` complete lines are buffered.
+        while position > 0 and data.count(b"\n") <= limit:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            data = f.read(size) + data
+    lines = data.splitlines(keepends=True)
+    return _decode(lines[-limit:])
+
+
+class LogIndex:
+    """
+    Sparse index of byte offsets for every INDEX_INTERVAL-th line. Only the
+    bytes appended since the last refresh are scanned, and a shrinking or
+    replaced file (rotation) resets the index.
+    """
+
+    def __init__(self, path, interval=INDEX_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.offsets = [0]
+        self.lines = 0  # Complete (newline-terminated) lines indexed
+        self.size = 0
+        self.partial = False  # File ends without a newline
+
+    def refresh(self):
+        """
+        Indexes any data appended since the last call.
+        """
+        with self._lock:
+            if not os.path.exists(self.path):
+                self._reset(None)
+                return
+            stat = os.stat(self.path)
+            if stat.st_ino != self.inode or stat.st_size < self.size:
+                self._reset(stat.st_ino)
+            if stat.st_size == self.size:
+                return
+
+            with open(self.path, "rb") as f:
+                f.seek(self.size)
+                position = self.size
+                while True:
+                    block = f.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+                    # Line numbers each newline completes, and the lines that
+                    # land on an index boundary.
+                    completed = self.lines + 1 + np.arange(len(newlines))
+                    boundaries = newlines[completed % self.interval == 0]
+                    self.offsets.extend((position + boundaries + 1).tolist())
+                    self.lines += len(newlines)
+                    position += len(block)
+                    self.partial = block[-1:] != b"\n"
+                self.size = position
+
+    def total_lines(self):
+        self.refresh()
+        return self.lines + (1 if self.partial else 0)
+
+    def read_lines(self, start, count):
+        """
+        Returns `count` lines starting at zero-based line `start`.
+        """
+        self.refresh()
+        if count <= 0 or start < 0:
+            return []
+        with self._lock:
+            slot = min(start // self.interval, len(self.offsets) - 1)
+            offset = self.offsets[slot]
+        skip = start - slot * self.interval
+        lines = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for _ in range(skip):
+                if not f.readline():
+                    return []
+            for _ in range(count):
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line)
+        return _decode(lines)
+
+    def read_page(self, page=0, page_size=100):
+        """
+        Returns (lines, total_lines) for a page counted back from the end of
+        the file: page 0 is the newest `page_size` lines.
+        """
+        total = self.total_lines()
+        end = total - page * page_size
+        if end <= 0:
+            return [], total
+        start = max(0, end - page_size)
+        return self.read_lines(start, end - start), total
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_log_index(path):
+    """
+    Returns the shared LogIndex for a file path.
+    """
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = LogIndex(path)
+        return _indexes[key]
+
+
+def follow(path, from_end=True, poll_interval=FOLLOW_POLL_INTERVAL, idle_timeout=None):
+    """
+    Yields lines as they are appended to a file, like `tail -f`. Rotation
+    or truncation is detected and reading restarts at the new file's start.
+    With idle_timeout, None is yielded after that many idle seconds so
+    callers (e.g. HTTP streams) can send keep-alives or notice disconnects.
+    """
+    handle, inode = None, None
+    idle_since = time.monotonic()
+    try:
+        while True:
+            if handle is None and os.path.exists(path):
+                handle = open(path, "rb")
+                inode = os.fstat(handle.fileno()).st_ino
+                if from_end:
+                    handle.seek(0, os.SEEK_END)
+                from_end = False  # Files that appear later are read from the start
+
+            line = handle.readline() if handle else b""
+            if line.endswith(b"\n"):
+                idle_since = time.monotonic()
+                yield line.decode("utf-8", errors="replace")
+                continue
+            if line:
+                # Incomplete line: rewind and wait for the writer to finish it.
+                handle.seek(-len(line), os.SEEK_CUR)
+
+            if handle is not None:
+                try:
+                    stat = os.stat(path)
+                    rotated = stat.st_ino != inode or stat.st_size < handle.tell()
+                except FileNotFoundError:
+                    rotated = True
+                if rotated:
+                    handle.close()
+                    handle = None
+                    continue
+
+            if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                idle_since = time.monotonic()
+                yield None
+            time.sleep(poll_interval)
+    finally:
+        if handle is not None:
+            handle.close()
@@ -2,16 +2,42 @@
 # Script for training the AI model for plant health analysis.
 
 import os
+import sys
+import time
+import numpy as np
 import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+from tensorflow.keras.models import Sequential, load_model
+from tensorflow.keras.layers import (
+    Conv2D,
+    SeparableConv2D,
+    MaxPooling2D,
+    GlobalAveragePooling2D,
+    Flatten,
+    Dense,
+    Dropout,
+)
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
+from data_pipeline import augmentation_layers, create_tf_datasets, measure_input_stall
+from dataset_cache import build_dataset_cache
+from training_profiler import (
+    TimedSequence,
+    TrainingProfiler,
+    PROFILE_REPORT_FILE,
+    load_report,
+)
+from numpy_inference import (
+    NumpyCNN,
+    NUMPY_MODEL_PATH,
+    COMPACT_NUMPY_MODEL_PATH,
+    export_from_checkpoint,
+)
 
 # Directories for training and validation data
 TRAINING_DIR = "data/train"
 VALIDATION_DIR = "data/validation"
 MODEL_SAVE_PATH = "plant_ai_model.h5"
+COMPACT_MODEL_SAVE_PATH = "plant_ai_model_compact.h5"
 
 # Training parameters
 IMG_HEIGHT = 224
@@ -19,6 +45,7 @@ IMG_WIDTH = 224
 BATCH_SIZE = 32
 EPOCHS = 20
 CLASS_NAMES = ["Healthy", "Diseased", "Needs Water", "Low Light"]
+BENCHMARK_IMAGES = 64
 
 # Data augmentation and preprocessing
 def create_data_generators():
@@ -78,36 +105,218 @@ def build_model():
     return model
 
 
+def build_compact_model():
+    """
+    Builds a lightweight CNN that uses depthwise-separable convolutions and
+    global average pooling instead of Flatten -> Dense(512).
+    """
+    model = Sequential(
+        [
+            Conv2D(32, (3, 3), strides=2, activation="relu", input_shape=(IMG_HEIGHT, IMG_WIDTH, 3)),
+            SeparableConv2D(64, (3, 3), activation="relu"),
+            MaxPooling2D(2, 2),
+            SeparableConv2D(128, (3, 3), activation="relu"),
+            MaxPooling2D(2, 2),
+            SeparableConv2D(256, (3, 3), activation="relu"),
+            MaxPooling2D(2, 2),
+            SeparableConv2D(256, (3, 3), activation="relu"),
+            GlobalAveragePooling2D(),
+            Dropout(0.3),
+            Dense(len(CLASS_NAMES), activation="softmax"),
+        ]
+    )
+    model.compile(
+        optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"]
+    )
+    return model
+
+
+# Selectable architectures: builder, Keras checkpoint and exported NumPy model
+MODEL_ARCHITECTURES = {
+    "baseline": (build_model, MODEL_SAVE_PATH, NUMPY_MODEL_PATH),
+    "compact": (build_compact_model, COMPACT_MODEL_SAVE_PATH, COMPACT_NUMPY_MODEL_PATH),
+}
+
+
+class ShardSequence(tf.keras.utils.Sequence):
+    """
+    Keras Sequence over a dataset_cache.ShardedDataset. Batches are read from
+    the memory-mapped shards, rescaled to [0, 1] and one-hot encoded; training
+    batches are shuffled each epoch and augmented like the other pipelines
+    (flip, rotation, shift, zoom).
+    """
+
+    def __init__(self, dataset, batch_size=BATCH_SIZE, training=False, seed=0):
+        super().__init__()
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.training = training
+        self.rng = np.random.default_rng(seed)
+        self.order = np.arange(len(dataset))
+        self.num_classes = len(dataset.class_names)
+        self.augment = augmentation_layers() if training else None
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(np.ceil(len(self.dataset) / self.batch_size))
+
+    def __getitem__(self, index):
+        batch = self.order[index * self.batch_size:(index + 1) * self.batch_size]
+        images, labels = self.dataset.get(np.sort(batch))
+        images = images.astype(np.float32) / 255.0
+        if self.augment is not None:
+            images = self.augment(images, training=True).numpy()
+        return images, np.eye(self.num_classes, dtype=np.float32)[labels]
+
+    def on_epoch_end(self):
+        if self.training:
+            self.rng.shuffle(self.order)
+
+
+# Input pipelines
+def create_training_data(pipeline="generator"):
+    """
+    Creates training and validation data for the selected input pipeline:
+    "generator" (Keras ImageDataGenerator), "tfdata" (cached, parallel
+    tf.data) or "shards" (memory-mapped .npy shard cache).
+    Returns (train_data, validation_data, class_names).
+    """
+    if pipeline == "shards":
+        train_set, val_set = build_dataset_cache(
+            TRAINING_DIR, VALIDATION_DIR, (IMG_HEIGHT, IMG_WIDTH)
+        )
+        for directory, split in ((TRAINING_DIR, train_set), (VALIDATION_DIR, val_set)):
+            if not len(split):
+                raise ValueError(f"No images found in {directory}.")
+        return (
+            ShardSequence(train_set, training=True),
+            ShardSequence(val_set),
+            train_set.class_names,
+        )
+    if pipeline == "tfdata":
+        return create_tf_datasets(
+            TRAINING_DIR, VALIDATION_DIR, (IMG_HEIGHT, IMG_WIDTH), BATCH_SIZE
+        )
+    if pipeline == "generator":
+        train_gen, val_gen = create_data_generators()
+        class_names = sorted(train_gen.class_indices, key=train_gen.class_indices.get)
+        return train_gen, val_gen, class_names
+    raise ValueError(f"Unknown input pipeline: {pipeline}")
+
+
 # Training the model
-def train_model():
+def train_model(architecture="baseline", pipeline="generator", report_stall=False, profile=False):
     """
-    Trains the CNN model and saves the best version.
+    Trains the selected CNN architecture and saves the best version.
+    With report_stall, measures input-pipeline stall time before training.
+    With profile, writes a throughput report and flags regressions against
+    the stored baseline (see training_profiler.py).
     """
-    train_gen, val_gen = create_data_generators()
-    model = build_model()
+    if architecture not in MODEL_ARCHITECTURES:
+        raise ValueError(f"Unknown architecture: {architecture}")
+    builder, save_path, numpy_path = MODEL_ARCHITECTURES[architecture]
+
+    train_data, val_data, class_names = create_training_data(pipeline)
+    model = builder()
+    stall_report = None
+    if report_stall or (profile and pipeline == "tfdata"):
+        stall_report = measure_input_stall(model, train_data)
 
     # Callbacks for saving the best model and early stopping
     checkpoint = ModelCheckpoint(
-        MODEL_SAVE_PATH, monitor="val_accuracy", save_best_only=True, verbose=1
+        save_path, monitor="val_accuracy", save_best_only=True, verbose=1
     )
     early_stop = EarlyStopping(monitor="val_loss", patience=5, verbose=1)
+    callbacks = [checkpoint, early_stop]
+
+    if profile:
+        input_source = None
+        if isinstance(train_data, tf.keras.utils.Sequence):
+            train_data = input_source = TimedSequence(train_data)
+        callbacks.append(
+            TrainingProfiler(
+                BATCH_SIZE,
+                input_source=input_source,
+                stall_sec_per_step=stall_report["stall_sec_per_step"] if stall_report else None,
+                tags={"architecture": architecture, "pipeline": pipeline},
+            )
+        )
 
     # Train the model
     history = model.fit(
-        train_gen,
+        train_data,
         epochs=EPOCHS,
-        validation_data=val_gen,
-        callbacks=[checkpoint, early_stop],
+        validation_data=val_data,
+        callbacks=callbacks,
     )
 
-    print("Training complete. Model saved at:", MODEL_SAVE_PATH)
+    print("Training complete. Model saved at:", save_path)
+
+    # Export the best checkpoint for TensorFlow-free inference
+    export_from_checkpoint(save_path, numpy_path, class_names)
     return history
 
 
+# Comparing architectures
+def measure_throughput(predict, batch, repeats=3):
+    """
+    Returns images/sec for a predict function on a fixed batch, after one
+    warm-up call.
+    """
+    predict(batch)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict(batch)
+    return repeats * len(batch) / (time.perf_counter() - start)
+
+
+def compare_architectures(architectures=None, benchmark_images=BENCHMARK_IMAGES):
+    """
+    Reports parameter count, model file size, CPU images/sec (Keras and the
+    NumPy engine) and validation accuracy for each trained architecture.
+    """
+    architectures = architectures or list(MODEL_ARCHITECTURES)
+    _, val_gen = create_data_generators()
+    batch = np.random.rand(benchmark_images, IMG_HEIGHT, IMG_WIDTH, 3).astype(np.float32)
+
+    results = []
+    for name in architectures:
+        _, save_path, numpy_path = MODEL_ARCHITECTURES[name]
+        if not os.path.exists(save_path):
+            print(f"Skipping {name}: {save_path} not found. Train it first.")
+            continue
+
+        model = load_model(save_path)
+        _, val_accuracy = model.evaluate(val_gen, verbose=0)
+        result = {
+            "architecture": name,
+            "parameters": model.count_params(),
+            "file_mb": os.path.getsize(save_path) / 1e6,
+            "keras_images_per_sec": measure_throughput(model.predict_on_batch, batch),
+            "numpy_images_per_sec": None,
+            "val_accuracy": float(val_accuracy),
+        }
+        if os.path.exists(numpy_path):
+            numpy_model = NumpyCNN.load(numpy_path)
+            result["numpy_images_per_sec"] = measure_throughput(numpy_model.predict, batch, repeats=1)
+        results.append(result)
+
+    print(f"\n{'architecture':<14}{'params':>12}{'file MB':>10}{'keras img/s':>13}{'numpy img/s':>13}{'val acc':>9}")
+    for result in results:
+        numpy_speed = result["numpy_images_per_sec"]
+        numpy_column = f"{numpy_speed:>13.1f}" if numpy_speed is not None else f"{'-':>13}"
+        print(
+            f"{result['architecture']:<14}{result['parameters']:>12,}{result['file_mb']:>10.1f}"
+            f"{result['keras_images_per_sec']:>13.1f}{numpy_column}{result['val_accuracy']:>9.4f}"
+        )
+    return results
+
+
 # Visualizing training results
-def plot_training_results(history):
+def plot_training_results(history, profile_report=None):
     """
-    Plots training and validation accuracy and loss.
+    Plots training and validation accuracy and loss, plus training
+    throughput per epoch when a profile report is given.
     """
     import matplotlib.pyplot as plt
 
@@ -117,23 +326,35 @@ def plot_training_results(history):
     val_loss = history.history["val_loss"]
 
     epochs = range(len(acc))
+    panels = 3 if profile_report else 2
 
-    plt.figure(figsize=(12, 6))
+    plt.figure(figsize=(6 * panels, 6))
 
     # Accuracy plot
-    plt.subplot(1, 2, 1)
+    plt.subplot(1, panels, 1)
     plt.plot(epochs, acc, label="Training Accuracy")
     plt.plot(epochs, val_acc, label="Validation Accuracy")
     plt.title("Training and Validation Accuracy")
     plt.legend()
 
     # Loss plot
-    plt.subplot(1, 2, 2)
+    plt.subplot(1, panels, 2)
     plt.plot(epochs, loss, label="Training Loss")
     plt.plot(epochs, val_loss, label="Validation Loss")
     plt.title("Training and Validation Loss")
     plt.legend()
 
+    # Throughput plot
+    if profile_report:
+        plt.subplot(1, panels, 3)
+        plt.plot(
+            [epoch["epoch"] - 1 for epoch in profile_report["epochs"]],
+            [epoch["images_per_sec"] for epoch in profile_report["epochs"]],
+            label="Images/sec",
+        )
+        plt.title("Training Throughput")
+        plt.legend()
+
     plt.show()
 
 
@@ -143,6 +364,12 @@ if __name__ == "__main__":
         print("Training and validation data directories are missing.")
         exit(1)
 
-    print("Starting training...")
-    history = train_model()
-    plot_training_results(history)
\ No newline at end of file
+    # Usage: python ml_training.py [baseline|compact|compare] [generator|tfdata|shards]
+    command = sys.argv[1] if len(sys.argv) > 1 else "baseline"
+    pipeline = sys.argv[2] if len(sys.argv) > 2 else "generator"
+    if command == "compare":
+        compare_architectures()
+    else:
+        print(f"Starting training ({command} architecture, {pipeline} pipeline)...")
+        history = train_model(command, pipeline, report_stall=pipeline == "tfdata", profile=True)
+        plot_training_results(history, load_report(PROFILE_REPORT_FILE))
\ No newline at end of file
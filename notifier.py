@@ -1,47 +1,360 @@
 # notifier.py
 # Handles notifications for the Plant Monitoring System.
 
+import atexit
+import heapq
+import itertools
+import random
+import re
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from telegram import Bot
+from telegram.error import BadRequest, InvalidToken, Unauthorized
 from config import TELEGRAM_BOT_TOKEN
+from utilities import RateLimiter
+
+# Constants
+SMTP_SERVER = "smtp.gmail.com"
+SMTP_PORT = 587
+SMTP_TIMEOUT = 30  # Seconds
+SENDER_EMAIL = "your-email@gmail.com"
+SENDER_PASSWORD = "your-email-password"
+# (messages per second, burst) per channel
+RATE_LIMITS = {
+    "telegram": (25, 25),
+    "email": (1, 5),
+}
+COALESCE_WINDOW = 300  # Seconds during which similar alerts are merged into a digest
+MAX_RETRIES = 5
+RETRY_BACKOFF = 2  # Seconds before the first retry; doubles on each attempt
+MAX_RETRY_DELAY = 300  # Seconds
+SHUTDOWN_TIMEOUT = 5  # Seconds to finish queued messages at exit
+# A number not glued to a preceding name, e.g. "28", "25.5" or "-3"
+NUMERIC_READING = re.compile(r"(?<![a-z_#\d.])\d+(?:\.\d+)?")
+
+
+# Channel clients
+class TelegramClient:
+    """
+    Sends messages through one long-lived Bot instance.
+    """
+
+    # Errors that retrying cannot fix
+    permanent_errors = (InvalidToken, Unauthorized, BadRequest)
+
+    def __init__(self, bot_factory=None):
+        self._factory = bot_factory or (lambda: Bot(token=TELEGRAM_BOT_TOKEN))
+        self._bot = None
+
+    def send(self, recipient, subject, body):
+        if self._bot is None:
+            self._bot = self._factory()
+        self._bot.send_message(chat_id=recipient, text=body)
+
+    def close(self):
+        self._bot = None
+
+
+class EmailClient:
+    """
+    Sends emails over one persistent SMTP connection, doing STARTTLS and
+    login only when (re)connecting.
+    """
+
+    permanent_errors = (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused)
+
+    def __init__(self, smtp_factory=None, sender=SENDER_EMAIL, password=SENDER_PASSWORD):
+        self._factory = smtp_factory or (lambda: smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT))
+        self.sender = sender
+        self.password = password
+        self._server = None
+
+    def _connect(self):
+        server = self._factory()
+        server.starttls()
+        server.login(self.sender, self.password)
+        self._server = server
+
+    def send(self, recipient, subject, body):
+        msg = MIMEMultipart()
+        msg["From"] = self.sender
+        msg["To"] = recipient
+        msg["Subject"] = subject or "Plant Monitoring System Alert"
+        msg.attach(MIMEText(body, "plain"))
+
+        # A connection the server closed while idle is reopened once.
+        for attempt in range(2):
+            if self._server is None:
+                self._connect()
+            try:
+                self._server.sendmail(self.sender, recipient, msg.as_string())
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+
+class Notification:
+    def __init__(self, channel, recipient, subject, body):
+        self.channel = channel
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.attempts = 0
+
+
+class ChannelWorker:
+    """
+    Sends one channel's notifications on its own thread, holding back to
+    the channel's rate limit and retrying transient failures with
+    exponential backoff. Scheduled callables (digest flushes) run on the
+    same thread.
+    """
+
+    def __init__(self, name, client, limiter, clock=time.monotonic, retry_backoff=RETRY_BACKOFF):
+        self.name = name
+        self.client = client
+        self.limiter = limiter
+        self.clock = clock
+        self.retry_backoff = retry_backoff
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._busy = False
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._thread = threading.Thread(target=self._run, name=f"notifier-{name}", daemon=True)
+        self._thread.start()
+
+    def schedule(self, item, delay=0):
+        with self._condition:
+            heapq.heappush(self._heap, (self.clock() + delay, next(self._counter), item))
+            self._condition.notify_all()
+
+    def _queued(self):
+        return sum(1 for entry in self._heap if not callable(entry[2]))
+
+    def pending(self):
+        """
+        Returns the number of notifications queued or being sent.
+        """
+        with self._condition:
+            return self._queued() + (1 if self._busy else 0)
+
+    def _next_item(self):
+        with self._condition:
+            while self._running:
+                if self._heap:
+                    wait = self._heap[0][0] - self.clock()
+                    if wait <= 0:
+                        self._busy = True
+                        return heapq.heappop(self._heap)[2]
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+            return None
+
+    def _run(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+            try:
+                if callable(item):
+                    item()
+                else:
+                    self._deliver(item)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _deliver(self, notification):
+        wait = self.limiter.try_acquire()
+        if wait:
+            self.schedule(notification, wait)
+            return
+        try:
+            self.client.send(notification.recipient, notification.subject, notification.body)
+            self.sent += 1
+            print(f"{self.name.capitalize()} notification sent to {notification.recipient}.")
+        except Exception as e:
+            notification.attempts += 1
+            if isinstance(e, getattr(self.client, "permanent_errors", ())) or notification.attempts > MAX_RETRIES:
+                self.failed += 1
+                print(f"Error sending {self.name} notification: {e}")
+                return
+            self.retried += 1
+            delay = getattr(e, "retry_after", None)
+            if delay is None:
+                delay = min(self.retry_backoff * 2 ** (notification.attempts - 1), MAX_RETRY_DELAY)
+                delay *= random.uniform(0.8, 1.2)
+            self.schedule(notification, delay)
+
+    def wait_idle(self, timeout=None):
+        """
+        Waits until no notification is queued or being sent. Returns False
+        on timeout.
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        with self._condition:
+            while self._queued() or self._busy:
+                remaining = None if deadline is None else deadline - self.clock()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        self.client.close()
+
+
+def _similarity_key(message):
+    """
+    Alerts that differ only in their readings ("Plant1 soil moisture 28%"
+    and "Plant1 soil moisture 27%") share a key. Only standalone numbers
+    are masked; digits attached to a name ("Plant1", "node_2") identify
+    what the alert is about and are kept.
+    """
+    return NUMERIC_READING.sub("#", message.lower()).strip()
+
+
+class NotificationDispatcher:
+    """
+    Queues notifications for background delivery over persistent,
+    rate-limited channel clients. The first alert of a kind is sent at
+    once; similar alerts to the same recipient within the coalescing
+    window are merged into one digest sent when the window closes.
+    """
+
+    def __init__(self, clients=None, rate_limits=RATE_LIMITS, window=COALESCE_WINDOW,
+                 clock=time.monotonic, retry_backoff=RETRY_BACKOFF):
+        clients = clients or {"telegram": TelegramClient(), "email": EmailClient()}
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._digests = {}
+        self.coalesced = 0
+        self.workers = {
+            name: ChannelWorker(name, client, RateLimiter(*rate_limits[name], clock=clock), clock, retry_backoff)
+            for name, client in clients.items()
+        }
+
+    def notify(self, channel, recipient, message, subject=None, key=None):
+        """
+        Queues a notification. Returns False if it was merged into a digest.
+        """
+        worker = self.workers[channel]
+        digest_key = (channel, recipient, key or _similarity_key(message))
+        with self._lock:
+            digest = self._digests.get(digest_key)
+            if digest is not None:
+                digest["messages"].append(message)
+                self.coalesced += 1
+                return False
+            self._digests[digest_key] = {"subject": subject, "messages": []}
+        worker.schedule(Notification(channel, recipient, subject, message))
+        worker.schedule(lambda: self._send_digest(digest_key), self.window)
+        return True
+
+    def _send_digest(self, digest_key):
+        with self._lock:
+            digest = self._digests.pop(digest_key, None)
+        if not digest or not digest["messages"]:
+            return
+        channel, recipient, _ = digest_key
+        messages = digest["messages"]
+        body = (
+            f"{len(messages)} more similar alert(s) in the last {self.window} seconds. "
+            f"Latest: {messages[-1]}"
+        )
+        subject = f"Digest: {digest['subject']}" if digest["subject"] else None
+        self.workers[channel].schedule(Notification(channel, recipient, subject, body))
+
+    def flush_digests(self):
+        """
+        Sends all open digests now instead of at the end of their windows.
+        """
+        with self._lock:
+            keys = list(self._digests)
+        for digest_key in keys:
+            self._send_digest(digest_key)
+
+    def stats(self):
+        stats = {
+            name: {
+                "pending": worker.pending(),
+                "sent": worker.sent,
+                "failed": worker.failed,
+                "retried": worker.retried,
+            }
+            for name, worker in self.workers.items()
+        }
+        stats["coalesced"] = self.coalesced
+        return stats
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Sends open digests, waits up to timeout for queued messages and
+        stops the workers.
+        """
+        self.flush_digests()
+        deadline = self.clock() + timeout
+        for worker in self.workers.values():
+            worker.wait_idle(max(0, deadline - self.clock()))
+            worker.stop()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    Returns the shared dispatcher, starting it on first use.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher()
+            atexit.register(_dispatcher.close)
+        return _dispatcher
 
 # Telegram notifications
 def send_telegram_notification(chat_id, message):
     """
-    Sends a notification via Telegram.
+    Queues a notification via Telegram.
     """
     try:
-        bot = Bot(token=TELEGRAM_BOT_TOKEN)
-        bot.send_message(chat_id=chat_id, text=message)
-        print(f"Telegram notification sent to {chat_id}: {message}")
+        get_dispatcher().notify("telegram", chat_id, message)
     except Exception as e:
         print(f"Error sending Telegram notification: {e}")
 
 # Email notifications
 def send_email_notification(to_email, subject, message):
     """
-    Sends a notification via Email.
+    Queues a notification via Email.
     """
     try:
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
-        sender_email = "your-email@gmail.com"
-        sender_password = "your-email-password"
-
-        msg = MIMEMultipart()
-        msg["From"] = sender_email
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(message, "plain"))
-
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, to_email, msg.as_string())
-
-        print(f"Email notification sent to {to_email}: {subject}")
+        get_dispatcher().notify("email", to_email, message, subject=subject)
     except Exception as e:
         print(f"Error sending email notification: {e}")
 
@@ -57,4 +370,4 @@ if __name__ == "__main__":
         recipient_email,
         "Plant Monitoring System Alert",
         "Your plants need watering!"
-    )
\ No newline at end of file
+    )
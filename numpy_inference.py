@@ -0,0 +1,390 @@
+# numpy_inference.py
+# NumPy-only CPU inference for the CNN trained in ml_training.py.
+
+import json
+import os
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Constants
+NUMPY_MODEL_PATH = "plant_ai_model.npz"
+COMPACT_NUMPY_MODEL_PATH = "plant_ai_model_compact.npz"
+DEFAULT_BATCH_SIZE = 8
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+CLASS_NAMES = ["Healthy", "Diseased", "Needs Water", "Low Light"]
+
+
+# Layer primitives
+def _pad_same(x, kernel_size, strides, value=0.0):
+    """
+    Pads an NHWC batch the way TensorFlow does for padding="same".
+    """
+    pads = []
+    for size, k, s in zip(x.shape[1:3], kernel_size, strides):
+        out = -(-size // s)
+        total = max((out - 1) * s + k - size, 0)
+        pads.append((total // 2, total - total // 2))
+    return np.pad(x, ((0, 0), pads[0], pads[1], (0, 0)), constant_values=value)
+
+
+def _windows(x, kernel_size, strides, padding):
+    """
+    Returns a strided (N, H', W', C, kh, kw) view of the input patches.
+    """
+    if padding == "same":
+        x = _pad_same(x, kernel_size, strides)
+    windows = sliding_window_view(x, kernel_size, axis=(1, 2))
+    return windows[:, ::strides[0], ::strides[1]]
+
+
+def im2col(x, kernel_size, strides=(1, 1), padding="valid"):
+    """
+    Builds the (N*H'*W', kh*kw*C) patch matrix for a convolution, ordered to
+    line up with a Keras kernel reshaped to (kh*kw*C, out_channels).
+    """
+    kh, kw = kernel_size
+    if (kh, kw) == (1, 1) and tuple(strides) == (1, 1):
+        n, h, w, c = x.shape
+        return x.reshape(n * h * w, c), (n, h, w)
+    windows = _windows(x, (kh, kw), strides, padding)
+    patches = windows.transpose(0, 1, 2, 4, 5, 3)
+    n, h, w = patches.shape[:3]
+    return patches.reshape(n * h * w, -1), (n, h, w)
+
+
+def conv2d(x, kernel, bias=None, strides=(1, 1), padding="valid"):
+    """
+    2D convolution (im2col over a stride-tricks view) for NHWC inputs.
+    The kernel uses the Keras layout (kh, kw, in_channels, out_channels).
+    """
+    kh, kw, in_channels, out_channels = kernel.shape
+    patches, (n, h, w) = im2col(x, (kh, kw), strides, padding)
+    out = (patches @ kernel.reshape(-1, out_channels)).reshape(n, h, w, out_channels)
+    if bias is not None:
+        out += bias
+    return out
+
+
+def depthwise_conv2d(x, kernel, bias=None, strides=(1, 1), padding="valid"):
+    """
+    Depthwise convolution for NHWC inputs. The kernel uses the Keras layout
+    (kh, kw, in_channels, depth_multiplier); output channel c * m + k comes
+    from input channel c, as in TensorFlow.
+    """
+    kh, kw, in_channels, multiplier = kernel.shape
+    windows = _windows(x, (kh, kw), strides, padding)
+    out = np.einsum("nhwcab,abcm->nhwcm", windows, kernel, optimize=True)
+    out = out.reshape(*out.shape[:3], in_channels * multiplier)
+    if bias is not None:
+        out += bias
+    return out
+
+
+def max_pool2d(x, pool_size=(2, 2), strides=None, padding="valid"):
+    """
+    Max pooling for NHWC inputs.
+    """
+    strides = tuple(strides or pool_size)
+    ph, pw = pool_size
+    if padding == "valid" and strides == (ph, pw):
+        n, h, w, c = x.shape
+        h, w = h // ph, w // pw
+        x = x[:, :h * ph, :w * pw]
+        return x.reshape(n, h, ph, w, pw, c).max(axis=(2, 4))
+    if padding == "same":
+        # Pad with -inf so padded cells never win the max.
+        x = _pad_same(x, pool_size, strides, value=-np.inf)
+    windows = _windows(x, pool_size, strides, "valid")
+    return windows.max(axis=(4, 5))
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def softmax(x):
+    x = x - x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": relu,
+    "softmax": softmax,
+    "sigmoid": sigmoid,
+}
+
+
+# Model
+class NumpyCNN:
+    """
+    Runs a forward pass described by a list of layer specs and weight arrays
+    exported from a Keras Sequential model.
+    """
+
+    def __init__(self, layers, weights, class_names=None, input_shape=None):
+        self.layers = layers
+        self.weights = weights
+        self.class_names = class_names or CLASS_NAMES
+        self.input_shape = tuple(input_shape) if input_shape else None
+
+    @classmethod
+    def load(cls, path=NUMPY_MODEL_PATH):
+        """
+        Loads a model exported with export_numpy_weights().
+        """
+        with np.load(path, allow_pickle=False) as archive:
+            meta = json.loads(str(archive["meta"]))
+            weights = {key: archive[key] for key in archive.files if key != "meta"}
+        print(f"NumPy model loaded from {path} ({len(meta['layers'])} layers).")
+        return cls(meta["layers"], weights, meta.get("class_names"), meta.get("input_shape"))
+
+    def save(self, path=NUMPY_MODEL_PATH):
+        """
+        Saves the layer specs and weights to a compressed .npz archive.
+        """
+        meta = {
+            "layers": self.layers,
+            "class_names": self.class_names,
+            "input_shape": list(self.input_shape) if self.input_shape else None,
+        }
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), **self.weights)
+        print(f"NumPy model saved to {path}.")
+
+    def param(self, index, name):
+        return self.weights[f"{index}/{name}"]
+
+    def forward(self, batch):
+        """
+        Runs the network on an (N, H, W, C) float batch.
+        """
+        x = np.asarray(batch, dtype=np.float32)
+        for index, spec in enumerate(self.layers):
+            x = self._run_layer(index, spec, x)
+        return x
+
+    def _run_layer(self, index, spec, x):
+        kind = spec["type"]
+        if kind == "conv2d":
+            x = conv2d(
+                x,
+                self.param(index, "kernel"),
+                self.param(index, "bias"),
+                spec.get("strides", (1, 1)),
+                spec.get("padding", "valid"),
+            )
+        elif kind == "depthwise_conv2d":
+            x = depthwise_conv2d(
+                x,
+                self.param(index, "depthwise_kernel"),
+                self.weights.get(f"{index}/bias"),
+                spec.get("strides", (1, 1)),
+                spec.get("padding", "valid"),
+            )
+        elif kind == "separable_conv2d":
+            x = depthwise_conv2d(
+                x,
+                self.param(index, "depthwise_kernel"),
+                None,
+                spec.get("strides", (1, 1)),
+                spec.get("padding", "valid"),
+            )
+            x = conv2d(x, self.param(index, "pointwise_kernel"), self.weights.get(f"{index}/bias"))
+        elif kind == "maxpool":
+            x = max_pool2d(x, spec["pool_size"], spec.get("strides"), spec.get("padding", "valid"))
+        elif kind == "global_avgpool":
+            x = x.mean(axis=(1, 2))
+        elif kind == "flatten":
+            x = x.reshape(x.shape[0], -1)
+        elif kind == "dense":
+            x = x @ self.param(index, "kernel") + self.param(index, "bias")
+        else:
+            raise ValueError(f"Unsupported layer type: {kind}")
+        return ACTIVATIONS[spec.get("activation", "linear")](x)
+
+    def predict(self, image_array, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Predicts class probabilities. A single (H, W, C) image returns a 1-D
+        array; an (N, H, W, C) batch returns an (N, classes) array.
+        """
+        images = np.asarray(image_array, dtype=np.float32)
+        single = images.ndim == 3
+        if single:
+            images = images[np.newaxis]
+        outputs = [
+            self.forward(images[start:start + batch_size])
+            for start in range(0, len(images), batch_size)
+        ]
+        predictions = np.concatenate(outputs, axis=0)
+        return predictions[0] if single else predictions
+
+
+# Image loading
+def load_image(image_path, image_size=(224, 224), rescale=True):
+    """
+    Loads an image as a float32 (H, W, 3) array scaled to [0, 1], resized
+    with nearest-neighbour interpolation like Keras' load_img. With
+    rescale=False the raw uint8 pixels are returned.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as image:
+        image = image.convert("RGB").resize((image_size[1], image_size[0]), Image.NEAREST)
+        pixels = np.asarray(image, dtype=np.uint8)
+    return pixels.astype(np.float32) / 255.0 if rescale else pixels
+
+
+def list_image_files(directory):
+    """
+    Lists images in a class-per-subdirectory tree (the flow_from_directory
+    layout). Labels follow the sorted subdirectory names, as in Keras.
+    Returns (samples, class_names) where samples is a list of (path, label).
+    """
+    class_names = sorted(
+        name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))
+    )
+    samples = []
+    for label, name in enumerate(class_names):
+        class_dir = os.path.join(directory, name)
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(class_dir, filename), label))
+    return samples, class_names
+
+
+def load_image_directory(directory, image_size=(224, 224), limit=None, seed=0):
+    """
+    Loads images from a class-per-subdirectory tree into memory.
+    Returns (images, labels, class_names).
+    """
+    samples, class_names = list_image_files(directory)
+
+    if limit is not None and limit < len(samples):
+        rng = np.random.default_rng(seed)
+        picks = rng.choice(len(samples), size=limit, replace=False)
+        samples = [samples[i] for i in sorted(picks)]
+
+    images = np.empty((len(samples), *image_size, 3), dtype=np.float32)
+    labels = np.empty(len(samples), dtype=np.int64)
+    for i, (path, label) in enumerate(samples):
+        images[i] = load_image(path, image_size)
+        labels[i] = label
+    return images, labels, class_names
+
+
+# Export from Keras
+def _keras_layer_spec(layer):
+    """
+    Converts a Keras layer into a (spec, weights) pair, or None to skip it.
+    """
+    kind = type(layer).__name__
+    config = layer.get_config()
+    if kind == "Conv2D":
+        kernel, bias = layer.get_weights()
+        spec = {
+            "type": "conv2d",
+            "activation": config["activation"],
+            "strides": list(config["strides"]),
+            "padding": config["padding"],
+        }
+        return spec, {"kernel": kernel, "bias": bias}
+    if kind in ("DepthwiseConv2D", "SeparableConv2D"):
+        arrays = layer.get_weights()
+        names = ["depthwise_kernel"]
+        if kind == "SeparableConv2D":
+            names.append("pointwise_kernel")
+        if config["use_bias"]:
+            names.append("bias")
+        spec = {
+            "type": "depthwise_conv2d" if kind == "DepthwiseConv2D" else "separable_conv2d",
+            "activation": config["activation"],
+            "strides": list(config["strides"]),
+            "padding": config["padding"],
+        }
+        return spec, dict(zip(names, arrays))
+    if kind == "MaxPooling2D":
+        spec = {
+            "type": "maxpool",
+            "pool_size": list(config["pool_size"]),
+            "strides": list(config["strides"] or config["pool_size"]),
+            "padding": config["padding"],
+        }
+        return spec, {}
+    if kind == "GlobalAveragePooling2D":
+        return {"type": "global_avgpool"}, {}
+    if kind == "Flatten":
+        return {"type": "flatten"}, {}
+    if kind == "Dense":
+        kernel, bias = layer.get_weights()
+        return {"type": "dense", "activation": config["activation"]}, {"kernel": kernel, "bias": bias}
+    if kind in ("Dropout", "InputLayer"):
+        return None
+    raise ValueError(f"Cannot export layer {layer.name} of type {kind}.")
+
+
+def export_numpy_weights(keras_model, path=NUMPY_MODEL_PATH, class_names=None):
+    """
+    Dumps the weights of a trained Keras model to a .npz archive that
+    NumpyCNN can run without TensorFlow.
+    """
+    layers, weights = [], {}
+    for layer in keras_model.layers:
+        converted = _keras_layer_spec(layer)
+        if converted is None:
+            continue
+        spec, arrays = converted
+        index = len(layers)
+        layers.append(spec)
+        for name, array in arrays.items():
+            weights[f"{index}/{name}"] = np.asarray(array, dtype=np.float32)
+
+    model = NumpyCNN(layers, weights, class_names, keras_model.input_shape[1:])
+    model.save(path)
+    return model
+
+
+def export_from_checkpoint(checkpoint_path, path=NUMPY_MODEL_PATH, class_names=None):
+    """
+    Loads a Keras .h5 checkpoint and exports it. This is the only function in
+    this module that imports TensorFlow.
+    """
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(checkpoint_path)
+    return export_numpy_weights(keras_model, path, class_names)
+
+
+def compare_with_keras(numpy_model, keras_model, images, atol=1e-4):
+    """
+    Runs both models on the same images and reports the largest difference
+    in predicted probabilities and the top-1 agreement.
+    """
+    expected = keras_model.predict(images, verbose=0)
+    actual = numpy_model.predict(images)
+    max_diff = float(np.abs(expected - actual).max())
+    agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+    print(f"Max probability difference: {max_diff:.2e}, top-1 agreement: {agreement:.2%}")
+    return {"max_diff": max_diff, "agreement": agreement, "within_tolerance": max_diff <= atol}
+
+
+# Example usage
+if __name__ == "__main__":
+    import time
+
+    if not os.path.exists(NUMPY_MODEL_PATH):
+        print(f"{NUMPY_MODEL_PATH} not found. Export it with export_from_checkpoint().")
+        exit(1)
+
+    model = NumpyCNN.load()
+    batch = np.random.rand(16, *(model.input_shape or (224, 224, 3))).astype(np.float32)
+    start = time.perf_counter()
+    predictions = model.predict(batch)
+    elapsed = time.perf_counter() - start
+    print(f"Predicted {len(batch)} images in {elapsed:.2f}s ({len(batch) / elapsed:.1f} images/sec).")
+    print(predictions.argmax(axis=1))
@@ -0,0 +1,192 @@
+# quantization.py
+# Post-training int8 quantization for the NumPy inference engine.
+
+import time
+import numpy as np
+from numpy_inference import (
+    NumpyCNN,
+    NUMPY_MODEL_PATH,
+    ACTIVATIONS,
+    im2col,
+    load_image_directory,
+)
+
+# Constants
+QUANTIZED_MODEL_PATH = "plant_ai_model_int8.npz"
+VALIDATION_DIR = "data/validation"
+CALIBRATION_SAMPLES = 64
+CALIBRATION_PERCENTILE = 99.99
+QUANTIZED_LAYERS = ("conv2d", "dense")
+INT8_MAX = 127
+# Rows of an int8 weight matrix widened to float32 at a time, so the
+# large Dense layer never needs a full float32 copy in memory.
+MATMUL_BLOCK_ROWS = 8192
+
+
+def quantize_per_channel(kernel):
+    """
+    Symmetric per-output-channel int8 quantization of a Keras kernel
+    (output channels on the last axis). Returns (q_kernel, scales).
+    """
+    reduce_axes = tuple(range(kernel.ndim - 1))
+    max_abs = np.abs(kernel).max(axis=reduce_axes)
+    scales = np.where(max_abs > 0, max_abs / INT8_MAX, 1.0).astype(np.float32)
+    q_kernel = np.clip(np.rint(kernel / scales), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return q_kernel, scales
+
+
+def quantize_activations(x, scale):
+    """
+    Rounds activations onto the int8 grid for a per-tensor scale. The result
+    stays float32 so it can feed BLAS matmuls directly.
+    """
+    return np.clip(np.rint(x / scale), -INT8_MAX, INT8_MAX).astype(np.float32)
+
+
+def quantized_matmul(xq, q_kernel2d, kernel_scales, input_scale, block_rows=MATMUL_BLOCK_ROWS):
+    """
+    Multiplies already-quantized activations by an int8 weight matrix,
+    widening the weights block by block, and rescales the result to float32.
+    """
+    out = np.zeros((xq.shape[0], q_kernel2d.shape[1]), dtype=np.float32)
+    for start in range(0, q_kernel2d.shape[0], block_rows):
+        block = q_kernel2d[start:start + block_rows].astype(np.float32)
+        out += xq[:, start:start + block_rows] @ block
+    out *= input_scale * kernel_scales
+    return out
+
+
+class QuantizedCNN(NumpyCNN):
+    """
+    NumpyCNN variant whose Conv2D and Dense layers hold int8 weights with
+    per-channel scales and quantize their inputs with calibrated scales.
+    """
+
+    def _run_layer(self, index, spec, x):
+        if spec["type"] not in QUANTIZED_LAYERS:
+            return super()._run_layer(index, spec, x)
+
+        q_kernel = self.param(index, "kernel_q")
+        kernel_scales = self.param(index, "kernel_scale")
+        input_scale = float(self.param(index, "input_scale"))
+        bias = self.param(index, "bias")
+        # Quantize before im2col: patches repeat each input value kh*kw times.
+        x = quantize_activations(x, input_scale)
+
+        if spec["type"] == "conv2d":
+            kh, kw, _, out_channels = q_kernel.shape
+            patches, (n, h, w) = im2col(
+                x, (kh, kw), spec.get("strides", (1, 1)), spec.get("padding", "valid")
+            )
+            out = quantized_matmul(
+                patches, q_kernel.reshape(-1, out_channels), kernel_scales, input_scale
+            )
+            x = out.reshape(n, h, w, out_channels)
+        else:
+            x = quantized_matmul(x, q_kernel, kernel_scales, input_scale)
+        x += bias
+        return ACTIVATIONS[spec.get("activation", "linear")](x)
+
+
+def calibrate_input_scales(model, images, percentile=CALIBRATION_PERCENTILE, batch_size=8):
+    """
+    Runs the float model over calibration images and returns a per-layer
+    input scale for each quantized layer, from a percentile of |activation|.
+    """
+    samples = {index: [] for index, spec in enumerate(model.layers) if spec["type"] in QUANTIZED_LAYERS}
+    for start in range(0, len(images), batch_size):
+        x = np.asarray(images[start:start + batch_size], dtype=np.float32)
+        for index, spec in enumerate(model.layers):
+            if index in samples:
+                samples[index].append(np.percentile(np.abs(x), percentile))
+            x = model._run_layer(index, spec, x)
+
+    scales = {}
+    for index, values in samples.items():
+        clip = max(float(np.max(values)), 1e-8)
+        scales[index] = np.float32(clip / INT8_MAX)
+    return scales
+
+
+def quantize_model(model, calibration_images, percentile=CALIBRATION_PERCENTILE):
+    """
+    Builds a QuantizedCNN from a float NumpyCNN and calibration images.
+    """
+    print(f"Calibrating on {len(calibration_images)} images...")
+    input_scales = calibrate_input_scales(model, calibration_images, percentile)
+
+    weights = {}
+    for index, spec in enumerate(model.layers):
+        if index in input_scales:
+            q_kernel, kernel_scales = quantize_per_channel(model.param(index, "kernel"))
+            weights[f"{index}/kernel_q"] = q_kernel
+            weights[f"{index}/kernel_scale"] = kernel_scales
+            weights[f"{index}/input_scale"] = np.array(input_scales[index], dtype=np.float32)
+            weights[f"{index}/bias"] = model.param(index, "bias")
+        else:
+            for key, value in model.weights.items():
+                if key.startswith(f"{index}/"):
+                    weights[key] = value
+
+    return QuantizedCNN(model.layers, weights, model.class_names, model.input_shape)
+
+
+def model_size_bytes(model):
+    """
+    Returns the in-memory size of a model's weights.
+    """
+    return sum(array.nbytes for array in model.weights.values())
+
+
+def _benchmark(model, images, labels, batch_size):
+    start = time.perf_counter()
+    probabilities = model.predict(images, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return {
+        "accuracy": float((probabilities.argmax(axis=1) == labels).mean()),
+        "images_per_sec": len(images) / elapsed,
+        "weight_bytes": model_size_bytes(model),
+    }, probabilities
+
+
+def compare_backends(float_model, quantized_model, images, labels, batch_size=8):
+    """
+    Reports accuracy, throughput and weight memory of the float and int8
+    models on the same labelled images.
+    """
+    float_stats, float_probs = _benchmark(float_model, images, labels, batch_size)
+    int8_stats, int8_probs = _benchmark(quantized_model, images, labels, batch_size)
+    report = {
+        "images": len(images),
+        "float": float_stats,
+        "int8": int8_stats,
+        "top1_agreement": float((float_probs.argmax(axis=1) == int8_probs.argmax(axis=1)).mean()),
+        "max_prob_diff": float(np.abs(float_probs - int8_probs).max()),
+    }
+
+    print(f"\nAccuracy vs speed on {len(images)} images:")
+    print(f"{'backend':<8}{'accuracy':>10}{'images/sec':>12}{'weights MB':>12}")
+    for name in ("float", "int8"):
+        stats = report[name]
+        print(
+            f"{name:<8}{stats['accuracy']:>10.4f}{stats['images_per_sec']:>12.2f}"
+            f"{stats['weight_bytes'] / 1e6:>12.1f}"
+        )
+    print(f"Top-1 agreement: {report['top1_agreement']:.2%}, max probability difference: {report['max_prob_diff']:.4f}")
+    return report
+
+
+# Example usage
+if __name__ == "__main__":
+    float_model = NumpyCNN.load(NUMPY_MODEL_PATH)
+    image_size = tuple(float_model.input_shape[:2]) if float_model.input_shape else (224, 224)
+    images, labels, _ = load_image_directory(VALIDATION_DIR, image_size)
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(images))
+    calibration = images[order[:CALIBRATION_SAMPLES]]
+    held_out = order[CALIBRATION_SAMPLES:] if len(order) > CALIBRATION_SAMPLES else order
+
+    quantized_model = quantize_model(float_model, calibration)
+    quantized_model.save(QUANTIZED_MODEL_PATH)
+    compare_backends(float_model, quantized_model, images[held_out], labels[held_out])
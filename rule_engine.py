@@ -0,0 +1,206 @@
+# rule_engine.py
+# Threshold rules that turn sensor readings into actuator runs and alerts.
+
+import threading
+import time
+import numpy as np
+from actuators import ZoneBusyError
+from config import SENSOR_THRESHOLDS, TELEGRAM_ALERT_CHAT_ID
+from database import add_log, get_latest_readings
+from notifier import send_telegram_notification
+
+# Constants
+INITIAL_CAPACITY = 64  # Plants; state arrays double when full
+MAX_READING_AGE = 300  # Seconds; older readings are not acted on
+
+
+class Rule:
+    """
+    Fires ("on") when a sensor drops below on_below (or rises above
+    on_above) and resets ("off") only once the value is band units back on
+    the good side, so readings hovering at the threshold do not chatter.
+    A rule stays on for at least min_on and off for at least min_off
+    seconds, and fires at most once per cooldown seconds per plant. It can
+    start an actuator (for run_seconds, or until it resets) and/or send an
+    alert message formatted with plant and value. A timed rule that is
+    still on when its cooldown ends fires again, e.g. to water once more.
+    """
+
+    def __init__(self, name, sensor, on_below=None, on_above=None, band=0.0, actuator=None,
+                 run_seconds=None, message=None, min_on=0.0, min_off=0.0, cooldown=0.0):
+        if (on_below is None) == (on_above is None):
+            raise ValueError("A rule needs exactly one of on_below and on_above.")
+        self.name = name
+        self.sensor = sensor
+        self.on_below = on_below
+        self.on_above = on_above
+        self.band = band
+        self.actuator = actuator
+        self.run_seconds = run_seconds
+        self.message = message
+        self.min_on = min_on
+        self.min_off = min_off
+        self.cooldown = cooldown
+
+    def conditions(self, values):
+        """
+        Returns boolean arrays (wants_on, wants_off) for an array of values.
+        Missing values (nan) want neither.
+        """
+        with np.errstate(invalid="ignore"):
+            if self.on_below is not None:
+                return values < self.on_below, values > self.on_below + self.band
+            return values > self.on_above, values < self.on_above - self.band
+
+
+def default_rules(thresholds=SENSOR_THRESHOLDS):
+    soil, light = thresholds["soil_moisture"], thresholds["light_level"]
+    temperature, humidity = thresholds["temperature"], thresholds["humidity"]
+    return [
+        Rule("water", "soil_moisture", on_below=soil["min"], band=10, actuator="watering",
+             run_seconds=300, min_off=1800, cooldown=1800,
+             message="{plant} is dry (soil moisture {value:.0f}%). Watering started."),
+        Rule("light", "light_level", on_below=light["min"], band=100, actuator="lighting",
+             min_on=900, min_off=900),
+        Rule("cold", "temperature", on_below=temperature["min"], band=2, cooldown=3600,
+             message="{plant} is too cold ({value:.1f}°C)."),
+        Rule("hot", "temperature", on_above=temperature["max"], band=2, cooldown=3600,
+             message="{plant} is too hot ({value:.1f}°C)."),
+        Rule("dry_air", "humidity", on_below=humidity["min"], band=5, cooldown=3600,
+             message="Humidity is low for {plant} ({value:.0f}%)."),
+    ]
+
+
+def send_alert(message):
+    send_telegram_notification(TELEGRAM_ALERT_CHAT_ID, message)
+
+
+class RuleEngine:
+    """
+    Keeps each rule's state for every plant in NumPy arrays and evaluates a
+    whole batch of readings per rule with vectorized comparisons, so a tick
+    over thousands of plants costs a few array operations. Only plants with
+    new readings are evaluated; the others keep their state.
+    """
+
+    def __init__(self, rules=None, executor=None, notify=send_alert, clock=time.time, max_age=MAX_READING_AGE):
+        self.rules = rules if rules is not None else default_rules()
+        self.executor = executor
+        self.notify = notify
+        self.clock = clock
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._plants = {}  # plant name -> index into the state arrays
+        self._names = []
+        self._active = np.zeros((len(self.rules), INITIAL_CAPACITY), dtype=bool)
+        self._changed = np.full((len(self.rules), INITIAL_CAPACITY), -np.inf)
+        self._fired = np.full((len(self.rules), INITIAL_CAPACITY), -np.inf)
+        self.last_id = 0
+        self.evaluations = 0
+
+    def _indices(self, plants):
+        for plant in plants:
+            if plant not in self._plants:
+                self._plants[plant] = len(self._names)
+                self._names.append(plant)
+        capacity = self._active.shape[1]
+        if len(self._names) > capacity:
+            extra = max(capacity, len(self._names) - capacity)
+            pad = ((0, 0), (0, extra))
+            self._active = np.pad(self._active, pad)
+            self._changed = np.pad(self._changed, pad, constant_values=-np.inf)
+            self._fired = np.pad(self._fired, pad, constant_values=-np.inf)
+        return np.fromiter((self._plants[plant] for plant in plants), dtype=np.intp, count=len(plants))
+
+    def evaluate(self, plants, readings, now=None):
+        """
+        Updates rule states from one reading per plant (readings maps sensor
+        names to arrays aligned with plants) and returns the transitions as
+        (rule, plant, "on" or "off", value).
+        """
+        now = self.clock() if now is None else now
+        events = []
+        with self._lock:
+            index = self._indices(plants)
+            for r, rule in enumerate(self.rules):
+                if rule.sensor not in readings:
+                    continue
+                values = np.asarray(readings[rule.sensor], dtype=np.float64)
+                wants_on, wants_off = rule.conditions(values)
+                active = self._active[r, index]
+                held = now - self._changed[r, index]
+                cooled = now - self._fired[r, index] >= rule.cooldown
+                turn_on = ~active & wants_on & (held >= rule.min_off) & cooled
+                turn_off = active & wants_off & (held >= rule.min_on)
+                changed = index[turn_on | turn_off]
+                self._active[r, changed] = ~self._active[r, changed]
+                self._changed[r, changed] = now
+                if rule.run_seconds is not None:
+                    turn_on |= active & wants_on & cooled
+                self._fired[r, index[turn_on]] = now
+                for i in np.flatnonzero(turn_on):
+                    events.append((rule, plants[i], "on", float(values[i])))
+                for i in np.flatnonzero(turn_off):
+                    events.append((rule, plants[i], "off", float(values[i])))
+            self.evaluations += len(plants) * len(self.rules)
+        return events
+
+    def apply(self, events):
+        """
+        Starts or stops actuators and sends alerts for rule transitions.
+        """
+        for rule, plant, state, value in events:
+            add_log(f"Rule {rule.name} {state} for {plant} ({rule.sensor} {value:g}).")
+            if rule.actuator and self.executor is not None:
+                try:
+                    if state == "on":
+                        self.executor.start(rule.actuator, plant, rule.run_seconds)
+                    else:
+                        self.executor.stop(rule.actuator, plant)
+                except ZoneBusyError:
+                    pass
+                except Exception as e:
+                    print(f"Error running {rule.actuator} for {plant}: {e}")
+            if rule.message and state == "on" and self.notify is not None:
+                self.notify(rule.message.format(plant=plant, value=value))
+
+    def tick(self):
+        """
+        Evaluates the newest readings stored since the last tick and acts on
+        the transitions. Readings older than max_age are skipped, so a new
+        engine does not water or alert on data left from before it started.
+        Returns the events.
+        """
+        last_id, plants, readings = get_latest_readings(self.last_id, self.clock() - self.max_age)
+        self.last_id = last_id
+        if not plants:
+            return []
+        events = self.evaluate(plants, readings)
+        self.apply(events)
+        return events
+
+    def states(self, plant):
+        """
+        Returns {rule name: active} for one plant.
+        """
+        with self._lock:
+            index = self._plants.get(plant)
+            return {rule.name: index is not None and bool(self._active[r, index])
+                    for r, rule in enumerate(self.rules)}
+
+
+# Example usage
+if __name__ == "__main__":
+    engine = RuleEngine(notify=print)
+    plants = [f"Plant{i}" for i in range(10000)]
+    rng = np.random.default_rng(0)
+    readings = {
+        "soil_moisture": rng.uniform(0, 100, len(plants)),
+        "light_level": rng.uniform(0, 1000, len(plants)),
+        "temperature": rng.uniform(10, 40, len(plants)),
+        "humidity": rng.uniform(20, 90, len(plants)),
+    }
+    started = time.perf_counter()
+    events = engine.evaluate(plants, readings)
+    print(f"{len(events)} transitions for {len(plants)} plants in {(time.perf_counter() - started) * 1000:.1f} ms")
+    print(engine.states("Plant1"))
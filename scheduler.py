@@ -1,63 +1,390 @@
 # scheduler.py
 # Handles scheduling for the Plant Monitoring System.
 
-import schedule
+import sys
+import threading
 import time
-from datetime import datetime
-from database import add_log, add_schedule, get_schedules, delete_schedule
+from datetime import datetime, timedelta
+from actuators import MAX_RUN_SECONDS, ZoneBusyError, shared_executor
+from database import (
+    DEFAULT_PLANT,
+    MISFIRE_POLICIES,
+    add_log,
+    add_schedule,
+    get_schedules,
+    get_schedule_changes,
+    get_schedule_version,
+    delete_schedules,
+    prune_schedule_changes,
+    update_schedules,
+    set_schedule_last_run,
+)
+from config import SCHEDULER_DISTRIBUTED
+from job_leases import HEARTBEAT_INTERVAL, LeaseCoordinator
+from timer_scheduler import TimerScheduler
 
-# Function to simulate watering
-def water_plants(duration):
+# Constants
+DEVICES = ("watering", "lighting")
+DEVICE_ALIASES = {"water": "watering", "light": "lighting", "lights": "lighting"}
+MISFIRE_GRACE = 6 * 3600  # Seconds; older missed runs are skipped even under run_once
+STANDBY_RETRIES = 3  # Lease periods a non-owner waits for the owner to run a job
+SCHEDULE_SYNC_INTERVAL = 2  # Seconds between polls of the schedule change feed
+SCHEDULE_CHANGE_RETENTION = 24 * 3600  # Seconds schedule changes are kept for pollers
+
+# Live scheduler state shared by the web interface, Telegram bot and CLI
+timer = TimerScheduler()
+executor = shared_executor(timer)  # Actuator stops run on the same timer
+scheduled_jobs = {}  # schedule id -> TimerJob
+scheduler_lock = threading.Lock()
+coordinator = None  # LeaseCoordinator when several scheduler nodes share the database
+sync_job = None  # Interval job that picks up schedules stored by other processes
+schedule_cursor = None  # Id of the last schedule change applied here
+
+# Watering
+def water_plants(duration, plant=DEFAULT_PLANT):
     """
-    Simulates the watering process.
+    Starts watering a plant for duration minutes and returns at once; the
+    executor closes the valve when the time is up. Returns the run, or None
+    if the plant is already being watered.
     """
-    add_log(f"Started watering plants for {duration} minutes.")
-    time.sleep(duration * 60)
-    add_log("Completed watering plants.")
+    try:
+        return executor.start("watering", plant, duration * 60)
+    except ZoneBusyError as e:
+        add_log(f"Skipped watering: {e}")
+        return None
 
-# Function to simulate lighting
-def control_lights(action):
+# Lighting
+def control_lights(action, duration=0, plant=DEFAULT_PLANT):
     """
-    Simulates turning lights on or off.
+    Turns a plant's lights on or off. With a duration, lights turned on are
+    turned off again after that many minutes.
     """
     if action not in ["on", "off"]:
         raise ValueError("Invalid action for lights. Use 'on' or 'off'.")
-    add_log(f"Lights turned {action}.")
+    if action == "on":
+        try:
+            return executor.start("lighting", plant, duration * 60 or None, replace=True)
+        except ZoneBusyError as e:
+            add_log(f"Skipped lighting: {e}")
+            return None
+    executor.stop("lighting", plant)
+    add_log("Lights turned off.")
+    return None
+
+def _run_schedule(schedule_id, device, schedule_time, duration, action, plant, slot=None, attempt=0):
+    """
+    Runs one schedule and records the run for catch-up after a restart.
+    slot is the wall-clock time of the daily run being made (default: the
+    latest one). With several scheduler nodes, only the node that claims
+    this run makes it; the others check back in case the owner failed
+    before completing it.
+    """
+    if slot is None:
+        slot = _previous_occurrence(schedule_time, time.time())
+    token = None
+    if coordinator is not None:
+        job = f"schedule-{schedule_id}"
+        run_key = datetime.fromtimestamp(slot).strftime("%Y-%m-%dT%H:%M")
+        token = coordinator.claim(job, run_key)
+        if token is None:
+            if attempt < STANDBY_RETRIES and not coordinator.has_run(job, run_key):
+                timer.call_later(
+                    coordinator.lease_ttl, _run_schedule, schedule_id, device, schedule_time,
+                    duration, action, plant, slot, attempt + 1, tag=f"standby-{schedule_id}",
+                )
+            return
+    try:
+        if device == "watering":
+            water_plants(duration, plant)
+        else:
+            control_lights(action, duration, plant)
+        set_schedule_last_run(schedule_id, time.time())
+    finally:
+        if token is not None:
+            coordinator.complete(job, run_key, token)
+
+def _register(schedule_id, device, schedule_time, duration, action, plant):
+    """
+    Adds one stored schedule to the live scheduler. Called with
+    scheduler_lock held.
+    """
+    job = timer.add_daily(
+        schedule_time, _run_schedule, schedule_id, device, schedule_time, duration, action, plant,
+        tag=f"schedule-{schedule_id}", with_slot=True,
+    )
+    scheduled_jobs[schedule_id] = job
+
+def _previous_occurrence(schedule_time, now):
+    """
+    Returns the epoch seconds of the latest daily occurrence of "HH:MM" at
+    or before now.
+    """
+    hour, minute = (int(part) for part in schedule_time.split(":"))
+    moment = datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if moment.timestamp() > now:
+        moment -= timedelta(days=1)
+    return moment.timestamp()
+
+def _validate(device, schedule_time, duration, action, misfire_policy):
+    """
+    Checks schedule fields and returns the normalized action.
+    """
+    datetime.strptime(schedule_time, "%H:%M")  # Raises ValueError for invalid times
+    if int(duration) < 0:
+        raise ValueError("duration must not be negative.")
+    if device == "watering" and int(duration) == 0:
+        raise ValueError("Watering needs a duration of at least one minute.")
+    if int(duration) * 60 > MAX_RUN_SECONDS:
+        raise ValueError(f"duration must be at most {MAX_RUN_SECONDS // 60} minutes.")
+    if misfire_policy not in MISFIRE_POLICIES:
+        raise ValueError(f"Invalid misfire policy: {misfire_policy}. Use {' or '.join(MISFIRE_POLICIES)}.")
+    if device == "lighting":
+        action = action or "on"
+        if action not in ["on", "off"]:
+            raise ValueError("Invalid action for lights. Use 'on' or 'off'.")
+    return action
 
 # Schedule management
+def store_schedule(device, schedule_time, duration=0, action=None, plant=DEFAULT_PLANT, misfire_policy="skip"):
+    """
+    Validates and stores a daily schedule without activating it in this
+    process; the scheduler process picks it up on its next sync. Returns
+    the schedule ID; an identical existing schedule is reused instead of
+    duplicated. misfire_policy decides whether a run missed while the
+    scheduler was stopped is caught up ("run_once") or dropped ("skip").
+    """
+    device = DEVICE_ALIASES.get(device, device)
+    if device not in DEVICES:
+        raise ValueError(f"Invalid device: {device}. Use 'watering' or 'lighting'.")
+    duration = int(duration)
+    action = _validate(device, schedule_time, duration, action, misfire_policy)
+
+    for row in get_schedules(device, schedule_time):
+        if row[3:6] == (duration, action, plant):
+            return row[0]
+    schedule_id = add_schedule(device, schedule_time, duration, action, plant, misfire_policy)
+    if schedule_id is None:
+        raise RuntimeError("Could not store the schedule.")
+    return schedule_id
+
+def create_schedule(device, schedule_time, duration=0, action=None, plant=DEFAULT_PLANT, misfire_policy="skip"):
+    """
+    Stores a daily schedule and activates it at once in this process.
+    Returns the schedule ID.
+    """
+    schedule_id = store_schedule(device, schedule_time, duration, action, plant, misfire_policy)
+    with scheduler_lock:
+        if schedule_id not in scheduled_jobs:
+            for row in get_schedules(schedule_ids=[schedule_id]):
+                _register(*row[:6])
+    return schedule_id
+
 def schedule_watering(time, duration):
     """
     Schedules a watering task.
     """
-    add_schedule("watering", time, duration)
-    schedule.every().day.at(time).do(water_plants, duration)
+    schedule_id = create_schedule("watering", time, duration)
     print(f"Watering scheduled at {time} for {duration} minutes.")
+    return schedule_id
 
-def schedule_lighting(time, action):
+def schedule_lighting(time, action, duration=0):
     """
     Schedules a lighting task.
     """
-    add_schedule("lighting", time, 0)  # Duration not required for lights
-    schedule.every().day.at(time).do(control_lights, action)
+    schedule_id = create_schedule("lighting", time, duration, action)
     print(f"Lights scheduled to turn {action} at {time}.")
+    return schedule_id
+
+def cancel_schedules(schedule_ids):
+    """
+    Cancels many schedules, deleting them in one transaction. Returns the
+    number canceled.
+    """
+    schedule_ids = list(schedule_ids)
+    with scheduler_lock:
+        for schedule_id in schedule_ids:
+            job = scheduled_jobs.pop(schedule_id, None)
+            if job is not None:
+                timer.cancel(job)
+    deleted = delete_schedules(schedule_ids)
+    if deleted:
+        add_log(f"{deleted} schedule(s) canceled.")
+    return deleted
+
+def cancel_schedule(schedule_id):
+    """
+    Cancels one schedule. Returns False if it did not exist.
+    """
+    return cancel_schedules([schedule_id]) == 1
+
+def modify_schedules(schedule_ids, **changes):
+    """
+    Changes fields (schedule_time, duration, action, plant, misfire_policy)
+    of many schedules in one transaction and reschedules their live jobs.
+    Returns the number modified.
+    """
+    schedule_ids = list(schedule_ids)
+    if "duration" in changes:
+        changes["duration"] = int(changes["duration"])
+    rows = get_schedules(schedule_ids=schedule_ids)
+    for _, device, schedule_time, duration, action, _, misfire_policy, _ in rows:
+        _validate(
+            device,
+            changes.get("schedule_time", schedule_time),
+            changes.get("duration", duration),
+            changes.get("action", action),
+            changes.get("misfire_policy", misfire_policy),
+        )
+    modified = update_schedules(schedule_ids, **changes)
+    with scheduler_lock:
+        for schedule_id, device, schedule_time, duration, action, plant, _, _ in get_schedules(schedule_ids=schedule_ids):
+            job = scheduled_jobs.pop(schedule_id, None)
+            if job is not None:
+                timer.cancel(job)
+            _register(schedule_id, device, schedule_time, duration, action, plant)
+    if modified:
+        add_log(f"{modified} schedule(s) modified.")
+    return modified
+
+def load_schedules(now=None):
+    """
+    Rebuilds the live job set from all stored schedules (one query), e.g.
+    after a restart, skipping schedules already running. Runs missed while
+    the scheduler was stopped are caught up once if their policy is
+    run_once and they are within MISFIRE_GRACE. Returns the number of
+    schedules loaded and of runs caught up.
+    """
+    global schedule_cursor
+    now = time.time() if now is None else now
+    loaded = caught_up = 0
+    with scheduler_lock:
+        # Changes made while loading are applied again by the next sync
+        schedule_cursor = get_schedule_version()
+        for row in get_schedules():
+            schedule_id, device, schedule_time, duration, action, plant, misfire_policy, last_run = row
+            if schedule_id in scheduled_jobs:
+                continue
+            try:
+                _register(schedule_id, device, schedule_time, duration, action, plant)
+                loaded += 1
+                missed = _previous_occurrence(schedule_time, now)
+                if (misfire_policy == "run_once" and last_run is not None
+                        and last_run < missed and now - missed <= MISFIRE_GRACE):
+                    timer.call_later(
+                        0, _run_schedule, schedule_id, device, schedule_time, duration, action, plant, missed,
+                        tag=f"catch-up-{schedule_id}",
+                    )
+                    caught_up += 1
+            except Exception as e:
+                print(f"Skipping schedule {schedule_id}: {e}")
+    if caught_up:
+        add_log(f"Catching up {caught_up} missed schedule run(s).")
+    return {"loaded": loaded, "caught_up": caught_up}
+
+def sync_schedules():
+    """
+    Applies the schedules added, changed or canceled since the last sync,
+    read from the schedule change feed, so changes made by another process
+    (e.g. the Telegram bot, which only writes to the database) take effect
+    here without rescanning all schedules. Returns the number of jobs added
+    or replaced and of jobs dropped.
+    """
+    global schedule_cursor
+    added = dropped = 0
+    with scheduler_lock:
+        cursor, changed = get_schedule_changes(schedule_cursor or 0)
+        stored = {row[0]: row[:6] for row in get_schedules(schedule_ids=changed)} if changed else {}
+        for schedule_id in changed:
+            fields = stored.get(schedule_id)
+            job = scheduled_jobs.get(schedule_id)
+            if job is not None and job.args[:6] == fields:
+                continue
+            if job is not None:
+                timer.cancel(scheduled_jobs.pop(schedule_id))
+                dropped += 1
+            if fields is not None:
+                try:
+                    _register(*fields)
+                    added += 1
+                except Exception as e:
+                    print(f"Skipping schedule {schedule_id}: {e}")
+        schedule_cursor = cursor
+    return {"added": added, "dropped": dropped}
+
+def watch_schedules():
+    """
+    Polls the schedule change feed every SCHEDULE_SYNC_INTERVAL seconds and
+    prunes changes older than SCHEDULE_CHANGE_RETENTION hourly (once per
+    process).
+    """
+    global sync_job
+    if sync_job is None:
+        sync_job = timer.add_interval(SCHEDULE_SYNC_INTERVAL, sync_schedules, tag="schedule-sync")
+        timer.add_interval(
+            3600, lambda: prune_schedule_changes(time.time() - SCHEDULE_CHANGE_RETENTION), tag="schedule-prune"
+        )
+    return sync_job
 
 def run_scheduled_tasks():
     """
-    Runs scheduled tasks in a loop.
+    Runs scheduled tasks, sleeping until the next one is due.
     """
     print("Scheduler started. Running tasks...")
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    timer.run_forever()
+
+def pool_heartbeat():
+    """
+    Marks this node alive and takes over the actuator runs left in flight
+    by nodes that died, so their valves and lights are still switched off
+    (or run to the end) before the nodes are dropped from the pool.
+    """
+    coordinator.heartbeat()
+    dead = coordinator.dead_nodes()
+    if dead:
+        executor.recover(owners=dead)
+        for node in dead:
+            coordinator.forget(node)
+
+def join_pool():
+    """
+    Joins the pool of scheduler nodes sharing the database: heartbeats keep
+    this node and its job leases live, due jobs run only where they are
+    claimed, and job runs older than JOB_RUN_RETENTION are pruned hourly.
+    The node is named after the executor's owner, so its actuator runs can
+    be recovered by the pool if it dies.
+    """
+    global coordinator
+    if coordinator is None:
+        coordinator = LeaseCoordinator(executor.owner)
+        pool_heartbeat()
+        timer.add_interval(HEARTBEAT_INTERVAL, pool_heartbeat, tag="lease-heartbeat")
+        timer.add_interval(3600, coordinator.prune, tag="job-run-prune")
+    return coordinator
+
+def start_scheduler(distributed=SCHEDULER_DISTRIBUTED):
+    """
+    Finishes actuator runs left over from a previous process, loads stored
+    schedules, keeps them in sync with the database and starts the
+    scheduler loop on a background thread, once per process. Only one
+    process per host should run the scheduler; others just store
+    schedules. With distributed, the node joins the scheduler pool.
+    """
+    executor.recover()
+    if distributed:
+        join_pool()
+    load_schedules()
+    watch_schedules()
+    timer.start()
 
 def cancel_all_schedules():
     """
     Cancels all scheduled tasks and clears the database.
     """
-    for job in schedule.jobs:
-        schedule.cancel_job(job)
-    for row in get_schedules():
-        delete_schedule(row[0])
+    with scheduler_lock:
+        for job in scheduled_jobs.values():
+            timer.cancel(job)
+        scheduled_jobs.clear()
+    delete_schedules()
     add_log("All schedules canceled.")
 
 # Example usage
@@ -67,9 +394,19 @@ if __name__ == "__main__":
     schedule_lighting("19:00", "on")
     schedule_lighting("23:00", "off")
 
-    # Start running scheduled tasks
+    # Start running scheduled tasks; "python scheduler.py distributed" joins
+    # the pool of scheduler nodes sharing the database.
     try:
+        executor.recover()
+        if "distributed" in sys.argv[1:] or SCHEDULER_DISTRIBUTED:
+            join_pool()
+        load_schedules()
+        watch_schedules()
         run_scheduled_tasks()
     except KeyboardInterrupt:
         print("Scheduler stopped.")
-        cancel_all_schedules()
\ No newline at end of file
+        # Stored schedules are kept and reloaded on the next start.
+        timer.stop()
+        executor.stop_all()
+        if coordinator is not None:
+            coordinator.stop()
@@ -0,0 +1,160 @@
+# sensor_snapshot.py
+# Shared, versioned snapshot of the latest sensor readings.
+
+import threading
+import time
+from datetime import datetime
+from sensors import get_sensor_data
+
+
+class _Flight:
+    """
+    One in-progress sensor read that concurrent callers wait on.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SensorSnapshot:
+    """
+    Thread-safe holder for the most recent sensor readings. Every update
+    bumps a version number; refresh() coalesces concurrent callers so only
+    one hardware read runs at a time.
+    """
+
+    def __init__(self, reader=get_sensor_data):
+        self._reader = reader
+        self._lock = threading.Lock()
+        self._data = {}
+        self._version = 0
+        self._timestamp = None
+        self._updated = None  # time.monotonic() of the last update
+        self._flight = None
+
+    def publish(self, data):
+        """
+        Stores new readings and returns the new version.
+        """
+        with self._lock:
+            self._data = dict(data)
+            self._version += 1
+            self._timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._updated = time.monotonic()
+            return self._version
+
+    def get(self):
+        """
+        Returns the current snapshot without touching the sensors.
+        """
+        with self._lock:
+            age = time.monotonic() - self._updated if self._updated is not None else None
+            return {
+                "data": dict(self._data),
+                "version": self._version,
+                "timestamp": self._timestamp,
+                "age": age,
+            }
+
+    def refresh(self):
+        """
+        Reads the sensors and publishes the result. Callers arriving while a
+        read is in flight wait for it and share its result.
+        """
+        with self._lock:
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            self.publish(self._reader())
+            flight.result = self.get()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+
+    def get_fresh(self, max_age):
+        """
+        Returns the snapshot, refreshing it first if it is missing or older
+        than max_age seconds.
+        """
+        snapshot = self.get()
+        if snapshot["age"] is None or snapshot["age"] > max_age:
+            return self.refresh()
+        return snapshot
+
+    def clear(self):
+        """
+        Drops the stored readings; the version keeps increasing.
+        """
+        with self._lock:
+            self._data = {}
+            self._version += 1
+            self._timestamp = None
+            self._updated = None
+
+
+# Shared instance for the web interface, Telegram bot and background sampler
+sensor_snapshot = SensorSnapshot()
+
+
+class SharedSensorReadings:
+    """
+    Sensor readings shared by every process through a StateStore.
+    Readings younger than max_age are served from the store; older ones
+    are refreshed by one coalesced sensor read that is published once for
+    everybody.
+    """
+
+    def __init__(self, store, snapshot=sensor_snapshot):
+        self.store = store
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._published = (None, 0)  # (local snapshot version, store version)
+
+    def publish(self, data):
+        """
+        Stores readings in the shared store and returns the store version.
+        """
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return self.store.write({"sensor_data": data}, "sensor_data", {"data": data, "timestamp": timestamp})
+
+    def cached(self, max_age):
+        """
+        Returns the stored readings if they are at most max_age seconds old,
+        otherwise None. Empty readings, as left by a reset, count as missing.
+        Never touches the sensors.
+        """
+        data, version, updated = self.store.get_entry("sensor_data")
+        if not data or updated is None or time.time() - updated > max_age:
+            return None
+        return {"data": data, "version": version, "updated": updated, "age": time.time() - updated, "refreshed": False}
+
+    def get(self, max_age):
+        """
+        Returns readings at most max_age seconds old, reading the sensors
+        if needed. Concurrent callers share a single read and publish.
+        """
+        readings = self.cached(max_age)
+        if readings is not None:
+            return readings
+        snapshot = self.snapshot.refresh()
+        with self._lock:
+            if self._published[0] != snapshot["version"]:
+                self._published = (snapshot["version"], self.publish(snapshot["data"]))
+            version = self._published[1]
+        return {"data": snapshot["data"], "version": version, "updated": time.time(), "age": 0.0, "refreshed": True}
@@ -0,0 +1,294 @@
+# state_store.py
+# System state shared by all web worker processes, stored in SQLite (WAL),
+# with a change feed and election of the single sensor-sampling process.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No cross-process election; every process samples
+
+# Constants
+STATE_DATABASE_FILE = "plant_state.db"
+SAMPLER_LOCK_FILE = "plant_sampler.lock"
+EVENT_RETENTION = 1000  # Change-feed rows kept for lagging workers
+JOB_RETENTION = 500  # Job records kept for lookups from any worker
+LOG_RETENTION = 500  # Recent log entries kept per channel
+STATE_POLL_INTERVAL = 0.25  # Seconds between change-feed polls
+BUSY_TIMEOUT = 5  # Seconds a writer waits for the database lock
+
+
+class StateStore:
+    """
+    Key/value state shared across processes. Every write appends an event
+    to a change feed in the same transaction; the event id is the new
+    store-wide version, so all workers agree on versions, ETags and SSE
+    event ids.
+    """
+
+    def __init__(self, path=STATE_DATABASE_FILE, defaults=None):
+        self.path = path
+        self.defaults = dict(defaults or {})
+        self._local = threading.local()
+
+    def _connect(self):
+        """
+        Returns this thread's connection, creating the schema on first use.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                version INTEGER,
+                updated REAL
+            )
+            """)
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT,
+                data TEXT,
+                created REAL
+            )
+            """)
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                data TEXT,
+                updated REAL
+            )
+            """)
+            connection.execute("""
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT,
+                created REAL,
+                message TEXT
+            )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_logs_channel ON logs (channel, id)")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Yields this thread's connection inside a write transaction.
+        """
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def write(self, values=None, event_type="state", event_data=None, replace=False):
+        """
+        Atomically stores values (a dict) and appends an event. With
+        replace, all other keys are removed. Returns the new version.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO events (type, data, created) VALUES (?, ?, ?)",
+                (event_type, json.dumps(event_data, default=str), now),
+            )
+            version = cursor.lastrowid
+            if replace:
+                connection.execute("DELETE FROM state")
+            connection.executemany("""
+            INSERT INTO state (key, value, version, updated) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value, version = excluded.version, updated = excluded.updated
+            """, [(key, json.dumps(value, default=str), version, now) for key, value in (values or {}).items()])
+            if version % 100 == 0:
+                connection.execute("DELETE FROM events WHERE id <= ?", (version - EVENT_RETENTION,))
+        return version
+
+    def reset(self, event_type="reset"):
+        """
+        Restores every key to its default value.
+        """
+        return self.write(self.defaults, event_type, {}, replace=True)
+
+    def get_entry(self, key):
+        """
+        Returns (value, version, updated) for a key; version 0 and updated
+        None mean it was never written.
+        """
+        row = self._connect().execute(
+            "SELECT value, version, updated FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return self.defaults.get(key), 0, None
+        return json.loads(row[0]), row[1], row[2]
+
+    def get(self, key):
+        return self.get_entry(key)[0]
+
+    def get_all(self):
+        state = dict(self.defaults)
+        for key, value in self._connect().execute("SELECT key, value FROM state"):
+            state[key] = json.loads(value)
+        return state
+
+    def version(self):
+        row = self._connect().execute("SELECT MAX(id) FROM events").fetchone()
+        return row[0] or 0
+
+    def events_since(self, last_id, limit=500):
+        """
+        Returns change-feed events newer than last_id as (id, type, data).
+        """
+        rows = self._connect().execute(
+            "SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+        ).fetchall()
+        return [(event_id, event_type, json.loads(data)) for event_id, event_type, data in rows]
+
+    def save_job(self, job_id, data, replace=True):
+        """
+        Stores a background job's state so any worker can report it, and
+        forgets the oldest jobs beyond JOB_RETENTION. Without replace an
+        existing record is kept, so a late "queued" write cannot overwrite
+        the final state of a job that finished quickly.
+        """
+        conflict = "DO UPDATE SET data = excluded.data, updated = excluded.updated" if replace else "DO NOTHING"
+        with self._transaction() as connection:
+            connection.execute(f"""
+            INSERT INTO jobs (id, data, updated) VALUES (?, ?, ?)
+            ON CONFLICT(id) {conflict}
+            """, (job_id, json.dumps(data, default=str), time.time()))
+            connection.execute("""
+            DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY updated DESC LIMIT ?)
+            """, (JOB_RETENTION,))
+
+    def get_job(self, job_id):
+        row = self._connect().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def append_logs(self, channel, entries):
+        """
+        Appends (created, message) log entries for a channel, keeping the
+        newest LOG_RETENTION.
+        """
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT INTO logs (channel, created, message) VALUES (?, ?, ?)",
+                [(channel, created, message) for created, message in entries],
+            )
+            connection.execute("""
+            DELETE FROM logs WHERE channel = ? AND id <= (
+                SELECT id FROM logs WHERE channel = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+            )
+            """, (channel, channel, LOG_RETENTION))
+
+    def recent_logs(self, channel, limit=LOG_RETENTION):
+        """
+        Returns a channel's newest log entries as (created, message), oldest
+        first.
+        """
+        rows = self._connect().execute(
+            "SELECT created, message FROM logs WHERE channel = ? ORDER BY id DESC LIMIT ?", (channel, limit)
+        ).fetchall()
+        return rows[::-1]
+
+    def clear_logs(self, channel):
+        self._connect().execute("DELETE FROM logs WHERE channel = ?", (channel,))
+
+
+class StateWatcher:
+    """
+    Background thread that follows a store's change feed and hands every
+    new event to on_event(event_id, event_type, data), e.g. to feed a
+    process-local SSE broadcaster.
+    """
+
+    def __init__(self, store, on_event, interval=STATE_POLL_INTERVAL):
+        self.store = store
+        self.on_event = on_event
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        last_id = self.store.version()
+        self._thread = threading.Thread(target=self._run, args=(last_id,), daemon=True)
+        self._thread.start()
+
+    def _run(self, last_id):
+        while not self._stop.is_set():
+            try:
+                for event_id, event_type, data in self.store.events_since(last_id):
+                    self.on_event(event_id, event_type, data)
+                    last_id = event_id
+            except Exception as e:
+                print(f"Error reading state changes: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class SamplerLock:
+    """
+    Non-blocking exclusive file lock held by the one process that samples
+    the sensors. The operating system releases it when that process exits,
+    letting another worker take over.
+    """
+
+    def __init__(self, path=SAMPLER_LOCK_FILE):
+        self.path = path
+        self._handle = None
+
+    @property
+    def held(self):
+        return self._handle is not None or fcntl is None
+
+    def acquire(self):
+        """
+        Returns True if this process holds (or just took) the lock.
+        """
+        if self._handle is not None or fcntl is None:
+            return True
+        handle = open(self.path, "a+")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(str(os.getpid()))
+        handle.flush()
+        self._handle = handle
+        return True
+
+    def release(self):
+        if self._handle is not None:
+            fcntl.flock(self._handle.fileno(), fcntl.LOCK_UN)
+            self._handle.close()
+            self._handle = None
+
+
+# Example usage
+if __name__ == "__main__":
+    store = StateStore(defaults={"light": "off", "watering": "off"})
+    print(f"Version {store.write({'light': 'on'}, 'control', {'device': 'light', 'action': 'on'})}")
+    print(store.get_all())
+    print(store.events_since(0)[-1])
+    print(f"Sampler lock acquired: {SamplerLock().acquire()}")
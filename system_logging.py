@@ -0,0 +1,394 @@
+# system_logging.py
+# Shared asynchronous logging: callers enqueue records, one background
+# listener writes them to rotating files, the database and memory.
+
+import atexit
+import glob
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from config import LOGGING
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # No cross-process lock; one process should write each file
+
+# Constants
+LOGGER_PREFIX = "plant"
+EVENT_LOG_FILE = "events.jsonl"  # Structured copy of every record
+LOG_QUEUE_SIZE = 10000  # Records buffered before new ones are dropped
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5  # Rotated files kept per log
+RECENT_EVENTS_SIZE = 500  # Events kept in memory per channel for the dashboard
+BATCH_SIZE = 200  # Records buffered by batching sinks before a write
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the caller: when the queue is full the
+    record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchListener(logging.handlers.QueueListener):
+    """
+    Queue listener that flushes batching handlers whenever the queue runs
+    empty, so records are written in bursts under load and promptly
+    otherwise.
+    """
+
+    def dequeue(self, block):
+        if self.queue.empty():
+            flush_handlers(self.handlers)
+        return self.queue.get(block)
+
+
+class ChannelFilter(logging.Filter):
+    """
+    Passes only records logged to one channel.
+    """
+
+    def __init__(self, channel):
+        super().__init__()
+        self.logger_name = f"{LOGGER_PREFIX}.{channel}"
+
+    def filter(self, record):
+        return record.name == self.logger_name
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line. Structured values passed
+    as extra={"fields": {...}} are included alongside the message.
+    """
+
+    def format(self, record):
+        event = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "channel": record.name.split(".", 1)[-1],
+            "message": record.getMessage(),
+        }
+        event.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+class RecentEventsHandler(logging.Handler):
+    """
+    Keeps the most recent events of each channel in its own bounded deque,
+    so a noisy channel cannot push another channel's events out. Events
+    carry a sequence number for merging channels back into one timeline.
+    """
+
+    def __init__(self, size=RECENT_EVENTS_SIZE):
+        super().__init__()
+        self.size = size
+        self.channels = {}  # channel -> deque of events
+        self._sequence = itertools.count()
+
+    def emit(self, record):
+        channel = record.name.split(".", 1)[-1]
+        events = self.channels.get(channel)
+        if events is None:
+            events = self.channels.setdefault(channel, deque(maxlen=self.size))
+        events.append({
+            "seq": next(self._sequence),
+            "timestamp": datetime.fromtimestamp(record.created).strftime(LOGGING["datefmt"]),
+            "level": record.levelname,
+            "channel": channel,
+            "message": record.getMessage(),
+        })
+
+
+class SharedRotatingFileHandler(logging.handlers.WatchedFileHandler):
+    """
+    File handler that several processes (web workers, bot, scheduler) can
+    append to and rotate without losing records. Every write holds an
+    exclusive lock on "<file>.lock"; under it the handler reopens the file
+    if another process rotated it, rotates it itself when due (once it
+    reaches max_bytes, or on the first record of a new day with daily), and
+    appends. Size rotation keeps "<file>.1" to "<file>.<backup_count>";
+    daily rotation keeps the newest backup_count "<file>.YYYY-MM-DD".
+    """
+
+    def __init__(self, filename, max_bytes=0, daily=False, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, delay=True)
+        self.max_bytes = max_bytes
+        self.daily = daily
+        self.backup_count = backup_count
+        self._lock_file = None
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the cross-process lock on the file (a no-op without fcntl).
+        """
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(self.baseFilename + ".lock", "a")
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def emit(self, record):
+        try:
+            with self.locked():
+                self.reopenIfNeeded()
+                if self._rotation_due(record):
+                    self._rotate()
+                elif self.stream is None:
+                    self.stream = self._open()
+                    self._statstream()
+                logging.FileHandler.emit(self, record)
+        except Exception:
+            self.handleError(record)
+
+    def _rotation_due(self, record):
+        try:
+            stat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return False
+        if self.daily:
+            return date.fromtimestamp(stat.st_mtime) < date.fromtimestamp(record.created)
+        return 0 < self.max_bytes <= stat.st_size
+
+    def _rotate(self):
+        """
+        Moves the current file to a backup and starts a new one. Called with
+        the file lock held.
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if self.daily:
+            day = date.fromtimestamp(os.stat(self.baseFilename).st_mtime).isoformat()
+            os.replace(self.baseFilename, f"{self.baseFilename}.{day}")
+            backups = sorted(glob.glob(glob.escape(self.baseFilename) + ".????-??-??"))
+            for old in backups[:-self.backup_count] if self.backup_count else backups:
+                os.remove(old)
+        else:
+            for index in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(f"{self.baseFilename}.{index}"):
+                    os.replace(f"{self.baseFilename}.{index}", f"{self.baseFilename}.{index + 1}")
+            if self.backup_count:
+                os.replace(self.baseFilename, f"{self.baseFilename}.1")
+            else:
+                os.remove(self.baseFilename)
+        self.stream = self._open()
+        self._statstream()
+
+    def close(self):
+        super().close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class BatchingHandler(logging.Handler):
+    """
+    Buffers records and passes them to writer(records) in batches, either
+    when BATCH_SIZE records are buffered or when flush() is called.
+    """
+
+    def __init__(self, writer, capacity=BATCH_SIZE):
+        super().__init__()
+        self.writer = writer
+        self.capacity = capacity
+        self.buffer = []
+
+    def emit(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            records, self.buffer = self.buffer, []
+            if records:
+                try:
+                    self.writer(records)
+                except Exception as e:
+                    print(f"Error writing log batch: {e}")
+
+
+def flush_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, BatchingHandler):
+            handler.flush()
+
+
+# Shared state
+_lock = threading.Lock()
+_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_queue_handler = DroppingQueueHandler(_queue)
+_recent = RecentEventsHandler()
+_listener = None
+_channels = {}  # (channel, "file" or "batch") -> sink handler
+
+
+def _start():
+    """
+    Starts the background listener on first use.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        events = SharedRotatingFileHandler(EVENT_LOG_FILE, max_bytes=LOG_MAX_BYTES)
+        events.setFormatter(JsonFormatter())
+        root = logging.getLogger(LOGGER_PREFIX)
+        root.setLevel(LOGGING["level"])
+        root.propagate = False
+        root.addHandler(_queue_handler)
+        _listener = BatchListener(_queue, events, _recent, respect_handler_level=False)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def _add_sink(channel, kind, handler):
+    with _lock:
+        if (channel, kind) in _channels:
+            return
+        handler.addFilter(ChannelFilter(channel))
+        _channels[(channel, kind)] = handler
+        # The listener iterates this tuple per record; replacing it is atomic.
+        _listener.handlers = _listener.handlers + (handler,)
+
+
+def get_logger(channel, path=None, rotation="time"):
+    """
+    Returns the logger for a channel. With path, the channel's messages are
+    also written to that file as "timestamp - message" lines, rotated daily
+    (rotation="time") or at LOG_MAX_BYTES (rotation="size"). Files are
+    safe to share and rotate across processes.
+    """
+    _start()
+    if path is not None and (channel, "file") not in _channels:
+        if rotation == "size":
+            handler = SharedRotatingFileHandler(path, max_bytes=LOG_MAX_BYTES)
+        else:
+            handler = SharedRotatingFileHandler(path, daily=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s", LOGGING["datefmt"]))
+        _add_sink(channel, "file", handler)
+    return logging.getLogger(f"{LOGGER_PREFIX}.{channel}")
+
+
+def get_file_logger(path):
+    """
+    Returns a logger writing to an arbitrary text log file. Loggers are
+    keyed by the file's absolute path, so files that share a name in
+    different directories get separate handlers.
+    """
+    return get_logger("file:" + os.path.abspath(path), path)
+
+
+def add_batch_sink(channel, writer):
+    """
+    Sends a channel's records to writer(records) in batches on the
+    listener thread, e.g. for database inserts. A channel can have both a
+    file and a batch sink.
+    """
+    _start()
+    if (channel, "batch") not in _channels:
+        _add_sink(channel, "batch", BatchingHandler(writer))
+    return logging.getLogger(f"{LOGGER_PREFIX}.{channel}")
+
+
+def flush():
+    """
+    Blocks until every queued record has been handled and batching sinks
+    have written their buffers.
+    """
+    if _listener is None:
+        return
+    _queue.join()
+    flush_handlers(_listener.handlers)
+
+
+def recent_events(channel=None, limit=None):
+    """
+    Returns recent events, oldest first, optionally for one channel.
+    """
+    if channel is not None:
+        events = list(_recent.channels.get(channel, ()))
+    else:
+        events = sorted(
+            (event for events in list(_recent.channels.values()) for event in list(events)),
+            key=lambda event: event["seq"],
+        )
+    return events[-limit:] if limit else events
+
+
+def clear_channel(channel):
+    """
+    Empties a channel's log file and drops its in-memory events. The file
+    is truncated rather than deleted, so other processes appending to it
+    keep writing to the same file.
+    """
+    flush()
+    handler = _channels.get((channel, "file"))
+    if handler is not None:
+        with handler.lock, handler.locked():
+            if handler.stream is not None:
+                handler.stream.flush()
+            if os.path.exists(handler.baseFilename):
+                open(handler.baseFilename, "w").close()
+    _recent.channels.pop(channel, None)
+
+
+def stats():
+    """
+    Returns queue depth and drop counters.
+    """
+    return {"queued": _queue.qsize(), "dropped": _queue_handler.dropped}
+
+
+def shutdown():
+    """
+    Drains the queue and closes all sinks.
+    """
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is None:
+        return
+    listener.stop()
+    flush_handlers(listener.handlers)
+    for handler in listener.handlers:
+        handler.close()
+    logging.getLogger(LOGGER_PREFIX).removeHandler(_queue_handler)
+    _channels.clear()
+
+
+# Example usage
+if __name__ == "__main__":
+    logger = get_logger("example", "example_log.txt")
+    for i in range(5):
+        logger.info(f"Example event {i}", extra={"fields": {"index": i}})
+    flush()
+    for event in recent_events("example"):
+        print(event)
@@ -2,6 +2,8 @@
 # Telegram bot for plant monitoring and control system with extended features.
 
 import logging
+import math
+import threading
 from datetime import datetime, timedelta
 from threading import Timer
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
@@ -11,19 +13,46 @@ from telegram.ext import (
     CallbackQueryHandler,
     CallbackContext,
 )
-from sensors import get_sensor_data
 from ai_model import analyze_plant_image
+from config import SENSOR_SAMPLE_INTERVAL
+from actuators import ZoneBusyError
+from database import DEFAULT_PLANT, initialize_database, get_schedules
+import scheduler
+from job_queue import JobQueue, QueueFullError
+from sensor_snapshot import SharedSensorReadings
+from state_store import StateStore
+from utilities import RateLimiter
 
 # Constants
 TOKEN = "your-telegram-bot-token"
 LOG_FILE = "telegram_bot.log"
-SCHEDULE_FILE = "watering_schedule.txt"
 SYSTEM_STATUS = {
     "light": "off",
     "watering": "off",
     "plants": {"Plant1": {}, "Plant2": {}, "Plant3": {}},
 }
-WATERING_SCHEDULES = []
+
+# Background work for slow commands
+BOT_WORKERS = 4
+MAX_BOT_JOBS = 50  # Queued + running jobs across all chats
+MAX_JOBS_PER_CHAT = 2
+WORKING_MESSAGE = "Working…"
+
+# Manual actuator commands
+DEFAULT_WATERING_MINUTES = 5
+DEFAULT_LIGHT_MINUTES = 60
+bot_jobs = JobQueue(workers=BOT_WORKERS, max_pending=MAX_BOT_JOBS)
+chat_jobs = {}  # chat_id -> jobs queued or running for that chat
+chat_jobs_lock = threading.Lock()
+
+# /status readings shared with the web interface and sampler
+# Readings are reused for one sampler period (plus time for the sample
+# itself) before the bot reads the sensors on its own
+STATUS_CACHE_TTL = SENSOR_SAMPLE_INTERVAL + 15
+STATUS_USER_RATE = (0.2, 3)  # (commands per second, burst) per user
+shared_readings = SharedSensorReadings(StateStore())
+status_limiters = {}  # user id -> RateLimiter
+status_limiters_lock = threading.Lock()
 
 # Logging setup
 logging.basicConfig(
@@ -38,6 +67,65 @@ def log_action(user, action):
     """Logs user actions."""
     logger.info(f"User {user}: {action}")
 
+def _release_chat_slot(chat_id):
+    with chat_jobs_lock:
+        chat_jobs[chat_id] -= 1
+        if chat_jobs[chat_id] <= 0:
+            del chat_jobs[chat_id]
+
+def run_in_background(update, func, args, format_result, error_message, action):
+    """
+    Replies with a placeholder right away and runs func(*args) on the bot's
+    worker pool, editing the placeholder with format_result(result) or
+    error_message when it finishes. Each chat may have at most
+    MAX_JOBS_PER_CHAT jobs in flight, so one chat cannot fill the pool.
+    """
+    chat_id = update.effective_chat.id
+    user = update.effective_user.first_name
+    with chat_jobs_lock:
+        if chat_jobs.get(chat_id, 0) >= MAX_JOBS_PER_CHAT:
+            update.message.reply_text("You already have requests running. Please wait for them to finish.")
+            return None
+        chat_jobs[chat_id] = chat_jobs.get(chat_id, 0) + 1
+
+    message = update.message.reply_text(WORKING_MESSAGE)
+
+    def on_done(job):
+        _release_chat_slot(chat_id)
+        if job.status == "done":
+            text = format_result(job.result)
+            log_action(user, action)
+        else:
+            text = error_message
+            logger.error(f"Error in background job for {user}: {job.error}")
+        try:
+            message.edit_text(text)
+        except Exception as e:
+            logger.error(f"Error editing reply: {e}")
+
+    try:
+        job, _ = bot_jobs.submit(func, *args, on_done=on_done)
+        return job
+    except QueueFullError:
+        _release_chat_slot(chat_id)
+        message.edit_text("The bot is busy. Please try again in a moment.")
+        return None
+
+def bot_metrics():
+    """Returns worker pool queue depth and per-chat load."""
+    with chat_jobs_lock:
+        busy_chats = len(chat_jobs)
+        chat_in_flight = max(chat_jobs.values(), default=0)
+    return dict(bot_jobs.stats(), busy_chats=busy_chats, max_jobs_in_one_chat=chat_in_flight)
+
+def throttle_status(user_id):
+    """Returns 0 if the user may ask for status now, else the seconds to wait."""
+    with status_limiters_lock:
+        limiter = status_limiters.get(user_id)
+        if limiter is None:
+            limiter = status_limiters[user_id] = RateLimiter(*STATUS_USER_RATE)
+    return limiter.try_acquire()
+
 def format_status():
     """Formats the system's current status for display."""
     return (
@@ -58,32 +146,54 @@ def start(update: Update, context: CallbackContext) -> None:
     /status - Get current sensor data
     /analyze - Analyze plant health
     /set_schedule - Set watering or light schedule
-    /view_schedule - View all schedules
-    /cancel_schedule - Cancel a schedule
-    /water_now - Water plants immediately
-    /light_now - Turn on lights immediately
+    /view_schedule [device] - View schedules
+    /cancel_schedule [id] - Cancel one or all schedules
+    /water_now [minutes] [plant] - Water plants immediately
+    /light_now [minutes] [plant] - Turn on lights immediately
+    /queue - Show background work queue
     /help - Show this help message
     """
     update.message.reply_text(welcome_message)
     log_action(user.first_name, "started the bot")
 
 def status(update: Update, context: CallbackContext) -> None:
-    """Sends current system and sensor status."""
-    try:
-        sensor_data = get_sensor_data()
-        status_message = (
-            f"Sensor Data:\n"
-            f"- Soil Moisture: {sensor_data['soil_moisture']}%\n"
-            f"- Light Level: {sensor_data['light_level']} lumens\n"
-            f"- Temperature: {sensor_data['temperature']}°C\n"
-            f"- Humidity: {sensor_data['humidity']}%\n\n"
+    """
+    Sends current system and sensor status. Readings up to STATUS_CACHE_TTL
+    seconds old are answered at once; older ones are refreshed on the
+    worker pool with one sensor read shared by all concurrent requests.
+    """
+    wait = throttle_status(update.effective_user.id)
+    if wait:
+        update.message.reply_text(f"Too many status requests. Please wait {math.ceil(wait)} s.")
+        return
+
+    def format_sensor_status(readings):
+        # A reading may lack sensors (e.g. one that failed); show them as n/a
+        sensor_data = readings["data"] or {}
+        value = lambda name, unit: f"{sensor_data[name]}{unit}" if name in sensor_data else "n/a"
+        return (
+            f"Sensor Data (updated {int(readings['age'])} s ago):\n"
+            f"- Soil Moisture: {value('soil_moisture', '%')}\n"
+            f"- Light Level: {value('light_level', ' lumens')}\n"
+            f"- Temperature: {value('temperature', '°C')}\n"
+            f"- Humidity: {value('humidity', '%')}\n\n"
             f"System Status:\n{format_status()}"
         )
-        update.message.reply_text(status_message)
-        log_action(update.effective_user.first_name, "checked status")
+
+    try:
+        readings = shared_readings.cached(STATUS_CACHE_TTL)
     except Exception as e:
-        update.message.reply_text("Error retrieving sensor data.")
-        logger.error(f"Error in status command: {e}")
+        readings = None
+        logger.error(f"Error reading shared status: {e}")
+    if readings is not None:
+        update.message.reply_text(format_sensor_status(readings))
+        log_action(update.effective_user.first_name, "checked status")
+        return
+
+    run_in_background(
+        update, shared_readings.get, (STATUS_CACHE_TTL,), format_sensor_status,
+        "Error retrieving sensor data.", "checked status",
+    )
 
 def analyze(update: Update, context: CallbackContext) -> None:
     """Performs AI analysis on a plant's health."""
@@ -94,54 +204,131 @@ def analyze(update: Update, context: CallbackContext) -> None:
             return
 
         image_path = f"{plant_name}_image.jpg"
-        analysis = analyze_plant_image(image_path)
-        analysis_message = f"Health Analysis for {plant_name}:\n" + "\n".join(
-            [f"- {k}: {v:.2f}" for k, v in analysis.items()]
+
+        def format_analysis(analysis):
+            return f"Health Analysis for {plant_name}:\n" + "\n".join(
+                [f"- {k}: {v:.2f}" for k, v in analysis.items()]
+            )
+
+        # No chart window: the analysis runs on a worker thread.
+        run_in_background(
+            update, lambda: analyze_plant_image(image_path, visualize=False), (), format_analysis,
+            "Error analyzing the plant image.", f"analyzed {plant_name}",
         )
-        update.message.reply_text(analysis_message)
-        log_action(update.effective_user.first_name, f"analyzed {plant_name}")
     except Exception as e:
         update.message.reply_text("Error analyzing the plant image.")
         logger.error(f"Error in analyze command: {e}")
 
 def set_schedule(update: Update, context: CallbackContext) -> None:
-    """Adds a new watering or light schedule."""
+    """Adds a daily watering or light schedule for the scheduler process to run."""
     try:
         args = context.args
         if len(args) < 3:
-            update.message.reply_text("Usage: /set_schedule <device> <time> <duration>")
+            update.message.reply_text("Usage: /set_schedule <device> <HH:MM> <duration>")
             return
-        device, schedule_time, duration = args
-        WATERING_SCHEDULES.append((device, schedule_time, duration))
-        with open(SCHEDULE_FILE, "a") as f:
-            f.write(f"{device} {schedule_time} {duration}\n")
-        update.message.reply_text(f"{device.capitalize()} scheduled at {schedule_time} for {duration} minutes.")
+        device, schedule_time, duration = args[:3]
+        # Stored only: the scheduler process picks the schedule up.
+        schedule_id = scheduler.store_schedule(device, schedule_time, duration)
+        update.message.reply_text(
+            f"{device.capitalize()} scheduled at {schedule_time} for {duration} minutes (ID {schedule_id})."
+        )
         log_action(update.effective_user.first_name, f"scheduled {device} at {schedule_time}")
+    except ValueError as e:
+        update.message.reply_text(f"Invalid schedule: {e}")
     except Exception as e:
         update.message.reply_text("Error setting schedule.")
         logger.error(f"Error in set_schedule command: {e}")
 
 def view_schedule(update: Update, context: CallbackContext) -> None:
-    """Displays all active schedules."""
-    if not WATERING_SCHEDULES:
+    """Displays all active schedules, or those of one device."""
+    device = context.args[0] if context.args else None
+    schedules = get_schedules(scheduler.DEVICE_ALIASES.get(device, device))
+    if not schedules:
         update.message.reply_text("No active schedules.")
         return
     schedule_message = "Active Schedules:\n" + "\n".join(
-        [f"{device}: {time} for {duration} minutes" for device, time, duration in WATERING_SCHEDULES]
+        [f"#{schedule_id} {device}: {time} for {duration} minutes"
+         for schedule_id, device, time, duration, *_ in schedules]
     )
     update.message.reply_text(schedule_message)
     log_action(update.effective_user.first_name, "viewed schedules")
 
 def cancel_schedule(update: Update, context: CallbackContext) -> None:
-    """Cancels all active schedules."""
-    WATERING_SCHEDULES.clear()
-    with open(SCHEDULE_FILE, "w"):
-        pass
+    """Cancels one schedule by ID, or all schedules."""
+    if context.args:
+        try:
+            schedule_id = int(context.args[0])
+        except ValueError:
+            update.message.reply_text("Usage: /cancel_schedule [id]")
+            return
+        if scheduler.cancel_schedule(schedule_id):
+            update.message.reply_text(f"Schedule {schedule_id} canceled.")
+            log_action(update.effective_user.first_name, f"canceled schedule {schedule_id}")
+        else:
+            update.message.reply_text(f"No schedule with ID {schedule_id}.")
+        return
+    scheduler.cancel_all_schedules()
     update.message.reply_text("All schedules canceled.")
     log_action(update.effective_user.first_name, "canceled all schedules")
 
+def _parse_run_args(args, default_minutes):
+    """Parses optional [minutes] [plant] command arguments."""
+    minutes = float(args[0]) if args else default_minutes
+    plant = args[1] if len(args) > 1 else DEFAULT_PLANT
+    if plant not in SYSTEM_STATUS["plants"]:
+        raise ValueError(f"Unknown plant: {plant}")
+    return minutes, plant
+
+def water_now(update: Update, context: CallbackContext) -> None:
+    """Starts watering a plant without waiting for it to finish."""
+    try:
+        minutes, plant = _parse_run_args(context.args, DEFAULT_WATERING_MINUTES)
+        scheduler.executor.start("watering", plant, minutes * 60)
+        update.message.reply_text(f"Watering {plant} for {minutes:g} minutes.")
+        log_action(update.effective_user.first_name, f"watered {plant}")
+    except ZoneBusyError as e:
+        update.message.reply_text(str(e))
+    except ValueError as e:
+        update.message.reply_text(f"Usage: /water_now [minutes] [plant] ({e})")
+    except Exception as e:
+        update.message.reply_text("Error starting watering.")
+        logger.error(f"Error in water_now command: {e}")
+
+def light_now(update: Update, context: CallbackContext) -> None:
+    """Turns a plant's lights on for a while."""
+    try:
+        minutes, plant = _parse_run_args(context.args, DEFAULT_LIGHT_MINUTES)
+        scheduler.executor.start("lighting", plant, minutes * 60, replace=True)
+        update.message.reply_text(f"Lights on for {plant} for {minutes:g} minutes.")
+        log_action(update.effective_user.first_name, f"turned on lights for {plant}")
+    except ZoneBusyError as e:
+        update.message.reply_text(str(e))
+    except ValueError as e:
+        update.message.reply_text(f"Usage: /light_now [minutes] [plant] ({e})")
+    except Exception as e:
+        update.message.reply_text("Error turning on lights.")
+        logger.error(f"Error in light_now command: {e}")
+
+def queue(update: Update, context: CallbackContext) -> None:
+    """Shows the background worker queue depth."""
+    metrics = bot_metrics()
+    update.message.reply_text(
+        f"Workers: {metrics['workers']}\n"
+        f"Queued: {metrics['queued']}\n"
+        f"Running: {metrics['running']}\n"
+        f"Completed: {metrics['completed']}\n"
+        f"Failed: {metrics['failed']}\n"
+        f"Busy chats: {metrics['busy_chats']}"
+    )
+
 def start_bot():
-    """Starts the Telegram bot."""
+    """
+    Starts the Telegram bot. Schedules run in the scheduler process
+    (python scheduler.py); the bot only stores them, and its timer just
+    ends the manual runs started by /water_now and /light_now.
+    """
+    initialize_database()
+    scheduler.timer.start()
     updater = Updater(TOKEN)
 
     updater.dispatcher.add_handler(CommandHandler("start", start))
@@ -150,6 +337,9 @@ def start_bot():
     updater.dispatcher.add_handler(CommandHandler("set_schedule", set_schedule))
     updater.dispatcher.add_handler(CommandHandler("view_schedule", view_schedule))
     updater.dispatcher.add_handler(CommandHandler("cancel_schedule", cancel_schedule))
+    updater.dispatcher.add_handler(CommandHandler("water_now", water_now))
+    updater.dispatcher.add_handler(CommandHandler("light_now", light_now))
+    updater.dispatcher.add_handler(CommandHandler("queue", queue))
 
     logger.info("Starting Telegram bot...")
     updater.start_polling()
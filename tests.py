@@ -1,18 +1,72 @@
 # tests.py
 # Unit tests for the Plant Monitoring System.
 
+import atexit
+import glob
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime
+import numpy as np
 from sensors import get_sensor_data, read_soil_moisture
-from ai_model import preprocess_image, analyze_plant_image
+from ai_model import preprocess_image, analyze_plant_image, read_analysis_log
 from database import (
     initialize_database,
     add_sensor_data,
     get_sensor_data_history,
     add_log,
     get_logs,
+    get_schedules,
+    add_actuator_run,
+    get_actuator_runs,
+    interrupt_actuator_runs,
+    set_schedule_last_run,
+    add_sensor_batches,
+    update_schedules,
+    delete_schedules,
 )
-from utilities import validate_schedule_time, format_sensor_data
-from notifier import send_telegram_notification
+from sensor_snapshot import SensorSnapshot, SharedSensorReadings
+from event_stream import EventBroadcaster
+from state_store import StateStore, SamplerLock
+import state_store
+from job_queue import JobQueue
+from downsampling import lttb
+from log_reader import tail_lines, LogIndex, follow
+import system_logging
+from numpy_inference import NumpyCNN, conv2d, depthwise_conv2d, max_pool2d
+from dataset_cache import build_shards, ShardedDataset
+from quantization import quantize_per_channel, quantize_model, model_size_bytes
+from training_profiler import EpochRecorder, build_report, find_regressions
+from utilities import validate_schedule_time, format_sensor_data, validate_sensor_batch, log_action, read_logs
+from flask import Flask
+from http_cache import ResponseCache
+from ingest import encode_binary, decode_payload, ingest_batches, BINARY_CONTENT_TYPE
+from notifier import send_telegram_notification, NotificationDispatcher, TelegramClient, EmailClient, _similarity_key
+import telegram_bot
+import scheduler
+from timer_scheduler import TimerScheduler
+from actuators import ActuatorExecutor, ZoneBusyError
+from rule_engine import Rule, RuleEngine
+import database
+from job_leases import JOB_RUN_RETENTION, LeaseCoordinator, rendezvous_rank
+
+HAS_TENSORFLOW = importlib.util.find_spec("tensorflow") is not None
+
+# Keep the database and structured event log of test runs out of the
+# working tree
+TEST_DIRECTORY = tempfile.mkdtemp(prefix="plant-tests-")
+atexit.register(shutil.rmtree, TEST_DIRECTORY, True)
+database.DATABASE_FILE = os.path.join(TEST_DIRECTORY, "plant_monitoring.db")
+system_logging.EVENT_LOG_FILE = os.path.join(TEST_DIRECTORY, "events.jsonl")
 
 class TestSensors(unittest.TestCase):
     def test_get_sensor_data(self):
@@ -33,14 +87,227 @@ class TestSensors(unittest.TestCase):
         self.assertGreaterEqual(value, 0)
         self.assertLessEqual(value, 100)
 
+class TestSensorSnapshot(unittest.TestCase):
+    def test_refresh_coalesces_concurrent_reads(self):
+        """
+        Tests that concurrent refreshes share one sensor read.
+        """
+        import threading
+        import time
+
+        calls = []
+
+        def slow_reader():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"soil_moisture": 50, "light_level": 300, "temperature": 22.0, "humidity": 50.0}
+
+        snapshot = SensorSnapshot(reader=slow_reader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(snapshot.refresh())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({result["version"] for result in results}, {1})
+
+    def test_get_fresh_respects_max_age(self):
+        """
+        Tests that a recent snapshot is served without a new read.
+        """
+        calls = []
+        snapshot = SensorSnapshot(reader=lambda: calls.append(1) or {"soil_moisture": 40})
+        self.assertIsNone(snapshot.get()["age"])
+        snapshot.get_fresh(max_age=60)
+        snapshot.get_fresh(max_age=60)
+        self.assertEqual(len(calls), 1)
+        snapshot.get_fresh(max_age=0)
+        self.assertEqual(len(calls), 2)
+
+class TestEventStream(unittest.TestCase):
+    def test_publish_fans_out_to_all_clients(self):
+        """
+        Tests that every subscriber receives each event once.
+        """
+        broadcaster = EventBroadcaster()
+        subscribers = [broadcaster.subscribe() for _ in range(3)]
+        broadcaster.publish("control", {"device": "light", "action": "on"})
+        for subscriber in subscribers:
+            message = subscriber.queue.get_nowait()
+            self.assertIn("event: control", message)
+            self.assertIn('"action": "on"', message)
+
+    def test_slow_consumer_is_evicted(self):
+        """
+        Tests that a client with a full buffer is dropped and told so.
+        """
+        broadcaster = EventBroadcaster(buffer_size=2)
+        slow = broadcaster.subscribe()
+        for i in range(3):
+            broadcaster.publish("sensor_data", {"i": i})
+        self.assertTrue(slow.evicted)
+        self.assertEqual(broadcaster.client_count(), 0)
+        stream = broadcaster.stream(slow)
+        next(stream)  # retry hint
+        self.assertIn("event: evicted", next(stream))
+
+    def test_replay_after_last_event_id(self):
+        """
+        Tests that reconnecting clients get events they missed.
+        """
+        broadcaster = EventBroadcaster()
+        first = broadcaster.publish("control", {"n": 1})
+        broadcaster.publish("control", {"n": 2})
+        subscriber = broadcaster.subscribe(last_event_id=first)
+        self.assertIn('"n": 2', subscriber.queue.get_nowait())
+        self.assertTrue(subscriber.queue.empty())
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_writes_are_shared_and_versioned(self):
+        """
+        Tests that a second store on the same file sees writes, versions
+        and change-feed events, and that reset restores defaults.
+        """
+        writer = StateStore(self.path, defaults={"light": "off"})
+        reader = StateStore(self.path, defaults={"light": "off"})
+        version = writer.write({"light": "on"}, "control", {"device": "light"})
+        self.assertEqual(reader.get_entry("light")[:2], ("on", version))
+        self.assertEqual(reader.events_since(0), [(version, "control", {"device": "light"})])
+        writer.reset()
+        self.assertEqual(reader.get_all(), {"light": "off"})
+        self.assertGreater(reader.version(), version)
+
+    def test_jobs_and_logs_are_shared(self):
+        """
+        Tests that job records and recent logs written by one worker are
+        visible to another, that a late "queued" record never overwrites a
+        finished job, and that logs are bounded and clearable.
+        """
+        writer, reader = StateStore(self.path), StateStore(self.path)
+        writer.save_job("job-1", {"status": "done", "result": {"Healthy": 0.9}})
+        writer.save_job("job-1", {"status": "queued"}, replace=False)
+        self.assertEqual(reader.get_job("job-1")["status"], "done")
+        self.assertIsNone(reader.get_job("job-2"))
+
+        writer.append_logs("web", [(float(i), f"entry {i}") for i in range(state_store.LOG_RETENTION + 5)])
+        writer.append_logs("other", [(0.0, "kept")])
+        logs = reader.recent_logs("web")
+        self.assertEqual(len(logs), state_store.LOG_RETENTION)
+        self.assertEqual(logs[-1], (float(state_store.LOG_RETENTION + 4), f"entry {state_store.LOG_RETENTION + 4}"))
+        writer.clear_logs("web")
+        self.assertEqual(reader.recent_logs("web"), [])
+        self.assertEqual(reader.recent_logs("other"), [(0.0, "kept")])
+
+    def test_shared_readings_single_flight(self):
+        """
+        Tests that concurrent requests for stale readings cost one sensor
+        read and one published version, and that fresh readings are reused.
+        """
+        calls = []
+
+        def slow_reader():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"soil_moisture": 40}
+
+        store = StateStore(self.path, defaults={"sensor_data": {}})
+        readings = SharedSensorReadings(store, SensorSnapshot(reader=slow_reader))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(readings.get(10))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({result["version"] for result in results}, {1})
+        cached = readings.get(10)
+        self.assertFalse(cached["refreshed"])
+        self.assertEqual(cached["data"], {"soil_moisture": 40})
+        self.assertIsNone(readings.cached(-1))
+
+        # A reset leaves empty readings, which must not be served as fresh
+        store.reset()
+        self.assertIsNone(readings.cached(10))
+        readings.snapshot.clear()
+        self.assertTrue(readings.get(10)["refreshed"])
+        self.assertEqual(len(calls), 2)
+
+    def test_sampler_lock_is_exclusive(self):
+        """
+        Tests that only one holder gets the sampler lock until it is released.
+        """
+        path = os.path.join(self.directory.name, "sampler.lock")
+        first, second = SamplerLock(path), SamplerLock(path)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+class TestJobQueue(unittest.TestCase):
+    def test_jobs_run_and_deduplicate(self):
+        """
+        Tests that identical in-flight jobs share one execution.
+        """
+        import threading
+
+        release = threading.Event()
+        calls = []
+
+        def work(plant):
+            calls.append(plant)
+            release.wait(5)
+            return {"plant": plant}
+
+        jobs = JobQueue(workers=2)
+        first, created = jobs.submit(work, "Plant1", key="analyze:Plant1")
+        second, created_again = jobs.submit(work, "Plant1", key="analyze:Plant1")
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertIs(first, second)
+
+        release.set()
+        self.assertTrue(first.done.wait(5))
+        self.assertEqual(first.status, "done")
+        self.assertEqual(first.result, {"plant": "Plant1"})
+        self.assertEqual(calls, ["Plant1"])
+        self.assertIs(jobs.get(first.id), first)
+        jobs.shutdown()
+
+    def test_failed_job_records_error(self):
+        """
+        Tests that exceptions are captured on the job.
+        """
+        jobs = JobQueue(workers=1)
+        job, _ = jobs.submit(lambda: 1 / 0)
+        job.done.wait(5)
+        self.assertEqual(job.status, "error")
+        self.assertEqual(jobs.stats()["failed"], 1)
+        jobs.shutdown()
+
 class TestAIModel(unittest.TestCase):
     def test_preprocess_image(self):
         """
-        Tests if the image preprocessing returns a valid array.
+        Tests that preprocessing loads the image file, resized and scaled
+        to [0, 1].
         """
-        image_path = "test_image.jpg"
-        array = preprocess_image(image_path)
+        from PIL import Image
+
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, "test_image.png")
+            Image.new("RGB", (64, 48), (255, 0, 0)).save(image_path)
+            array = preprocess_image(image_path)
         self.assertEqual(array.shape, (224, 224, 3))
+        self.assertEqual(array.dtype, np.float32)
+        np.testing.assert_allclose(array[0, 0], [1.0, 0.0, 0.0])
 
     def test_analyze_plant_image(self):
         """
@@ -51,6 +318,333 @@ class TestAIModel(unittest.TestCase):
         self.assertIn("Healthy", result)
         self.assertIn("Diseased", result)
 
+    def test_read_analysis_log(self):
+        """
+        Tests parsing analysis log entries and skipping malformed lines.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, "analysis_log.txt")
+            with open(log_file, "w") as f:
+                f.write("2024-11-19 08:00:00 - images/plant_image_1.jpg: {'Healthy': 0.9, 'Diseased': 0.1}\n")
+                f.write("not a log line\n")
+            entries = read_analysis_log(log_file)
+        self.assertEqual(len(entries), 1)
+        timestamp, image_path, analysis = entries[0]
+        self.assertEqual(image_path, "images/plant_image_1.jpg")
+        self.assertEqual(analysis["Healthy"], 0.9)
+        self.assertEqual(timestamp.hour, 8)
+
+def build_tiny_numpy_model():
+    """
+    Builds a small random Conv/Pool/Dense NumpyCNN on 8x8 RGB inputs.
+    """
+    rng = np.random.default_rng(0)
+    layers = [
+        {"type": "conv2d", "activation": "relu", "strides": [1, 1], "padding": "valid"},
+        {"type": "maxpool", "pool_size": [2, 2], "strides": [2, 2], "padding": "valid"},
+        {"type": "flatten"},
+        {"type": "dense", "activation": "softmax"},
+    ]
+    weights = {
+        "0/kernel": rng.standard_normal((3, 3, 3, 4)).astype(np.float32),
+        "0/bias": rng.standard_normal(4).astype(np.float32),
+        "3/kernel": rng.standard_normal((3 * 3 * 4, 4)).astype(np.float32),
+        "3/bias": rng.standard_normal(4).astype(np.float32),
+    }
+    return NumpyCNN(layers, weights, input_shape=(8, 8, 3))
+
+class TestNumpyInference(unittest.TestCase):
+    def test_conv2d_matches_reference(self):
+        """
+        Tests the im2col convolution against a direct loop implementation.
+        """
+        rng = np.random.default_rng(1)
+        x = rng.standard_normal((2, 6, 7, 3)).astype(np.float32)
+        kernel = rng.standard_normal((3, 3, 3, 5)).astype(np.float32)
+        expected = np.zeros((2, 4, 5, 5), dtype=np.float32)
+        for i in range(4):
+            for j in range(5):
+                patch = x[:, i:i + 3, j:j + 3, :]
+                expected[:, i, j, :] = np.tensordot(patch, kernel, axes=([1, 2, 3], [0, 1, 2]))
+        np.testing.assert_allclose(conv2d(x, kernel), expected, rtol=1e-5, atol=1e-5)
+
+    def test_depthwise_conv2d_matches_per_channel_conv(self):
+        """
+        Tests depthwise convolution against one conv2d per input channel.
+        """
+        rng = np.random.default_rng(4)
+        x = rng.standard_normal((1, 5, 5, 3)).astype(np.float32)
+        kernel = rng.standard_normal((3, 3, 3, 2)).astype(np.float32)
+        out = depthwise_conv2d(x, kernel)
+        for c in range(3):
+            expected = conv2d(x[..., c:c + 1], kernel[:, :, c:c + 1, :])
+            np.testing.assert_allclose(out[..., c * 2:c * 2 + 2], expected, rtol=1e-5, atol=1e-5)
+
+    def test_max_pool2d(self):
+        """
+        Tests 2x2 max pooling on a known input.
+        """
+        x = np.arange(16, dtype=np.float32).reshape(1, 4, 4, 1)
+        pooled = max_pool2d(x)
+        self.assertEqual(pooled[..., 0].tolist(), [[[5, 7], [13, 15]]])
+
+    def test_predict_and_roundtrip(self):
+        """
+        Tests batched prediction and saving/loading the .npz archive.
+        """
+        model = build_tiny_numpy_model()
+        images = np.random.rand(3, 8, 8, 3)
+        predictions = model.predict(images, batch_size=2)
+        self.assertEqual(predictions.shape, (3, 4))
+        np.testing.assert_allclose(predictions.sum(axis=1), 1.0, rtol=1e-5)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.npz")
+            model.save(path)
+            loaded = NumpyCNN.load(path)
+        np.testing.assert_allclose(loaded.predict(images, batch_size=2), predictions, rtol=1e-6)
+
+class TestQuantization(unittest.TestCase):
+    def test_quantize_per_channel(self):
+        """
+        Tests that per-channel int8 weights reconstruct the float kernel.
+        """
+        kernel = np.random.default_rng(2).standard_normal((3, 3, 8, 6)).astype(np.float32)
+        q_kernel, scales = quantize_per_channel(kernel)
+        self.assertEqual(q_kernel.dtype, np.int8)
+        self.assertEqual(scales.shape, (6,))
+        np.testing.assert_allclose(q_kernel * scales, kernel, atol=scales.max() / 2 + 1e-6)
+
+    def test_quantized_model_matches_float(self):
+        """
+        Tests that the int8 model stays close to the float model.
+        """
+        model = build_tiny_numpy_model()
+        images = np.random.default_rng(3).random((16, 8, 8, 3)).astype(np.float32)
+        quantized = quantize_model(model, images[:8])
+        np.testing.assert_allclose(quantized.predict(images), model.predict(images), atol=0.05)
+        self.assertLess(model_size_bytes(quantized), model_size_bytes(model))
+
+class TestDatasetCache(unittest.TestCase):
+    def write_image(self, path, value):
+        from PIL import Image
+
+        Image.fromarray(np.full((10, 12, 3), value, dtype=np.uint8)).save(path)
+
+    def test_build_and_refresh_shards(self):
+        """
+        Tests that shards hold resized images and only changed files are decoded.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "train")
+            for name in ("Diseased", "Healthy"):
+                os.makedirs(os.path.join(source, name))
+            for i in range(3):
+                self.write_image(os.path.join(source, "Diseased", f"{i}.png"), i)
+                self.write_image(os.path.join(source, "Healthy", f"{i}.png"), 100 + i)
+            split_dir = os.path.join(directory, "cache")
+
+            manifest = build_shards(source, split_dir, image_size=(4, 4), shard_size=4)
+            self.assertEqual(manifest["last_build"]["decoded"], 6)
+            dataset = ShardedDataset(split_dir)
+            self.assertEqual(len(dataset), 6)
+            images, labels = dataset.get([0, 5])
+            self.assertEqual(images.shape, (2, 4, 4, 3))
+            self.assertEqual(labels.tolist(), [0, 1])
+            self.assertEqual(int(images[1, 0, 0, 0]), 102)
+
+            self.write_image(os.path.join(source, "Healthy", "3.png"), 200)
+            manifest = build_shards(source, split_dir, image_size=(4, 4), shard_size=4)
+            self.assertEqual(manifest["last_build"], {"decoded": 1, "reused": 6})
+            batches = list(ShardedDataset(split_dir).batches(4))
+            self.assertEqual([len(images) for images, _ in batches], [4, 3])
+
+    def test_empty_split(self):
+        """
+        Tests that an empty split builds and reads as empty instead of failing.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "validation")
+            os.makedirs(os.path.join(source, "Healthy"))
+            split_dir = os.path.join(directory, "cache")
+            build_shards(source, split_dir, image_size=(4, 4))
+            dataset = ShardedDataset(split_dir)
+            self.assertEqual(len(dataset), 0)
+            images, labels = dataset.get([])
+            self.assertEqual(images.shape, (0, 4, 4, 3))
+            self.assertEqual(len(labels), 0)
+            self.assertEqual(list(dataset.batches(4)), [])
+            with self.assertRaises(IndexError):
+                dataset.get([0])
+
+def write_image_tree(directory, classes, per_class, size=(10, 12)):
+    """
+    Writes a class-per-subdirectory tree of solid-colour PNGs and returns
+    (path, label) samples.
+    """
+    from PIL import Image
+
+    samples = []
+    for label, name in enumerate(classes):
+        os.makedirs(os.path.join(directory, name))
+        for i in range(per_class):
+            path = os.path.join(directory, name, f"{i}.png")
+            Image.fromarray(np.full((*size, 3), 50 * label + i, dtype=np.uint8)).save(path)
+            samples.append((path, label))
+    return samples
+
+@unittest.skipUnless(HAS_TENSORFLOW, "TensorFlow is not installed")
+class TestDataPipeline(unittest.TestCase):
+    def test_batches_and_input_stall_with_complete_cache(self):
+        """
+        Tests that the pipeline yields scaled images with one-hot labels and
+        that measuring the input stall reads a full epoch first, leaving a
+        complete on-disk cache.
+        """
+        import tensorflow as tf
+        import data_pipeline
+
+        with tempfile.TemporaryDirectory() as directory:
+            samples = write_image_tree(os.path.join(directory, "train"), ["Diseased", "Healthy"], 5)
+            original = data_pipeline.CACHE_DIR
+            data_pipeline.CACHE_DIR = os.path.join(directory, "cache")
+            try:
+                dataset = data_pipeline.build_dataset_from_samples(samples, 2, (8, 8), 4, cache_name="test")
+                batches = list(dataset)
+                self.assertEqual([images.shape[0] for images, _ in batches], [4, 4, 2])
+                images, labels = batches[0]
+                self.assertEqual(tuple(images.shape[1:]), (8, 8, 3))
+                self.assertLessEqual(float(tf.reduce_max(images)), 1.0)
+                self.assertEqual(labels.numpy().sum(axis=1).tolist(), [1, 1, 1, 1])
+
+                model = tf.keras.Sequential([
+                    tf.keras.Input((8, 8, 3)),
+                    tf.keras.layers.Flatten(),
+                    tf.keras.layers.Dense(2, activation="softmax"),
+                ])
+                dataset = data_pipeline.build_dataset_from_samples(samples, 2, (8, 8), 4, cache_name="stall")
+                report = data_pipeline.measure_input_stall(model, dataset, steps=3)
+                self.assertEqual(report["steps"], 3)
+                self.assertGreaterEqual(report["stall_sec_per_step"], 0.0)
+                self.assertIn(report["bound"], ("input", "compute"))
+                self.assertEqual(len(glob.glob(os.path.join(data_pipeline.CACHE_DIR, "stall-*.index"))), 1)
+            finally:
+                data_pipeline.CACHE_DIR = original
+
+@unittest.skipUnless(HAS_TENSORFLOW, "TensorFlow is not installed")
+class TestFineTuning(unittest.TestCase):
+    def test_collects_new_labelled_samples_and_replay_buffer(self):
+        """
+        Tests that production samples take manual labels first, then
+        confident logged predictions newer than the saved state, and that
+        the replay buffer samples the training tree.
+        """
+        from datetime import datetime
+        import fine_tuning
+
+        with tempfile.TemporaryDirectory() as directory:
+            image_dir = os.path.join(directory, "images")
+            os.makedirs(image_dir)
+            for name in ("a", "b", "c", "d", "e"):
+                open(os.path.join(image_dir, f"{name}.png"), "w").close()
+            log_file = os.path.join(directory, "analysis_log.txt")
+            with open(log_file, "w") as f:
+                f.write(f"2024-11-18 08:00:00 - {image_dir}/e.png: {{'Diseased': 0.1, 'Healthy': 0.9}}\n")
+                f.write(f"2024-11-19 08:00:00 - {image_dir}/a.png: {{'Diseased': 0.1, 'Healthy': 0.9}}\n")
+                f.write(f"2024-11-19 08:01:00 - {image_dir}/b.png: {{'Diseased': 0.4, 'Healthy': 0.6}}\n")
+                f.write(f"2024-11-19 08:02:00 - {image_dir}/c.png: {{'Diseased': 0.95, 'Healthy': 0.05}}\n")
+            labels_file = os.path.join(image_dir, "labels.json")
+            with open(labels_file, "w") as f:
+                json.dump({"c.png": "Healthy", "d.png": "Diseased"}, f)
+            train_dir = os.path.join(directory, "train")
+            write_image_tree(train_dir, ["Diseased", "Healthy"], 3)
+
+            names = ("IMAGE_DIRECTORY", "LABELS_FILE", "ANALYSIS_LOG_FILE", "TRAINING_DIR", "STATE_FILE")
+            originals = {name: getattr(fine_tuning, name) for name in names}
+            fine_tuning.IMAGE_DIRECTORY, fine_tuning.LABELS_FILE = image_dir, labels_file
+            fine_tuning.ANALYSIS_LOG_FILE, fine_tuning.TRAINING_DIR = log_file, train_dir
+            fine_tuning.STATE_FILE = os.path.join(directory, "state.json")
+            try:
+                since = datetime(2024, 11, 18, 12, 0)
+                samples, newest = fine_tuning.collect_production_samples(["Diseased", "Healthy"], since)
+                self.assertEqual(
+                    [(os.path.basename(path), label) for path, label in samples],
+                    [("a.png", 1), ("c.png", 1), ("d.png", 0)],
+                )
+                self.assertGreater(newest, datetime(2024, 11, 19, 8, 2))
+                fine_tuning.save_state(newest)
+                self.assertEqual(fine_tuning.load_state(), newest.replace(microsecond=0))
+
+                replay = fine_tuning.sample_replay_buffer(4)
+                self.assertEqual(len(set(replay)), 4)
+                self.assertEqual(len(fine_tuning.sample_replay_buffer(10)), 6)
+            finally:
+                for name, value in originals.items():
+                    setattr(fine_tuning, name, value)
+
+def profile_epoch(epoch, wall_time, images_per_sec, rss, val_accuracy, input_time=None):
+    return {
+        "epoch": epoch, "wall_time_sec": wall_time, "images_per_sec": images_per_sec,
+        "peak_rss_mb": rss, "val_accuracy": val_accuracy, "input_time_sec": input_time,
+    }
+
+class TestTrainingProfiler(unittest.TestCase):
+    def test_report_skips_warm_up_epoch(self):
+        """
+        Tests that averages leave out the first (warm-up) epoch while peak
+        memory and best accuracy cover every epoch.
+        """
+        epochs = [
+            profile_epoch(1, 30.0, 50.0, 900, 0.60, input_time=20.0),
+            profile_epoch(2, 10.0, 150.0, 800, 0.80, input_time=2.0),
+            profile_epoch(3, 12.0, 130.0, 850, 0.75, input_time=3.0),
+        ]
+        summary = build_report(epochs, 52.0, {"pipeline": "tfdata"})["summary"]
+        self.assertEqual(summary["epochs"], 3)
+        self.assertAlmostEqual(summary["mean_epoch_time_sec"], 11.0)
+        self.assertAlmostEqual(summary["mean_images_per_sec"], 140.0)
+        self.assertEqual(summary["peak_rss_mb"], 900)
+        self.assertEqual(summary["best_val_accuracy"], 0.80)
+        self.assertAlmostEqual(summary["input_time_fraction"], 5.0 / 22.0)
+
+    def test_find_regressions(self):
+        """
+        Tests that slowdowns, memory growth and accuracy drops beyond the
+        tolerances are flagged and changes within them are not.
+        """
+        baseline = build_report([profile_epoch(1, 10.0, 100.0, 1000, 0.80)], 10.0)
+        similar = build_report([profile_epoch(1, 10.5, 95.0, 1050, 0.79)], 10.5)
+        self.assertEqual(find_regressions(similar, baseline), [])
+
+        worse = build_report([profile_epoch(1, 12.0, 80.0, 1200, 0.70)], 12.0)
+        regressions = find_regressions(worse, baseline)
+        self.assertEqual(len(regressions), 4)
+        self.assertTrue(regressions[0].startswith("Throughput dropped"))
+        self.assertTrue(regressions[-1].startswith("Validation accuracy dropped"))
+
+    def test_recorder_writes_report(self):
+        """
+        Tests that the callback hooks record epochs and write the report
+        without TensorFlow.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            report_path = os.path.join(directory, "profile.json")
+            recorder = EpochRecorder(batch_size=4, stall_sec_per_step=0.01,
+                                     report_path=report_path, baseline_path=None)
+            recorder.on_train_begin()
+            recorder.on_epoch_begin(0)
+            for batch in range(3):
+                recorder.on_train_batch_begin(batch)
+                recorder.on_train_batch_end(batch)
+            recorder.on_epoch_end(0, {"val_accuracy": 0.5})
+            recorder.on_train_end()
+            with open(report_path) as f:
+                report = json.load(f)
+        [epoch] = report["epochs"]
+        self.assertEqual((epoch["steps"], epoch["images"]), (3, 12))
+        self.assertAlmostEqual(epoch["input_time_sec"], 0.03)
+        self.assertEqual(report["regressions"], [])
+
 class TestDatabase(unittest.TestCase):
     def setUp(self):
         """
@@ -74,6 +668,700 @@ class TestDatabase(unittest.TestCase):
         logs = get_logs()
         self.assertGreater(len(logs), 0)
 
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        initialize_database()
+
+    def test_schedule_is_stored_live_and_cancelable(self):
+        """
+        Tests that a new schedule is stored, running and found by device
+        and time, that duplicates are reused and that cancelling removes it.
+        """
+        schedule_id = scheduler.create_schedule("water", "06:45", 5)
+        self.assertEqual(scheduler.create_schedule("watering", "06:45", 5), schedule_id)
+        self.assertIn(schedule_id, scheduler.scheduled_jobs)
+        rows = get_schedules("watering", "06:45")
+        self.assertEqual([row[0] for row in rows], [schedule_id])
+        with self.assertRaises(ValueError):
+            scheduler.create_schedule("watering", "25:00", 5)
+        with self.assertRaises(ValueError):
+            scheduler.create_schedule("watering", "06:50", 0)
+        with self.assertRaises(ValueError):
+            scheduler.store_schedule("watering", "06:50", 241)
+        self.assertEqual(get_schedules("watering", "06:50"), [])
+        self.assertTrue(scheduler.cancel_schedule(schedule_id))
+        self.assertNotIn(schedule_id, scheduler.scheduled_jobs)
+        self.assertEqual(get_schedules("watering", "06:45"), [])
+        self.assertFalse(scheduler.cancel_schedule(schedule_id))
+
+    def test_rehydration_catches_up_and_bulk_changes(self):
+        """
+        Tests that reloading after a restart rebuilds the jobs and catches
+        up a missed run only for run_once schedules, and that bulk modify
+        and cancel apply to all given schedules.
+        """
+        missed_time = time.strftime("%H:%M", time.localtime(time.time() - 3600))
+        ids = [
+            scheduler.create_schedule("watering", missed_time, 3, plant="Plant2", misfire_policy="run_once"),
+            scheduler.create_schedule("watering", missed_time, 3, plant="Plant3", misfire_policy="skip"),
+        ]
+        # Simulate a restart: last run two days ago, no live jobs
+        for schedule_id in ids:
+            set_schedule_last_run(schedule_id, time.time() - 2 * 24 * 3600)
+            scheduler.timer.cancel(scheduler.scheduled_jobs.pop(schedule_id))
+        result = scheduler.load_schedules()
+        self.assertEqual(result["caught_up"], 1)
+        self.assertTrue(all(schedule_id in scheduler.scheduled_jobs for schedule_id in ids))
+
+        self.assertEqual(scheduler.modify_schedules(ids, duration=7), 2)
+        self.assertEqual([row[3] for row in get_schedules(schedule_ids=ids)], [7, 7])
+        with self.assertRaises(ValueError):
+            scheduler.modify_schedules(ids, misfire_policy="sometimes")
+        self.assertEqual(scheduler.cancel_schedules(ids), 2)
+        self.assertEqual(get_schedules(schedule_ids=ids), [])
+
+    def test_sync_picks_up_schedules_stored_elsewhere(self):
+        """
+        Tests that schedules stored, changed or deleted by another process
+        (as the Telegram bot does) reach the live jobs on the next sync,
+        which reads only the changed schedules from the change feed.
+        """
+        scheduler.sync_schedules()
+        schedule_id = scheduler.store_schedule("light", "21:15", 0, "off")
+        self.assertNotIn(schedule_id, scheduler.scheduled_jobs)
+        self.assertEqual(scheduler.sync_schedules(), {"added": 1, "dropped": 0})
+        self.assertIn(schedule_id, scheduler.scheduled_jobs)
+        self.assertEqual(scheduler.sync_schedules(), {"added": 0, "dropped": 0})
+        version = database.get_schedule_version()
+        set_schedule_last_run(schedule_id, time.time())  # Not a change to the job
+        self.assertEqual(database.get_schedule_version(), version)
+
+        update_schedules([schedule_id], schedule_time="21:45")
+        self.assertEqual(database.get_schedule_changes(version), (version + 1, [schedule_id]))
+        self.assertEqual(scheduler.sync_schedules(), {"added": 1, "dropped": 1})
+        self.assertEqual(scheduler.scheduled_jobs[schedule_id].at, "21:45")
+
+        delete_schedules([schedule_id])
+        self.assertEqual(scheduler.sync_schedules(), {"added": 0, "dropped": 1})
+        self.assertNotIn(schedule_id, scheduler.scheduled_jobs)
+
+class TestTimerScheduler(unittest.TestCase):
+    def test_runs_due_jobs_in_order_and_skips_cancelled(self):
+        """
+        Tests deadline ordering, interval rescheduling and lazy cancel
+        with a fake clock.
+        """
+        now = [0.0]
+        timer = TimerScheduler(clock=lambda: now[0])
+        ran = []
+        timer.call_later(2, ran.append, "b")
+        timer.call_later(1, ran.append, "a")
+        cancelled = timer.call_later(1.5, ran.append, "x")
+        ticker = timer.add_interval(1, ran.append, "tick")
+        self.assertTrue(timer.cancel(cancelled))
+        self.assertFalse(timer.cancel(cancelled))
+        self.assertEqual(timer.next_delay(), 1)
+        now[0] = 2.5
+        self.assertEqual(timer.run_pending(), 3)
+        self.assertEqual(sorted(ran), ["a", "b", "tick"])
+        self.assertEqual(ticker.deadline, 3)
+        self.assertEqual(timer.stats()["jobs"], 1)
+
+    def test_loop_wakes_for_new_jobs_without_polling(self):
+        """
+        Tests that the run loop sleeps until woken by a new job and runs it
+        on time.
+        """
+        timer = TimerScheduler()
+        done = threading.Event()
+        timer.start()
+        try:
+            time.sleep(0.2)
+            self.assertEqual(timer.stats()["wakeups"], 0)
+            timer.call_later(0.05, done.set)
+            self.assertTrue(done.wait(2))
+            self.assertLessEqual(timer.stats()["wakeups"], 3)
+        finally:
+            timer.stop()
+
+class TestActuators(unittest.TestCase):
+    def setUp(self):
+        initialize_database()
+        interrupt_actuator_runs(time.time())
+        self.now = [1000.0]
+        self.switches = []
+        self.timer = TimerScheduler(clock=lambda: self.now[0])
+        self.executor = ActuatorExecutor(
+            self.timer, driver=lambda *args: self.switches.append(args), clock=lambda: self.now[0]
+        )
+
+    def test_timed_runs_are_concurrent_exclusive_and_persisted(self):
+        """
+        Tests that zones run concurrently without blocking, a busy zone is
+        refused, timed runs stop on their own and cancellation works.
+        """
+        first = self.executor.start("watering", "Plant1", 60)
+        self.executor.start("watering", "Plant2", 120)
+        with self.assertRaises(ZoneBusyError):
+            self.executor.start("watering", "Plant1", 30)
+        self.assertEqual(len(get_actuator_runs("running")), 2)
+
+        self.now[0] += 61
+        self.timer.run_pending()
+        self.assertEqual(first.status, "completed")
+        self.assertIn(("watering", "Plant1", "off"), self.switches)
+        self.assertEqual([run["zone"] for run in self.executor.active_runs()], ["Plant2"])
+
+        self.assertTrue(self.executor.stop("watering", "Plant2"))
+        self.assertEqual(self.executor.active_runs(), [])
+        self.assertEqual(get_actuator_runs("running"), [])
+        self.assertEqual(get_actuator_runs(limit=2)[0][7], "cancelled")
+
+    def test_recover_resumes_unfinished_runs(self):
+        """
+        Tests that runs left in flight by a stopped process are resumed for
+        their remaining time or switched off.
+        """
+        add_actuator_run("watering", "Plant3", "on", self.now[0] - 30, self.now[0] + 30)
+        add_actuator_run("lighting", "Plant3", "on", self.now[0] - 30, None)
+        self.assertEqual(self.executor.recover(), 1)
+        self.assertIn(("lighting", "Plant3", "off"), self.switches)
+        [run] = self.executor.active_runs()
+        self.assertEqual(run["ends"], self.now[0] + 30)
+        self.executor.stop_all()
+
+    def test_zones_are_exclusive_across_processes(self):
+        """
+        Tests that a zone running under another live process is refused,
+        while one held by an exited process is taken over.
+        """
+        other = ActuatorExecutor(self.timer, driver=lambda *args: None, clock=lambda: self.now[0],
+                                 owner=f"{socket.gethostname()}-{os.getppid()}")
+        other.start("watering", "Plant8", 60)
+        with self.assertRaises(ZoneBusyError):
+            self.executor.start("watering", "Plant8", 30, replace=True)
+        self.assertNotIn(("watering", "Plant8", "on"), self.switches)
+        other.stop_all()
+
+        exited = multiprocessing.Process(target=time.sleep, args=(0,))
+        exited.start()
+        exited.join()
+        add_actuator_run("watering", "Plant9", "on", self.now[0], self.now[0] + 60,
+                         f"{socket.gethostname()}-{exited.pid}")
+        self.executor.start("watering", "Plant9", 30)
+        self.assertEqual([row[2] for row in get_actuator_runs("running")], ["Plant9"])
+        self.executor.stop_all()
+
+    def test_recover_leaves_runs_of_live_processes(self):
+        """
+        Tests that recovery only takes over runs whose owner has exited (or
+        is named explicitly), not those of other live processes.
+        """
+        exited = multiprocessing.Process(target=time.sleep, args=(0,))
+        exited.start()
+        exited.join()
+        host = socket.gethostname()
+        add_actuator_run("watering", "Plant4", "on", self.now[0], self.now[0] + 60, f"{host}-{exited.pid}")
+        add_actuator_run("watering", "Plant5", "on", self.now[0], self.now[0] + 60, f"{host}-{os.getppid()}")
+        add_actuator_run("watering", "Plant6", "on", self.now[0], self.now[0] + 60, "other-host-42")
+        self.assertEqual(self.executor.recover(), 1)
+        self.assertEqual([run["zone"] for run in self.executor.active_runs()], ["Plant4"])
+        self.assertEqual(self.executor.recover(owners=["other-host-42"]), 1)
+        self.assertEqual(sorted(run["zone"] for run in self.executor.active_runs()), ["Plant4", "Plant6"])
+        self.assertIn("Plant5", [row[2] for row in get_actuator_runs("running")])
+        self.executor.stop_all()
+
+class TestRuleEngine(unittest.TestCase):
+    def test_hysteresis_hold_times_and_batches(self):
+        """
+        Tests that a rule fires below its threshold, ignores readings inside
+        the hysteresis band, resets above it, respects the minimum off time
+        and evaluates many plants per call.
+        """
+        rule = Rule("light", "light_level", on_below=200, band=100, actuator="lighting", min_off=60)
+        engine = RuleEngine([rule], notify=None)
+        plants = ["A", "B"]
+        self.assertEqual(
+            [(plant, state) for _, plant, state, _ in engine.evaluate(plants, {"light_level": [150, 500]}, now=0)],
+            [("A", "on")],
+        )
+        self.assertEqual(engine.evaluate(plants, {"light_level": [250, 500]}, now=10), [])
+        self.assertEqual([e[2] for e in engine.evaluate(["A"], {"light_level": [350]}, now=20)], ["off"])
+        self.assertEqual(engine.evaluate(["A"], {"light_level": [150]}, now=30), [])  # Held off
+        self.assertEqual([e[2] for e in engine.evaluate(["A"], {"light_level": [150]}, now=90)], ["on"])
+
+        many = [f"Plant{i}" for i in range(5000)]
+        values = np.where(np.arange(5000) % 2 == 0, 100.0, 400.0)
+        events = engine.evaluate(many, {"light_level": values}, now=100)
+        self.assertEqual(len(events), 2500)
+        self.assertTrue(engine.states("Plant0")["light"])
+
+    def test_apply_drives_actuators_and_alerts(self):
+        """
+        Tests that transitions start and stop actuators and send alerts,
+        and that a timed rule fires again only after its cooldown.
+        """
+        calls, alerts = [], []
+
+        class FakeExecutor:
+            def start(self, device, zone, duration=None, replace=False):
+                calls.append(("start", device, zone, duration))
+
+            def stop(self, device, zone):
+                calls.append(("stop", device, zone))
+
+        rule = Rule("water", "soil_moisture", on_below=30, band=10, actuator="watering",
+                    run_seconds=300, cooldown=1800, message="{plant} dry ({value:.0f}%)")
+        engine = RuleEngine([rule], executor=FakeExecutor(), notify=alerts.append)
+        engine.apply(engine.evaluate(["A"], {"soil_moisture": [20]}, now=0))
+        engine.apply(engine.evaluate(["A"], {"soil_moisture": [22]}, now=600))
+        engine.apply(engine.evaluate(["A"], {"soil_moisture": [22]}, now=1800))
+        engine.apply(engine.evaluate(["A"], {"soil_moisture": [45]}, now=2000))
+        self.assertEqual(calls, [
+            ("start", "watering", "A", 300),
+            ("start", "watering", "A", 300),
+            ("stop", "watering", "A"),
+        ])
+        self.assertEqual(alerts, ["A dry (20%)", "A dry (22%)"])
+
+    def test_tick_skips_stale_readings(self):
+        """
+        Tests that a new engine acts on fresh readings only, not on data
+        stored long before it started.
+        """
+        initialize_database()
+        now = time.time()
+        add_sensor_batches([
+            {"node": "test-node", "batch_id": f"stale-{now}", "plant": "StalePlant",
+             "readings": {"timestamp": [now - 3600], "soil_moisture": [5], "light_level": [300],
+                          "temperature": [20], "humidity": [50]}},
+            {"node": "test-node", "batch_id": f"fresh-{now}", "plant": "FreshPlant",
+             "readings": {"timestamp": [now], "soil_moisture": [5], "light_level": [300],
+                          "temperature": [20], "humidity": [50]}},
+        ])
+        rule = Rule("water", "soil_moisture", on_below=10, actuator="watering", run_seconds=60)
+        engine = RuleEngine([rule], notify=None)
+        plants = [plant for _, plant, state, _ in engine.tick() if state == "on"]
+        self.assertIn("FreshPlant", plants)
+        self.assertNotIn("StalePlant", plants)
+
+def _claim_all(path, node, jobs, run_key, now):
+    """
+    One scheduler node process: claims every job for run_key at a fixed
+    clock time, so the outcome does not depend on process timing.
+    """
+    database.DATABASE_FILE = path
+    coordinator = LeaseCoordinator(node, clock=lambda: now)
+    for job in jobs:
+        token = coordinator.claim(job, run_key)
+        if token is not None:
+            coordinator.complete(job, run_key, token)
+
+
+def _claims(path, run_key):
+    connection = sqlite3.connect(path)
+    rows = connection.execute("SELECT job, node FROM job_runs WHERE run_key = ?", (run_key,)).fetchall()
+    connection.close()
+    return dict(rows)
+
+
+class TestJobLeases(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "leases.db")
+        self.original = database.DATABASE_FILE
+        database.DATABASE_FILE = self.path
+        initialize_database()
+        self.jobs = [f"schedule-{i}" for i in range(60)]
+        self.now = [1000.0]
+
+    def tearDown(self):
+        database.DATABASE_FILE = self.original
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _node(self, name):
+        return LeaseCoordinator(name, lease_ttl=30, clock=lambda: self.now[0])
+
+    def _run_all(self, nodes, run_key):
+        for node in nodes:
+            for job in self.jobs:
+                token = node.claim(job, run_key)
+                if token is not None:
+                    node.complete(job, run_key, token)
+
+    def test_jobs_run_once_across_processes(self):
+        """
+        Tests with three node processes claiming concurrently that every
+        job is claimed exactly once, by its first-ranked node.
+        """
+        nodes = ["node-0", "node-1", "node-2"]
+        for name in nodes:
+            self._node(name).heartbeat()
+        processes = [
+            multiprocessing.Process(target=_claim_all, args=(self.path, name, self.jobs, "round-0", self.now[0]))
+            for name in nodes
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+        claims = _claims(self.path, "round-0")
+        self.assertEqual(claims, {job: rendezvous_rank(job, nodes)[0] for job in self.jobs})
+        self.assertEqual(set(claims.values()), set(nodes))
+
+    def test_scale_out_and_fail_over(self):
+        """
+        Tests with a fake clock that every job still runs exactly once when
+        a node joins (even for a node acting on an outdated view of the
+        pool) and when a node dies, and that the pool then recovers the dead
+        node's actuator runs.
+        """
+        nodes = {name: self._node(name) for name in ("node-0", "node-1", "node-2")}
+        for node in nodes.values():
+            node.heartbeat()
+        self._run_all(nodes.values(), "round-0")
+        self.assertEqual(sorted(_claims(self.path, "round-0")), sorted(self.jobs))
+
+        # Scale out: the new node takes over its share from the next run on,
+        # as completed runs leave no lease behind to wait for
+        self.now[0] += 10
+        nodes["node-3"] = self._node("node-3")
+        for node in nodes.values():
+            node.heartbeat()
+        self._run_all([nodes["node-3"]], "round-1")
+        moved = [job for job, node in _claims(self.path, "round-1").items() if node == "node-3"]
+        self.assertTrue(moved)
+        for job in moved:  # A node that has not yet seen node-3 cannot claim these runs again
+            token = database.acquire_lease(job, "node-0", self.now[0], self.now[0] + 30)
+            self.assertFalse(database.record_job_run(job, "round-1", "node-0", token, self.now[0]))
+        self._run_all([nodes[name] for name in ("node-0", "node-1", "node-2")], "round-1")
+        claims = _claims(self.path, "round-1")
+        self.assertEqual(claims, {job: rendezvous_rank(job, list(nodes))[0] for job in self.jobs})
+
+        # Fail over: node-0 stops heartbeating and its jobs move on
+        self.now[0] += 31
+        for name in ("node-1", "node-2", "node-3"):
+            nodes[name].heartbeat()
+        self._run_all(nodes.values(), "round-2")
+        survivors = ["node-1", "node-2", "node-3"]
+        self.assertEqual(_claims(self.path, "round-2"), {job: rendezvous_rank(job, survivors)[0] for job in self.jobs})
+        self.assertEqual(nodes["node-1"].dead_nodes(), ["node-0"])
+
+        # The pool takes over node-0's valve and then forgets the node
+        add_actuator_run("watering", "Plant7", "on", self.now[0] - 10, self.now[0] + 50, "node-0")
+        original = scheduler.coordinator, scheduler.executor
+        timer = TimerScheduler(clock=lambda: self.now[0])
+        scheduler.coordinator = nodes["node-1"]
+        scheduler.executor = ActuatorExecutor(timer, driver=lambda *args: None, clock=lambda: self.now[0],
+                                              owner="node-1")
+        try:
+            scheduler.pool_heartbeat()
+            self.assertEqual([run["zone"] for run in scheduler.executor.active_runs()], ["Plant7"])
+            self.assertEqual(nodes["node-1"].dead_nodes(), [])
+            self.assertEqual(nodes["node-1"].live_nodes(), survivors)
+            scheduler.executor.stop_all()
+        finally:
+            scheduler.coordinator, scheduler.executor = original
+
+    def test_run_is_taken_over_when_claimer_dies(self):
+        """
+        Tests that a run claimed by a node that dies before completing it
+        is run by a standby once the lease expires, that the dead node's
+        stale token can neither renew, complete nor release it, and that
+        old runs are pruned.
+        """
+        first, second = self._node("node-0"), self._node("node-1")
+        first.heartbeat()
+        second.heartbeat()
+        job = next(job for job in self.jobs if first.owner(job) == "node-0")
+        token = first.claim(job, "round-0")
+        self.assertIsNotNone(token)
+
+        # Heartbeats keep the lease while the owner lives
+        self.now[0] += 20
+        first.heartbeat()
+        second.heartbeat()
+        self.assertIsNone(database.acquire_lease(job, "node-1", self.now[0], self.now[0] + 30))
+        self.assertIsNone(second.claim(job, "round-0"))
+        self.assertFalse(second.has_run(job, "round-0"))
+
+        # node-0 dies before running the job; node-1 takes the run over
+        self.now[0] += 40
+        second.heartbeat()
+        new_token = second.claim(job, "round-0")
+        self.assertGreater(new_token, token)
+        first.heartbeat()  # node-0 comes back, but its lease has moved on
+        self.assertEqual(first.leases, {})
+        self.assertFalse(first.complete(job, "round-0", token))
+        self.assertIsNone(database.acquire_lease(job, "node-0", self.now[0], self.now[0] + 30))
+        self.assertTrue(second.complete(job, "round-0", new_token))
+        self.assertTrue(second.has_run(job, "round-0"))
+        self.assertEqual(_claims(self.path, "round-0"), {job: "node-1"})
+
+        self.now[0] += JOB_RUN_RETENTION + 1
+        self.assertEqual(second.prune(), 1)
+        self.assertEqual(_claims(self.path, "round-0"), {})
+
+    def test_run_key_is_the_slot_the_timer_was_armed_for(self):
+        """
+        Tests that a daily job whose monotonic deadline fires just before
+        the wall-clock time still claims today's run, not yesterday's.
+        """
+        node = self._node("node-0")
+        node.heartbeat()
+        wall = [datetime(2024, 11, 19, 7, 0).timestamp()]
+        mono = [0.0]
+        timer = TimerScheduler(clock=lambda: mono[0], wall_clock=lambda: wall[0])
+        original = scheduler.coordinator, scheduler.executor
+        scheduler.coordinator = node
+        scheduler.executor = ActuatorExecutor(timer, driver=lambda *args: None, owner="node-0")
+        try:
+            timer.add_daily("08:00", scheduler._run_schedule, 7, "lighting", "08:00", 0, "off", "Plant1",
+                            with_slot=True)
+            mono[0] = 3600
+            wall[0] += 3599.5  # The wall clock runs slightly behind
+            self.assertEqual(timer.run_pending(), 1)
+        finally:
+            scheduler.coordinator, scheduler.executor = original
+        self.assertEqual(_claims(self.path, "2024-11-19T08:00"), {"schedule-7": "node-0"})
+        self.assertTrue(node.has_run("schedule-7", "2024-11-19T08:00"))
+
+def _write_log_lines(path, writer, count):
+    """
+    One process appending count records to a small size-rotated log file.
+    """
+    handler = system_logging.SharedRotatingFileHandler(path, max_bytes=2000, backup_count=1000)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for i in range(count):
+        handler.emit(logging.makeLogRecord({"msg": f"{writer}-{i}"}))
+    handler.close()
+
+
+class TestSystemLogging(unittest.TestCase):
+    def test_shared_file_rotation_across_processes(self):
+        """
+        Tests that processes appending to and rotating one log file lose
+        no records, and that a daily rollover happens once, with every
+        writer moving to the new file.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shared.log")
+            processes = [
+                multiprocessing.Process(target=_write_log_lines, args=(path, writer, 300)) for writer in range(3)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join(60)
+            files = glob.glob(path + "*")
+            lines = []
+            for name in files:
+                if not name.endswith(".lock"):
+                    with open(name) as f:
+                        lines.extend(f.read().splitlines())
+            self.assertEqual(sorted(lines), sorted(f"{writer}-{i}" for writer in range(3) for i in range(300)))
+            self.assertGreater(len(files), 3)
+
+            # Two handlers on one file stand in for two processes: only the
+            # first to write after midnight rotates, the other follows it
+            daily_path = os.path.join(directory, "daily.log")
+            first, second = (system_logging.SharedRotatingFileHandler(daily_path, daily=True) for _ in range(2))
+            first.emit(logging.makeLogRecord({"msg": "first yesterday"}))
+            second.emit(logging.makeLogRecord({"msg": "second yesterday"}))
+            yesterday = time.time() - 24 * 3600
+            os.utime(daily_path, (yesterday, yesterday))
+            first.emit(logging.makeLogRecord({"msg": "first today"}))
+            second.emit(logging.makeLogRecord({"msg": "second today"}))
+            first.close()
+            second.close()
+            backup = f"{daily_path}.{time.strftime('%Y-%m-%d', time.localtime(yesterday))}"
+            with open(backup) as f:
+                self.assertEqual(f.read().splitlines(), ["first yesterday", "second yesterday"])
+            with open(daily_path) as f:
+                self.assertEqual(f.read().splitlines(), ["first today", "second today"])
+
+    def test_channel_file_and_recent_events(self):
+        """
+        Tests that channel messages reach the text file, the structured
+        event log and the recent-events buffer once flushed, and that
+        clearing a channel empties its file in place.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "channel.txt")
+            logger = system_logging.get_logger("test-channel", path)
+            logger.info("first", extra={"fields": {"value": 1}})
+            logger.info("second")
+            system_logging.flush()
+            with open(path) as f:
+                lines = f.read().splitlines()
+            self.assertEqual([line.split(" - ", 1)[1] for line in lines], ["first", "second"])
+            events = system_logging.recent_events("test-channel")
+            self.assertEqual([event["message"] for event in events], ["first", "second"])
+            system_logging.clear_channel("test-channel")
+            self.assertEqual(os.path.getsize(path), 0)
+            self.assertEqual(system_logging.recent_events("test-channel"), [])
+            logger.info("third")
+            system_logging.flush()
+            with open(path) as f:
+                self.assertEqual([line.split(" - ", 1)[1] for line in f.read().splitlines()], ["third"])
+
+    def test_file_loggers_and_per_channel_buffers(self):
+        """
+        Tests that log files with the same name in different directories
+        get their own loggers, that read_logs sees records just logged, and
+        that a noisy channel does not evict another channel's events.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name, "system.log") for name in ("a", "b")]
+            for path in paths:
+                os.makedirs(os.path.dirname(path))
+            log_action(paths[0], "to a")
+            log_action(paths[1], "to b")
+            self.assertEqual([line.split(" - ", 1)[1].rstrip() for line in read_logs(paths[0])], ["to a"])
+            self.assertEqual([line.split(" - ", 1)[1].rstrip() for line in read_logs(paths[1])], ["to b"])
+
+        quiet = system_logging.get_logger("test-quiet")
+        noisy = system_logging.get_logger("test-noisy")
+        quiet.info("keep me")
+        for i in range(system_logging.RECENT_EVENTS_SIZE + 10):
+            noisy.info(f"noise {i}")
+        system_logging.flush()
+        self.assertEqual([event["message"] for event in system_logging.recent_events("test-quiet")], ["keep me"])
+        self.assertEqual(len(system_logging.recent_events("test-noisy")), system_logging.RECENT_EVENTS_SIZE)
+        self.assertEqual(system_logging.recent_events(limit=1)[0]["message"],
+                         f"noise {system_logging.RECENT_EVENTS_SIZE + 9}")
+
+    def test_batch_sink(self):
+        """
+        Tests that a batch sink receives every record on the listener thread.
+        """
+        batches = []
+        logger = system_logging.add_batch_sink("test-batch", batches.append)
+        for i in range(10):
+            logger.info(f"record {i}")
+        system_logging.flush()
+        messages = [record.getMessage() for batch in batches for record in batch]
+        self.assertEqual(messages, [f"record {i}" for i in range(10)])
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        initialize_database()
+
+    def test_binary_batch_is_idempotent(self):
+        """
+        Tests that a binary batch round-trips, invalid readings are dropped
+        and a retried batch is acknowledged without storing it twice.
+        """
+        batch_id = f"test-{os.getpid()}-{time.time()}"
+        readings = {
+            "timestamp": time.time() - np.arange(4, dtype=np.float64),
+            "soil_moisture": np.array([40, 41, 250, 42]),
+            "light_level": np.full(4, 300.0),
+            "temperature": np.full(4, 21.0),
+            "humidity": np.full(4, 50.0),
+        }
+        body = encode_binary([{"node": "test", "batch_id": batch_id, "plant": "TestPlant", "readings": readings}])
+        first = ingest_batches(decode_payload(body, BINARY_CONTENT_TYPE))
+        self.assertEqual(first[0]["status"], "accepted")
+        self.assertEqual((first[0]["accepted"], first[0]["rejected"]), (3, 1))
+        retry = ingest_batches(decode_payload(body, BINARY_CONTENT_TYPE))
+        self.assertEqual((retry[0]["status"], retry[0]["accepted"]), ("duplicate", 0))
+
+class TestResponseCache(unittest.TestCase):
+    def test_versioned_body_and_not_modified(self):
+        """
+        Tests that a body is built once per version, revalidated with 304
+        and compressed when the client accepts gzip.
+        """
+        app = Flask(__name__)
+        cache = ResponseCache()
+        builds = []
+
+        def build():
+            builds.append(1)
+            return {"values": list(range(1000))}
+
+        with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+            first = cache.respond("key", 1, build)
+            cache.respond("key", 1, build)
+        self.assertEqual(first.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(builds), 1)
+
+        with app.test_request_context(headers={"If-None-Match": first.headers["ETag"]}):
+            self.assertEqual(cache.respond("key", 1, build).status_code, 304)
+            self.assertEqual(cache.respond("key", 2, build).status_code, 200)
+        self.assertEqual(len(builds), 2)
+
+class TestDownsampling(unittest.TestCase):
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        """
+        Tests that LTTB returns the requested number of points and keeps
+        the endpoints and an isolated spike.
+        """
+        x = np.arange(10000, dtype=np.float64)
+        y = np.sin(x / 500.0)
+        y[4321] = 25.0
+        dx, dy = lttb(x, y, 200)
+        self.assertEqual(len(dx), 200)
+        self.assertEqual((dx[0], dx[-1]), (0.0, 9999.0))
+        self.assertIn(25.0, dy)
+        self.assertTrue(np.all(np.diff(dx) > 0))
+
+    def test_lttb_returns_short_series_unchanged(self):
+        """
+        Tests that series shorter than the threshold are not modified.
+        """
+        dx, dy = lttb([1, 2, 3], [4, 5, 6], 10)
+        self.assertEqual(dx.tolist(), [1, 2, 3])
+
+class TestLogReader(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".log")
+        with os.fdopen(handle, "w") as f:
+            for i in range(2500):
+                f.write(f"entry {i}\n")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_tail_lines(self):
+        """
+        Tests that the tail matches readlines() across block boundaries.
+        """
+        lines = tail_lines(self.path, 30, block_size=64)
+        self.assertEqual(lines, [f"entry {i}\n" for i in range(2470, 2500)])
+        self.assertEqual(len(tail_lines(self.path, 10000)), 2500)
+
+    def test_index_pages_and_appends(self):
+        """
+        Tests paging through the sparse index, including lines appended and
+        a file rotated after the first build.
+        """
+        index = LogIndex(self.path, interval=100)
+        lines, total = index.read_page(page=3, page_size=50)
+        self.assertEqual(total, 2500)
+        self.assertEqual(lines[0], "entry 2300\n")
+        self.assertEqual(index.read_lines(1234, 2), ["entry 1234\n", "entry 1235\n"])
+
+        with open(self.path, "a") as f:
+            f.write("entry 2500\n")
+        self.assertEqual(index.read_page(0, 1), (["entry 2500\n"], 2501))
+
+        with open(self.path, "w") as f:
+            f.write("rotated\n")
+        self.assertEqual(index.read_page(0, 10), (["rotated\n"], 1))
+
+    def test_follow_yields_new_lines(self):
+        """
+        Tests that follow mode only yields lines appended after it starts.
+        """
+        lines = follow(self.path, poll_interval=0.01, idle_timeout=0.05)
+        self.assertIsNone(next(lines))
+        with open(self.path, "a") as f:
+            f.write("new entry\n")
+        self.assertEqual(next(lines), "new entry\n")
+        lines.close()
+
 class TestUtilities(unittest.TestCase):
     def test_validate_schedule_time(self):
         """
@@ -82,6 +1370,21 @@ class TestUtilities(unittest.TestCase):
         valid_time = "2024-11-20 14:00:00"
         self.assertTrue(validate_schedule_time(valid_time))
 
+    def test_validate_sensor_batch(self):
+        """
+        Tests the vectorized validator's row mask and missing-field error.
+        """
+        columns = {
+            "soil_moisture": [50, -1, 50],
+            "light_level": [300, 300, 300],
+            "temperature": [22.5, 22.5, float("nan")],
+            "humidity": [45, 45, 45],
+        }
+        self.assertEqual(validate_sensor_batch(columns).tolist(), [True, False, False])
+        del columns["humidity"]
+        with self.assertRaises(ValueError):
+            validate_sensor_batch(columns)
+
     def test_format_sensor_data(self):
         """
         Tests formatting of sensor data.
@@ -96,6 +1399,86 @@ class TestUtilities(unittest.TestCase):
         self.assertIn("Soil Moisture", formatted)
         self.assertIn("Light Level", formatted)
 
+class FakeMessage:
+    def __init__(self, text=None):
+        self.text = text
+        self.replies = []
+
+    def reply_text(self, text):
+        reply = FakeMessage(text)
+        self.replies.append(reply)
+        return reply
+
+    def edit_text(self, text):
+        self.text = text
+
+
+class FakeUpdate:
+    def __init__(self, chat_id):
+        self.effective_chat = type("Chat", (), {"id": chat_id})()
+        self.effective_user = type("User", (), {"id": chat_id, "first_name": "Tester"})()
+        self.message = FakeMessage()
+
+
+class TestTelegramBot(unittest.TestCase):
+    def test_background_reply_and_chat_limit(self):
+        """
+        Tests that slow commands reply immediately, edit the reply with the
+        result, and are limited per chat.
+        """
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            return 42
+
+        update = FakeUpdate(chat_id=1001)
+        jobs = [
+            telegram_bot.run_in_background(update, slow, (), lambda r: f"Result {r}", "Error", "tested")
+            for _ in range(telegram_bot.MAX_JOBS_PER_CHAT + 1)
+        ]
+        self.assertIsNone(jobs[-1])
+        self.assertEqual(update.message.replies[0].text, telegram_bot.WORKING_MESSAGE)
+        self.assertIn("already have requests", update.message.replies[-1].text)
+        self.assertEqual(telegram_bot.bot_metrics()["busy_chats"], 1)
+
+        release.set()
+        deadline = time.time() + 5
+        # on_done runs just after the job is marked done
+        while telegram_bot.bot_metrics()["busy_chats"] and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(update.message.replies[0].text, "Result 42")
+        self.assertEqual(telegram_bot.bot_metrics()["busy_chats"], 0)
+
+    def test_status_throttled_per_user(self):
+        """
+        Tests that a user flooding /status is throttled without affecting
+        other users.
+        """
+        burst = telegram_bot.STATUS_USER_RATE[1]
+        waits = [telegram_bot.throttle_status(2001) for _ in range(burst + 1)]
+        self.assertEqual(waits[:burst], [0] * burst)
+        self.assertGreater(waits[-1], 0)
+        self.assertEqual(telegram_bot.throttle_status(2002), 0)
+
+    def test_status_answers_from_shared_readings(self):
+        """
+        Tests that /status answers at once from readings the sampler
+        published, showing sensors missing from them as n/a.
+        """
+        original = telegram_bot.shared_readings
+        store = StateStore(os.path.join(TEST_DIRECTORY, "bot_state.db"))
+        telegram_bot.shared_readings = SharedSensorReadings(store, SensorSnapshot(reader=lambda: {}))
+        try:
+            telegram_bot.shared_readings.publish({"soil_moisture": 40})
+            update = FakeUpdate(chat_id=3001)
+            telegram_bot.status(update, None)
+            [reply] = update.message.replies
+            self.assertIn("Soil Moisture: 40%", reply.text)
+            self.assertIn("Humidity: n/a\n", reply.text)
+        finally:
+            telegram_bot.shared_readings = original
+
 class TestNotifier(unittest.TestCase):
     def test_send_telegram_notification(self):
         """
@@ -108,5 +1491,70 @@ class TestNotifier(unittest.TestCase):
             success = False
         self.assertTrue(success)
 
+    def test_similar_alerts_keep_identifiers(self):
+        """
+        Tests that alerts differing only in readings share a digest key
+        while alerts about different plants do not.
+        """
+        self.assertEqual(_similarity_key("Plant1 soil moisture 28%"), _similarity_key("Plant1 soil moisture 27.5%"))
+        self.assertNotEqual(_similarity_key("Plant1 soil moisture low"), _similarity_key("Plant2 soil moisture low"))
+        self.assertNotEqual(_similarity_key("node_1 offline"), _similarity_key("node_2 offline"))
+
+    def test_dispatcher_coalesces_and_retries(self):
+        """
+        Tests the dispatcher against fake clients: one SMTP login for many
+        emails, similar alerts merged into a digest and failed sends retried.
+        """
+        class FakeBot:
+            def __init__(self):
+                self.sent = []
+                self.failures = 1
+
+            def send_message(self, chat_id, text):
+                if self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("Network down")
+                self.sent.append(text)
+
+        class FakeSMTP:
+            logins = 0
+
+            def __init__(self):
+                self.sent = []
+                FakeSMTP.instance = self
+
+            def starttls(self):
+                pass
+
+            def login(self, user, password):
+                FakeSMTP.logins += 1
+
+            def sendmail(self, sender, recipient, message):
+                self.sent.append(recipient)
+
+            def quit(self):
+                pass
+
+        bot = FakeBot()
+        dispatcher = NotificationDispatcher(
+            {"telegram": TelegramClient(lambda: bot), "email": EmailClient(FakeSMTP)},
+            rate_limits={"telegram": (1000, 100), "email": (1000, 100)},
+            window=0.2,
+            retry_backoff=0.01,
+        )
+        for i in range(20):
+            dispatcher.notify("email", f"user{i}@example.com", f"Alert {i}", subject="Alert", key=str(i))
+        for moisture in range(25, 30):
+            dispatcher.notify("telegram", "chat", f"Soil moisture low: {moisture}%")
+        dispatcher.workers["email"].wait_idle(10)
+        self.assertEqual((FakeSMTP.logins, len(FakeSMTP.instance.sent)), (1, 20))
+
+        time.sleep(0.3)  # Let the coalescing window close
+        dispatcher.close()
+        self.assertEqual(len(bot.sent), 2)
+        self.assertIn("Soil moisture low: 25%", bot.sent)
+        self.assertTrue(any("4 more similar alert(s)" in text for text in bot.sent))
+        self.assertEqual(dispatcher.workers["telegram"].retried, 1)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,308 @@
+# timer_scheduler.py
+# Event-driven job scheduler built on a timer heap and a monotonic clock.
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Constants
+COMPACT_RATIO = 0.5  # Rebuild the heap once this share of it is cancelled jobs
+
+
+class TimerJob:
+    """
+    A scheduled call. Daily jobs run at a local wall-clock time (at, as
+    "HH:MM"); interval jobs every interval seconds; other jobs run once.
+    """
+
+    def __init__(self, job_id, func, args, at=None, interval=None, tag=None, with_slot=False):
+        self.id = job_id
+        self.func = func
+        self.args = args
+        self.at = at
+        self.interval = interval
+        self.tag = tag
+        self.with_slot = with_slot  # Pass the slot being run to func
+        self.deadline = None  # Monotonic time of the next run
+        self.slot = None  # Wall-clock time of the daily run the deadline is for
+        self.cancelled = False
+        self.runs = 0
+
+
+class TimerScheduler:
+    """
+    Keeps jobs in a heap ordered by their next monotonic deadline. The run
+    loop sleeps on a condition variable exactly until the earliest deadline
+    and is woken early when a job is added or cancelled, so an idle
+    scheduler does no work between runs. Adding is O(log n); cancelling
+    marks the job and leaves it to be discarded when it reaches the top of
+    the heap (or when the heap is compacted).
+    """
+
+    def __init__(self, clock=time.monotonic, wall_clock=time.time):
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self._heap = []
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._cancelled = 0
+        self._running = False
+        self._thread = None
+        self.wakeups = 0
+        self.runs = 0
+        self.errors = 0
+
+    def _next_slot(self, at, min_delay=0):
+        """
+        Returns the seconds from now until the next local occurrence of
+        "HH:MM" at least min_delay seconds away, and its wall-clock time.
+        """
+        hour, minute = (int(part) for part in at.split(":"))
+        if not (0 <= hour < 24 and 0 <= minute < 60):
+            raise ValueError(f"Invalid time: {at}. Use HH:MM.")
+        now = datetime.fromtimestamp(self.wall_clock())
+        target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if (target - now).total_seconds() <= min_delay:
+            target += timedelta(days=1)
+        return (target - now).total_seconds(), target.timestamp()
+
+    def _seconds_until(self, at):
+        """
+        Seconds from now until the next local occurrence of "HH:MM".
+        """
+        return self._next_slot(at)[0]
+
+    def _push(self, job, delay):
+        job.deadline = self.clock() + delay
+        with self._condition:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (job.deadline, job.id, job))
+            # Only a new earliest deadline changes how long the loop sleeps
+            if self._heap[0][2] is job:
+                self._condition.notify_all()
+        return job
+
+    def add_daily(self, at, func, *args, tag=None, with_slot=False):
+        """
+        Runs func(*args) every day at the local time at ("HH:MM"). With
+        with_slot, func also gets the wall-clock time of the run it was
+        due for as a last argument, however early or late it fires.
+        """
+        job = TimerJob(next(self._ids), func, args, at=at, tag=tag, with_slot=with_slot)
+        delay, job.slot = self._next_slot(at)
+        return self._push(job, delay)
+
+    def add_interval(self, interval, func, *args, delay=None, tag=None):
+        """
+        Runs func(*args) every interval seconds, first after delay (default
+        one interval).
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive.")
+        job = TimerJob(next(self._ids), func, args, interval=interval, tag=tag)
+        return self._push(job, interval if delay is None else delay)
+
+    def call_later(self, delay, func, *args, tag=None):
+        """
+        Runs func(*args) once after delay seconds.
+        """
+        return self._push(TimerJob(next(self._ids), func, args, tag=tag), max(0, delay))
+
+    def cancel(self, job):
+        """
+        Cancels a job. Returns False if it already finished or was cancelled.
+        """
+        with self._condition:
+            if self._jobs.pop(job.id, None) is None:
+                return False
+            job.cancelled = True
+            self._cancelled += 1
+            if self._cancelled > len(self._heap) * COMPACT_RATIO:
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+            self._condition.notify_all()
+        return True
+
+    def jobs(self):
+        with self._condition:
+            return list(self._jobs.values())
+
+    def _pop_cancelled(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+
+    def next_delay(self):
+        """
+        Seconds until the next job is due (0 if overdue), or None if idle.
+        """
+        with self._condition:
+            self._pop_cancelled()
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - self.clock())
+
+    def _take_due(self):
+        """
+        Pops the jobs that are due and reschedules periodic ones. Called
+        with the condition held.
+        """
+        due = []
+        now = self.clock()
+        while self._heap:
+            self._pop_cancelled()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, _, job = heapq.heappop(self._heap)
+            due.append((job, job.slot))
+            if job.interval is not None:
+                # Skip missed intervals instead of running them back to back
+                missed = int((now - job.deadline) // job.interval)
+                job.deadline += (missed + 1) * job.interval
+            elif job.at is not None:
+                # Recomputed from the wall clock, so daylight-saving shifts
+                # hold; a run that fired slightly early skips to tomorrow.
+                delay, job.slot = self._next_slot(job.at, min_delay=60)
+                job.deadline = now + delay
+            else:
+                del self._jobs[job.id]
+                continue
+            heapq.heappush(self._heap, (job.deadline, job.id, job))
+        return due
+
+    def _run_jobs(self, jobs):
+        for job, slot in jobs:
+            try:
+                if job.with_slot:
+                    job.func(*job.args, slot)
+                else:
+                    job.func(*job.args)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in scheduled job {job.tag or job.id}: {e}")
+            job.runs += 1
+            self.runs += 1
+
+    def run_pending(self):
+        """
+        Runs every job that is due now. Returns the number of jobs run.
+        """
+        with self._condition:
+            due = self._take_due()
+        self._run_jobs(due)
+        return len(due)
+
+    def run_forever(self):
+        """
+        Runs jobs as they fall due until stop() is called.
+        """
+        with self._condition:
+            self._running = True
+        self._loop()
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    self._pop_cancelled()
+                    if self._heap:
+                        wait = self._heap[0][0] - self.clock()
+                        if wait <= 0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+                    self.wakeups += 1
+                if not self._running:
+                    return
+                due = self._take_due()
+            self._run_jobs(due)
+
+    def start(self):
+        """
+        Starts the run loop on a background thread (once).
+        """
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name="timer-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def stats(self):
+        with self._condition:
+            return {
+                "jobs": len(self._jobs),
+                "heap": len(self._heap),
+                "wakeups": self.wakeups,
+                "runs": self.runs,
+                "errors": self.errors,
+            }
+
+
+def compare_with_polling(job_count=10000, seconds=5.0):
+    """
+    Measures idle wakeups and CPU time of the old schedule polling loop
+    (run_pending() once a second) and of TimerScheduler, each holding
+    job_count daily jobs, over the given number of seconds.
+    """
+    import schedule
+
+    results = {}
+
+    polling = schedule.Scheduler()
+    for i in range(job_count):
+        polling.every().day.at(f"{i // 60 % 24:02d}:{i % 60:02d}").do(lambda: None)
+    cpu, wakeups = time.process_time(), 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        polling.run_pending()
+        wakeups += 1
+        time.sleep(1)
+    results["polling"] = {"wakeups": wakeups, "cpu_seconds": time.process_time() - cpu}
+
+    timer = TimerScheduler()
+    started = time.perf_counter()
+    jobs = [timer.add_daily(f"{i // 60 % 24:02d}:{i % 60:02d}", lambda: None) for i in range(job_count)]
+    insert_seconds = time.perf_counter() - started
+    cpu = time.process_time()
+    timer.start()
+    time.sleep(seconds)
+    timer.stop()
+    results["timer_heap"] = {
+        "wakeups": timer.wakeups,
+        "cpu_seconds": time.process_time() - cpu,
+        "insert_us_per_job": insert_seconds / job_count * 1e6,
+    }
+    started = time.perf_counter()
+    for job in jobs:
+        timer.cancel(job)
+    results["timer_heap"]["cancel_us_per_job"] = (time.perf_counter() - started) / job_count * 1e6
+    return results
+
+
+# Example usage
+if __name__ == "__main__":
+    timer = TimerScheduler()
+    timer.call_later(0.5, print, "One-shot job ran.")
+    ticker = timer.add_interval(0.2, print, "Interval job ran.")
+    timer.start()
+    time.sleep(1.1)
+    timer.cancel(ticker)
+    timer.stop()
+    print(timer.stats())
+
+    for name, result in compare_with_polling(job_count=10000, seconds=5).items():
+        print(name, result)
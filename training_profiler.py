@@ -0,0 +1,266 @@
+# training_profiler.py
+# Throughput profiling and epoch-level performance reports for training runs.
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Constants
+PROFILE_REPORT_FILE = "training_profile.json"
+PROFILE_BASELINE_FILE = "training_profile_baseline.json"
+REGRESSION_TOLERANCE = 0.10  # Relative slowdown/growth flagged as a regression
+ACCURACY_TOLERANCE = 0.02  # Absolute validation accuracy drop flagged
+
+_KERAS_CLASSES = {}  # TimedSequence and TrainingProfiler, defined on first use
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux.
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+class EpochRecorder:
+    """
+    Records per-epoch wall time, images/sec, time in training steps versus
+    input and other work, and peak RSS. Writes a JSON report at the end of
+    training and flags regressions against a stored baseline report.
+
+    Input time comes from a TimedSequence when one is given. For tf.data
+    pipelines it can be estimated from data_pipeline.measure_input_stall via
+    stall_sec_per_step. The methods follow the Keras callback hooks;
+    TrainingProfiler is the Keras callback built on it.
+    """
+
+    def __init__(self, batch_size, samples_per_epoch=None, input_source=None,
+                 stall_sec_per_step=None, report_path=PROFILE_REPORT_FILE,
+                 baseline_path=PROFILE_BASELINE_FILE, tags=None):
+        self.batch_size = batch_size
+        self.samples_per_epoch = samples_per_epoch
+        self.input_source = input_source
+        self.stall_sec_per_step = stall_sec_per_step
+        self.report_path = report_path
+        self.baseline_path = baseline_path
+        self.tags = tags or {}
+        self.epochs = []
+        self.report = None
+
+    def on_train_begin(self, logs=None):
+        self.train_start = time.perf_counter()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
+        self.step_time = 0.0
+        self.steps = 0
+        self.input_start = self.input_source.input_time if self.input_source else 0.0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.batch_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step_time += time.perf_counter() - self.batch_start
+        self.steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        wall_time = time.perf_counter() - self.epoch_start
+        images = self.samples_per_epoch or self.steps * self.batch_size
+        if self.input_source is not None:
+            input_time = self.input_source.input_time - self.input_start
+        elif self.stall_sec_per_step is not None:
+            input_time = self.stall_sec_per_step * self.steps
+        else:
+            input_time = None
+
+        record = {
+            "epoch": epoch + 1,
+            "wall_time_sec": wall_time,
+            "steps": self.steps,
+            "images": images,
+            "images_per_sec": images / self.step_time if self.step_time else 0.0,
+            "step_time_sec": self.step_time,
+            "input_time_sec": input_time,
+            "other_time_sec": wall_time - self.step_time,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        for key in ("accuracy", "val_accuracy", "loss", "val_loss"):
+            if logs and key in logs:
+                record[key] = float(logs[key])
+        self.epochs.append(record)
+        print(
+            f"Epoch {epoch + 1}: {wall_time:.1f}s, {record['images_per_sec']:.1f} images/sec, "
+            f"peak RSS {record['peak_rss_mb']:.0f} MB"
+        )
+
+    def on_train_end(self, logs=None):
+        self.report = build_report(self.epochs, time.perf_counter() - self.train_start, self.tags)
+        baseline = load_report(self.baseline_path)
+        self.report["regressions"] = find_regressions(self.report, baseline) if baseline else []
+        save_report(self.report, self.report_path)
+        print_report(self.report)
+
+
+def _keras_classes():
+    """
+    Defines the Keras-facing classes on first use, so TensorFlow is only
+    imported by training code and the report helpers work without it.
+    """
+    if not _KERAS_CLASSES:
+        import tensorflow as tf
+
+        class TimedSequence(tf.keras.utils.Sequence):
+            """
+            Wraps a Keras Sequence (ImageDataGenerator iterators,
+            ShardSequence) and accumulates the time spent producing batches.
+            """
+
+            def __init__(self, sequence):
+                super().__init__()
+                self.sequence = sequence
+                self.input_time = 0.0
+                self._lock = threading.Lock()
+
+            def __len__(self):
+                return len(self.sequence)
+
+            def __getitem__(self, index):
+                start = time.perf_counter()
+                batch = self.sequence[index]
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.input_time += elapsed
+                return batch
+
+            def on_epoch_end(self):
+                self.sequence.on_epoch_end()
+
+        class TrainingProfiler(EpochRecorder, tf.keras.callbacks.Callback):
+            """
+            Keras callback that profiles a training run (see EpochRecorder).
+            """
+
+            def __init__(self, *args, **kwargs):
+                tf.keras.callbacks.Callback.__init__(self)
+                EpochRecorder.__init__(self, *args, **kwargs)
+
+        _KERAS_CLASSES.update(TimedSequence=TimedSequence, TrainingProfiler=TrainingProfiler)
+    return _KERAS_CLASSES
+
+
+def __getattr__(name):
+    if name in ("TimedSequence", "TrainingProfiler"):
+        return _keras_classes()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def build_report(epochs, total_time, tags=None):
+    """
+    Summarises per-epoch records into a machine-readable report.
+    """
+    # Skip the first epoch in averages when possible: it includes tracing
+    # and cache warm-up.
+    steady = epochs[1:] if len(epochs) > 1 else epochs
+    val_accuracies = [epoch["val_accuracy"] for epoch in epochs if "val_accuracy" in epoch]
+    summary = {
+        "epochs": len(epochs),
+        "total_time_sec": total_time,
+        "mean_epoch_time_sec": sum(e["wall_time_sec"] for e in steady) / len(steady) if steady else 0.0,
+        "mean_images_per_sec": sum(e["images_per_sec"] for e in steady) / len(steady) if steady else 0.0,
+        "peak_rss_mb": max((e["peak_rss_mb"] for e in epochs), default=0.0),
+        "best_val_accuracy": max(val_accuracies) if val_accuracies else None,
+    }
+    input_times = [e["input_time_sec"] for e in steady if e["input_time_sec"] is not None]
+    if input_times:
+        summary["input_time_fraction"] = sum(input_times) / sum(e["wall_time_sec"] for e in steady)
+    return {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "tags": tags or {},
+        "summary": summary,
+        "epochs": epochs,
+    }
+
+
+def find_regressions(report, baseline, tolerance=REGRESSION_TOLERANCE,
+                     accuracy_tolerance=ACCURACY_TOLERANCE):
+    """
+    Compares a report's summary with a baseline summary and returns a list
+    of human-readable regression messages.
+    """
+    current, previous = report["summary"], baseline["summary"]
+    regressions = []
+    if previous["mean_images_per_sec"] and current["mean_images_per_sec"] < previous["mean_images_per_sec"] * (1 - tolerance):
+        regressions.append(
+            f"Throughput dropped: {current['mean_images_per_sec']:.1f} vs {previous['mean_images_per_sec']:.1f} images/sec"
+        )
+    if previous["mean_epoch_time_sec"] and current["mean_epoch_time_sec"] > previous["mean_epoch_time_sec"] * (1 + tolerance):
+        regressions.append(
+            f"Epoch time grew: {current['mean_epoch_time_sec']:.1f}s vs {previous['mean_epoch_time_sec']:.1f}s"
+        )
+    if previous["peak_rss_mb"] and current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(
+            f"Peak RSS grew: {current['peak_rss_mb']:.0f} MB vs {previous['peak_rss_mb']:.0f} MB"
+        )
+    if (
+        previous.get("best_val_accuracy") is not None
+        and current.get("best_val_accuracy") is not None
+        and current["best_val_accuracy"] < previous["best_val_accuracy"] - accuracy_tolerance
+    ):
+        regressions.append(
+            f"Validation accuracy dropped: {current['best_val_accuracy']:.4f} vs {previous['best_val_accuracy']:.4f}"
+        )
+    return regressions
+
+
+def save_report(report, path=PROFILE_REPORT_FILE):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Training profile saved to {path}.")
+
+
+def load_report(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_as_baseline(report_path=PROFILE_REPORT_FILE, baseline_path=PROFILE_BASELINE_FILE):
+    """
+    Promotes a profile report to the baseline used for regression checks.
+    """
+    report = load_report(report_path)
+    if report is None:
+        raise FileNotFoundError(f"No profile report at {report_path}.")
+    save_report(report, baseline_path)
+
+
+def print_report(report):
+    summary = report["summary"]
+    print("\nTraining performance report:")
+    print(f"- Epochs: {summary['epochs']}, total time: {summary['total_time_sec']:.1f}s")
+    print(f"- Mean epoch time: {summary['mean_epoch_time_sec']:.1f}s")
+    print(f"- Mean throughput: {summary['mean_images_per_sec']:.1f} images/sec")
+    if "input_time_fraction" in summary:
+        print(f"- Input time: {summary['input_time_fraction']:.1%} of epoch time")
+    print(f"- Peak RSS: {summary['peak_rss_mb']:.0f} MB")
+    for regression in report.get("regressions", []):
+        print(f"- REGRESSION: {regression}")
+
+
+# Example usage
+if __name__ == "__main__":
+    # Usage: python training_profiler.py [baseline]
+    if len(sys.argv) > 1 and sys.argv[1] == "baseline":
+        save_as_baseline()
+    else:
+        report = load_report(PROFILE_REPORT_FILE)
+        if report is None:
+            print(f"No report at {PROFILE_REPORT_FILE}. Train with profile=True first.")
+        else:
+            print_report(report)
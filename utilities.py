@@ -3,8 +3,21 @@
 
 import os
 import json
+import threading
+import time
 import uuid
+import numpy as np
 from datetime import datetime
+from log_reader import tail_lines
+import system_logging
+
+# Physically possible sensor ranges; readings outside them are rejected
+SENSOR_LIMITS = {
+    "soil_moisture": (0, 100),  # Percent
+    "light_level": (0, 200000),  # Lumens
+    "temperature": (-40, 85),  # Celsius
+    "humidity": (0, 100),  # Percent
+}
 
 
 # Time-related utilities
@@ -52,6 +65,24 @@ def validate_sensor_data(data):
     return True
 
 
+def validate_sensor_batch(columns):
+    """
+    Vectorized validate_sensor_data for many readings at once. columns maps
+    each sensor field to an array of values. Raises ValueError if a field
+    is missing; returns a boolean mask of the rows whose values are finite
+    and within SENSOR_LIMITS.
+    """
+    validate_sensor_data(columns)
+    lengths = {len(columns[key]) for key in SENSOR_LIMITS}
+    if len(lengths) > 1:
+        raise ValueError("Sensor data fields have different lengths.")
+    valid = np.ones(lengths.pop(), dtype=bool)
+    for key, (low, high) in SENSOR_LIMITS.items():
+        values = np.asarray(columns[key], dtype=np.float64)
+        valid &= np.isfinite(values) & (values >= low) & (values <= high)
+    return valid
+
+
 # File operations
 def save_to_file(data, file_path):
     """
@@ -83,13 +114,12 @@ def load_from_file(file_path):
 # Logging utilities
 def log_action(log_file, action):
     """
-    Logs an action to a log file with a timestamp.
+    Logs an action to a log file with a timestamp. The write happens on
+    the shared logging thread, so the file may lag behind by a few
+    records; read_logs() flushes them first.
     """
-    timestamp = format_timestamp()
-    log_entry = f"{timestamp} - {action}"
     try:
-        with open(log_file, "a") as file:
-            file.write(log_entry + "\n")
+        system_logging.get_file_logger(log_file).info(action)
         print(f"Logged action: {action}")
     except Exception as e:
         print(f"Error logging action: {e}")
@@ -97,19 +127,52 @@ def log_action(log_file, action):
 
 def read_logs(log_file, limit=10):
     """
-    Reads the most recent log entries from a log file.
+    Reads the most recent log entries from a log file, including records
+    this process has logged but not yet written.
     """
+    system_logging.flush()
     if not os.path.exists(log_file):
         return []
     try:
-        with open(log_file, "r") as file:
-            lines = file.readlines()
-        return lines[-limit:]
+        return tail_lines(log_file, limit)
     except Exception as e:
         print(f"Error reading logs: {e}")
         return []
 
 
+# Rate limiting utilities
+class RateLimiter:
+    """
+    Token bucket: allows `rate` operations per second on average with
+    bursts of up to `burst`.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available. Returns 0 on success, otherwise
+        the number of seconds until the next token.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
 # ID generation utilities
 def generate_unique_id():
     """
@@ -1,39 +1,111 @@
 # web_interface.py
 # Web interface for the Plant Monitoring System.
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
+import io
+import json
 import threading
 import time
-from sensors import get_sensor_data
+from collections import OrderedDict
+from sensor_snapshot import SharedSensorReadings, sensor_snapshot
+from state_store import StateStore, StateWatcher, SamplerLock
+from event_stream import EventBroadcaster, HEARTBEAT_INTERVAL
+from job_queue import JobQueue, QueueFullError
 from ai_model import analyze_plant_image
+from config import LOGGING, SENSOR_SAMPLE_INTERVAL, STATUS_MAX_AGE
+from database import (
+    DEFAULT_PLANT,
+    SENSOR_COLUMNS,
+    add_sensor_data,
+    get_sensor_series,
+    get_sensor_data_version,
+)
+from downsampling import lttb
+from http_cache import ResponseCache, make_etag, not_modified, validator_headers
+from ingest import decode_payload, ingest_batches
+from actuators import shared_executor
+from rule_engine import RuleEngine
+from log_reader import follow, get_log_index
+import system_logging
 import os
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from datetime import datetime
 
 # Flask app initialization
 app = Flask(__name__)
 
-# Global variables for system status
-system_status = {
+# System status shared by all worker processes
+DEFAULT_STATUS = {
     "light": "off",
     "watering": "off",
     "sensor_data": {},
     "last_analysis": {},
-    "logs": [],
 }
+state_store = StateStore(defaults=DEFAULT_STATUS)
+shared_readings = SharedSensorReadings(state_store)
+
+# Only the process holding this lock samples the sensors
+sampler_lock = SamplerLock()
+SAMPLE_INTERVAL = SENSOR_SAMPLE_INTERVAL  # Seconds
+SAMPLER_RETRY_INTERVAL = 10  # Seconds between attempts to become the sampler
+background_started = False
+background_lock = threading.Lock()
 
 LOG_FILE = "web_logs.txt"
+LOG_PAGE_SIZE = 100
+LOG_MAX_PAGE_SIZE = 5000
+
+# Live update fan-out for /stream clients
+broadcaster = EventBroadcaster()
+
+# Serialized JSON responses per state version, for polling clients
+response_cache = ResponseCache()
+
+# Worker pool for plant analysis requests
+analysis_jobs = JobQueue()
+
+# History charts
+HISTORY_DEFAULT_RANGE = 7 * 24 * 3600  # Seconds
+HISTORY_DEFAULT_WIDTH = 800  # Pixel budget: points returned after downsampling
+HISTORY_MAX_WIDTH = 5000
+CHART_CACHE_SIZE = 64
+chart_cache = OrderedDict()
+chart_cache_lock = threading.Lock()
 
 # Helper functions
 def log_action(action):
     """
-    Logs actions performed through the web interface.
+    Logs actions performed through the web interface. Recent entries are
+    also kept in the shared state store, so every worker's dashboard shows
+    the same log.
+    """
+    system_logging.add_batch_sink("web", store_logs)
+    system_logging.get_logger("web", LOG_FILE).info(action)
+
+
+def store_logs(records):
+    state_store.append_logs("web", [(record.created, record.getMessage()) for record in records])
+
+
+def publish_state(event_type, data, **values):
+    """
+    Stores state changes and their event in the shared store. Every
+    worker's watcher forwards the event to its own stream clients.
+    """
+    return state_store.write(values, event_type, data)
+
+
+def recent_logs():
+    """
+    Returns the recent web log entries shown on the dashboard, from all
+    workers.
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"{timestamp} - {action}"
-    system_status["logs"].append(log_entry)
-    with open(LOG_FILE, "a") as f:
-        f.write(log_entry + "\n")
+    return [
+        f"{datetime.fromtimestamp(created).strftime(LOGGING['datefmt'])} - {message}"
+        for created, message in state_store.recent_logs("web")
+    ]
 
 
 @app.route("/")
@@ -41,41 +113,135 @@ def home():
     """
     Displays the main dashboard with current sensor data.
     """
-    return render_template("dashboard.html", status=system_status)
+    return render_template("dashboard.html", status=dict(state_store.get_all(), logs=recent_logs()))
 
 
 @app.route("/status")
 def get_status():
     """
-    Returns the current system status as JSON.
+    Returns the latest sensor readings from the shared state store, so
+    every worker answers with the same version. The readings are refreshed
+    by the sampler process; a live read only happens when they are older
+    than STATUS_MAX_AGE or the client asks for ?fresh=1, and concurrent
+    live reads in a process are coalesced into one. The body is cached per
+    version and revalidated with ETags; its age is sent in the Age header.
     """
+    max_age = 0 if request.args.get("fresh") == "1" else STATUS_MAX_AGE
+    data, version, updated = state_store.get_entry("sensor_data")
     try:
-        sensor_data = get_sensor_data()
-        system_status["sensor_data"] = sensor_data
-        log_action("Fetched sensor data.")
-        return jsonify({"status": "success", "data": sensor_data})
+        readings = shared_readings.get(max_age)
+        data, version, updated = readings["data"], readings["version"], readings["updated"]
+        if readings["refreshed"]:
+            log_action("Fetched sensor data.")
     except Exception as e:
         log_action(f"Error fetching sensor data: {e}")
-        return jsonify({"status": "error", "message": str(e)})
+        if not data:
+            return jsonify({"status": "error", "message": str(e)})
+
+    age = time.time() - updated if updated is not None else None
+    stale = age is None or age > STATUS_MAX_AGE
+    timestamp = datetime.fromtimestamp(updated).strftime("%Y-%m-%d %H:%M:%S") if updated else None
+    headers = {"Age": str(int(age))} if age is not None else {}
+    return response_cache.respond(
+        ("status",),
+        (version, stale),
+        lambda: {
+            "status": "success",
+            "data": data,
+            "version": version,
+            "timestamp": timestamp,
+            "stale": stale,
+        },
+        last_modified=updated,
+        headers=headers,
+    )
+
+
+def finish_analysis(job):
+    """
+    Records a finished analysis job and pushes it to stream clients.
+    """
+    plant_name = job.key.split(":", 1)[1]
+    event = dict(job.to_dict(), plant=plant_name)
+    state_store.save_job(job.id, event)
+    if job.status == "done":
+        log_action(f"Performed analysis on {plant_name}.")
+        publish_state("analysis", event, last_analysis=job.result)
+    else:
+        log_action(f"Error during analysis: {job.error}")
+        publish_state("analysis", event)
 
 
 @app.route("/analyze", methods=["POST"])
 def analyze():
     """
-    Performs plant health analysis and returns the result.
+    Queues a plant health analysis and returns its job ID immediately.
+    A request for a plant whose analysis is already queued or running
+    returns the existing job.
     """
     try:
         plant_name = request.json.get("plant", "Plant1")
         image_path = f"{plant_name}_image.jpg"
-        analysis = analyze_plant_image(image_path)
-        system_status["last_analysis"] = analysis
-        log_action(f"Performed analysis on {plant_name}.")
-        return jsonify({"status": "success", "data": analysis})
+        job, created = analysis_jobs.submit(
+            analyze_plant_image, image_path, visualize=False,
+            key=f"analyze:{plant_name}", on_done=finish_analysis,
+        )
+        if created:
+            state_store.save_job(job.id, dict(job.to_dict(), plant=plant_name), replace=False)
+            log_action(f"Queued analysis on {plant_name}.")
+        return jsonify({
+            "status": "accepted",
+            "job_id": job.id,
+            "deduplicated": not created,
+            "job_url": f"/jobs/{job.id}",
+        }), 202
+    except QueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
     except Exception as e:
         log_action(f"Error during analysis: {e}")
         return jsonify({"status": "error", "message": str(e)})
 
 
+@app.route("/ingest", methods=["POST"])
+def ingest():
+    """
+    Accepts batches of readings from remote sensor nodes as JSON or the
+    compact binary format, optionally gzip-compressed. Every batch is
+    acknowledged; batches are keyed by (node, batch_id), so retried
+    requests never store readings twice.
+    """
+    try:
+        batches = decode_payload(
+            request.get_data(cache=False),
+            request.mimetype,
+            request.headers.get("Content-Encoding"),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    acks = ingest_batches(batches)
+    if acks is None:
+        return jsonify({"status": "error", "message": "Could not store readings. Retry later."}), 503
+    stored = sum(ack["accepted"] for ack in acks if ack["status"] == "accepted")
+    if stored:
+        log_action(f"Ingested {stored} readings in {len(acks)} batches.")
+        publish_state("ingest", {"batches": len(acks), "readings": stored})
+    return jsonify({"status": "success", "acks": acks})
+
+
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    """
+    Returns the state and, once finished, the result of a queued job. Jobs
+    run by other workers are looked up in the shared state store.
+    """
+    job = analysis_jobs.get(job_id)
+    data = job.to_dict() if job is not None else state_store.get_job(job_id)
+    if data is None:
+        return jsonify({"status": "error", "message": "Unknown job ID."}), 404
+    return jsonify({"status": "success", "job": data})
+
+
 @app.route("/control", methods=["POST"])
 def control():
     """
@@ -88,8 +254,8 @@ def control():
             raise ValueError("Invalid device specified.")
         if action not in ["on", "off"]:
             raise ValueError("Invalid action specified.")
-        
-        system_status[device] = action
+
+        publish_state("control", {"device": device, "action": action}, **{device: action})
         log_action(f"Set {device} to {action}.")
         return jsonify({"status": "success", "message": f"{device} turned {action}."})
     except Exception as e:
@@ -97,17 +263,68 @@ def control():
         return jsonify({"status": "error", "message": str(e)})
 
 
+@app.route("/stream")
+def stream():
+    """
+    Server-Sent Events stream of sensor updates, control changes and
+    analysis results. Reconnecting clients resume from Last-Event-ID.
+    """
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    try:
+        subscriber = broadcaster.subscribe(last_event_id)
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return Response(
+        broadcaster.stream(subscriber),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/logs")
 def view_logs():
     """
-    Displays the system logs.
+    Displays the system logs, newest page first. ?limit= sets the page size
+    and ?page= steps back through older entries; ?follow=1 streams new
+    lines as Server-Sent Events instead.
     """
-    try:
-        with open(LOG_FILE, "r") as f:
-            logs = f.readlines()
-        return jsonify({"status": "success", "logs": logs})
-    except FileNotFoundError:
+    if request.args.get("follow") == "1":
+        def generate():
+            yield "retry: 3000\n\n"
+            for line in follow(LOG_FILE, idle_timeout=HEARTBEAT_INTERVAL):
+                if line is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"event: log\ndata: {json.dumps(line.rstrip())}\n\n"
+
+        return Response(
+            generate(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    if not os.path.exists(LOG_FILE):
         return jsonify({"status": "error", "message": "No logs available."})
+    limit = min(max(request.args.get("limit", LOG_PAGE_SIZE, type=int), 1), LOG_MAX_PAGE_SIZE)
+    page = max(request.args.get("page", 0, type=int), 0)
+    system_logging.flush()  # Include this worker's queued entries
+    index = get_log_index(LOG_FILE)
+    index.refresh()
+
+    def build():
+        logs, total = index.read_page(page, limit)
+        return {
+            "status": "success",
+            "logs": logs,
+            "page": page,
+            "limit": limit,
+            "total": total,
+            "has_more": (page + 1) * limit < total,
+        }
+
+    return response_cache.respond(
+        ("logs", page, limit), (index.inode, index.size), build, last_modified=os.path.getmtime(LOG_FILE)
+    )
 
 
 @app.route("/visualize")
@@ -116,7 +333,7 @@ def visualize():
     Generates and displays a graph of sensor data.
     """
     try:
-        data = system_status["sensor_data"]
+        data = state_store.get("sensor_data")
         if not data:
             raise ValueError("No sensor data available.")
 
@@ -138,21 +355,120 @@ def visualize():
         return jsonify({"status": "error", "message": str(e)})
 
 
+def parse_history_request():
+    """
+    Reads plant, sensor, time range and pixel width from the query string.
+    Without an explicit end the window ends at the current minute, so
+    repeated requests share cache entries.
+    """
+    plant = request.args.get("plant", DEFAULT_PLANT)
+    sensor = request.args.get("sensor", "soil_moisture")
+    if sensor not in SENSOR_COLUMNS:
+        raise ValueError(f"Invalid sensor. Choose one of: {', '.join(SENSOR_COLUMNS)}.")
+    end = request.args.get("end", type=float)
+    if end is None:
+        end = (int(time.time()) // 60 + 1) * 60
+    start = request.args.get("start", type=float, default=end - HISTORY_DEFAULT_RANGE)
+    if start >= end:
+        raise ValueError("start must be before end.")
+    width = request.args.get("width", type=int, default=HISTORY_DEFAULT_WIDTH)
+    width = max(3, min(width, HISTORY_MAX_WIDTH))
+    return plant, sensor, start, end, width
+
+
+def load_history(plant, sensor, start, end, width):
+    """
+    Loads a sensor series from the database and downsamples it with LTTB.
+    Returns (timestamps, values, raw_point_count).
+    """
+    rows = get_sensor_series(plant, sensor, start, end)
+    if not rows:
+        return np.empty(0), np.empty(0), 0
+    series = np.array(rows, dtype=np.float64)
+    timestamps, values = lttb(series[:, 0], series[:, 1], width)
+    return timestamps, values, len(rows)
+
+
+@app.route("/history")
+def history():
+    """
+    Returns a downsampled sensor history as compact JSON arrays, cached
+    until new sensor data arrives.
+    """
+    try:
+        plant, sensor, start, end, width = parse_history_request()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    def build():
+        timestamps, values, raw_points = load_history(plant, sensor, start, end, width)
+        return {
+            "status": "success",
+            "plant": plant,
+            "sensor": sensor,
+            "start": start,
+            "end": end,
+            "raw_points": raw_points,
+            "t": timestamps.astype(np.int64).tolist(),
+            "v": np.round(values, 2).tolist(),
+        }
+
+    key = ("history", plant, sensor, start, end, width)
+    return response_cache.respond(key, get_sensor_data_version(), build)
+
+
+@app.route("/history/chart")
+def history_chart():
+    """
+    Returns a PNG chart of a sensor history, downsampled to the image width.
+    Rendered charts are cached until new sensor data arrives.
+    """
+    try:
+        plant, sensor, start, end, width = parse_history_request()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    height = max(100, min(request.args.get("height", type=int, default=400), 2000))
+
+    key = (plant, sensor, start, end, width, height, get_sensor_data_version())
+    etag = make_etag("chart", key)
+    headers = validator_headers(etag, cache_control="max-age=60")
+    if not_modified(etag):
+        return Response(status=304, headers=headers)
+    with chart_cache_lock:
+        png = chart_cache.get(key)
+        if png is not None:
+            chart_cache.move_to_end(key)
+    if png is None:
+        timestamps, values, raw_points = load_history(plant, sensor, start, end, width)
+        dpi = 100
+        figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        axes = figure.add_subplot(1, 1, 1)
+        axes.plot([datetime.fromtimestamp(t) for t in timestamps], values, linewidth=1)
+        axes.set_title(f"{plant} - {sensor} ({raw_points} readings)")
+        axes.grid(True)
+        figure.autofmt_xdate()
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format="png")
+        png = buffer.getvalue()
+        with chart_cache_lock:
+            chart_cache[key] = png
+            while len(chart_cache) > CHART_CACHE_SIZE:
+                chart_cache.popitem(last=False)
+    return Response(png, mimetype="image/png", headers=headers)
+
+
 @app.route("/reset", methods=["POST"])
 def reset():
     """
-    Resets the system's status and logs.
+    Resets the system's status and logs for every worker. The log file is
+    emptied in place, so every worker keeps appending to it; other workers
+    drop their cached readings when the reset event reaches them.
     """
     try:
-        system_status.update({
-            "light": "off",
-            "watering": "off",
-            "sensor_data": {},
-            "last_analysis": {},
-            "logs": [],
-        })
-        if os.path.exists(LOG_FILE):
-            os.remove(LOG_FILE)
+        system_logging.clear_channel("web")
+        state_store.clear_logs("web")
+        state_store.reset("reset")
+        sensor_snapshot.clear()
         log_action("System reset.")
         return jsonify({"status": "success", "message": "System reset successfully."})
     except Exception as e:
@@ -161,24 +477,75 @@ def reset():
 
 
 # Background thread for periodic updates
-def update_sensor_data():
+def update_sensor_data(rule_engine=None):
     """
-    Periodically updates sensor data in the background.
+    Periodically updates sensor data in the background and runs the
+    threshold rules over all readings stored since the last pass,
+    including those ingested from remote nodes.
     """
     while True:
         try:
-            sensor_data = get_sensor_data()
-            system_status["sensor_data"] = sensor_data
+            data = sensor_snapshot.refresh()["data"]
+            add_sensor_data(
+                data["soil_moisture"], data["light_level"], data["temperature"], data["humidity"]
+            )
+            shared_readings.publish(data)
             log_action("Updated sensor data.")
-            time.sleep(60)
         except Exception as e:
             log_action(f"Error updating sensor data: {e}")
+        if rule_engine is not None:
+            try:
+                rule_engine.tick()
+            except Exception as e:
+                log_action(f"Error evaluating rules: {e}")
+        time.sleep(SAMPLE_INTERVAL)
+
+
+def run_sampler():
+    """
+    Competes for the sampler lock and, once this process holds it, samples
+    the sensors and runs the rule engine. If the sampling process dies its
+    lock is released and another worker takes over, finishing the runs the
+    dead sampler left in flight.
+    """
+    while not sampler_lock.acquire():
+        time.sleep(SAMPLER_RETRY_INTERVAL)
+    log_action(f"Process {os.getpid()} is the sensor sampler.")
+    executor = shared_executor()
+    executor.recover()
+    update_sensor_data(RuleEngine(executor=executor))
+
+
+def on_state_event(event_id, event_type, data):
+    """
+    Applies a change-feed event to this worker and forwards it to the
+    worker's stream clients.
+    """
+    if event_type == "reset":
+        sensor_snapshot.clear()
+    broadcaster.publish(event_type, data, event_id)
+
+
+@app.before_request
+def start_background_tasks():
+    """
+    Starts this worker's change-feed watcher and sampler election on its
+    first request, so it also works under multi-process WSGI servers that
+    import the app without running __main__.
+    """
+    global background_started
+    if background_started:
+        return
+    with background_lock:
+        if background_started:
+            return
+        background_started = True
+        StateWatcher(state_store, on_state_event).start()
+        threading.Thread(target=run_sampler, daemon=True).start()
 
 
 if __name__ == "__main__":
-    # Start background thread
-    threading.Thread(target=update_sensor_data, daemon=True).start()
-    
     # Run the Flask app
     log_action("Starting web server.")
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    start_background_tasks()
+    app.run(host="0.0.0.0", port=5000, threaded=True)
\ No newline at end of file